@@ -1,5 +1,6 @@
 import os
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request, Response
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -20,10 +21,33 @@ from app.dependencies import get_session
 def create_app() -> FastAPI:
     app = FastAPI()
 
+    from app import metrics
     from app.routers import users
     from app.routers import auth
     app.include_router(users.router)
     app.include_router(auth.router)
+    metrics.configure_logging()
+
+    @app.middleware("http")
+    async def record_request_duration(request: Request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # label by route template (/api/users/tables/{type}), not the raw path
+            route = request.scope.get("route")
+            metrics.REQUEST_DURATION.labels(
+                request.method,
+                route.path if route else "unmatched",
+                status
+            ).observe(time.perf_counter() - start)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def get_metrics():
+        return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
     @app.get("/")
     async def root():
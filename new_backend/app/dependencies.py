@@ -3,13 +3,18 @@ import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
+from functools import cache
 import logging
 from typing import Annotated
 from fastapi import Header, Depends, HTTPException
-import boto3
+import app.storage
 import app.models.database_models as db_models
+import app.token_cache
+import app.normalization
 from datetime import datetime, timezone
 import redis
+import redis.asyncio
 
 UPLOAD_EXTENSIONS = ['.csv', '.xlsx']
 
@@ -27,29 +32,76 @@ engine = create_engine(
 
 Session = sessionmaker(engine)
 
+# Async database sessions for request handlers that must not block the event loop.
+# The driver is swapped for its asyncio counterpart unless ASYNC_DATABASE_URL is set,
+# and the engine is created on first use so processes that never run async code
+# don't need the async drivers installed.
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url: str) -> str:
+    url = sa.make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername)).render_as_string(hide_password=False)
+
+@cache
+def get_async_engine() -> AsyncEngine:
+    return create_async_engine(
+        os.getenv("ASYNC_DATABASE_URL") or async_database_url(os.getenv("DATABASE_URL")),
+        pool_pre_ping=True,
+        pool_recycle=3600,
+    )
+
+@cache
+def get_async_sessionmaker() -> async_sessionmaker:
+    return async_sessionmaker(get_async_engine(), expire_on_commit=False)
+
 # Logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 # Session store
-r = redis.Redis(host='localhost', port=6379, db=0)
+r = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
 
 def get_redis_connection():
     return r
 
+async_r = redis.asyncio.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+def get_async_redis_connection():
+    return async_r
+
+# Validated bearer tokens
+token_cache = app.token_cache.TokenCache(r if app.token_cache.TOKEN_CACHE_USE_REDIS else None)
+
+# Raw to normalized descriptions, shared by classification and training
+normalization_cache = app.normalization.NormalizationCache(r if app.normalization.NORMALIZATION_CACHE_USE_REDIS else None)
+
 def get_session():
     with Session() as session:
         yield session
 
+async def get_async_session():
+    async with get_async_sessionmaker()() as session:
+        yield session
+
 def current_user(authorization: Annotated[str | None, Header()] = None):
     if authorization: # format: Bearer <token>
         items = authorization.split()
         if len(items) != 2 or items[0].lower() != "bearer":
             raise HTTPException(status_code=401, detail="Malformed authorization header")
 
+        fields = token_cache.get(items[1])
+        if fields:
+            return {'user': db_models.User(**fields), 'access_token': items[1]}
+
         with Session() as session:
-            user = session.scalars(
-                sa.select(db_models.User)
+            row = session.execute(
+                sa.select(db_models.User, db_models.Account.access_expiration)
                 .join(db_models.Account)
                 .where(
                     sa.and_(
@@ -59,18 +111,22 @@ def current_user(authorization: Annotated[str | None, Header()] = None):
                 )
             ).first()
 
-        if not user:
+        if not row:
             # TODO: Add logic that deletes sessions of expired access tokens 
             raise HTTPException(status_code=401, detail="Incorrect authorization information")
+
+        user, access_expiration = row
+        token_cache.set(
+            items[1],
+            {"id": user.id, "name": user.name, "email": user.email, "image": user.image},
+            access_expiration
+        )
         return {'user': user, 'access_token': items[1]}
     else:
         raise HTTPException(status_code=401, detail="Invalid authorization header")
 
-# Google 'dependency injection fastapi boto3'
-def get_boto3_session():
-    return boto3.Session()
-
-def get_s3_client(session: Annotated[boto3.Session, Depends(get_boto3_session)]):
-    return session.client("s3")
+# One pooled S3 client per process, see app.storage
+def get_s3_client():
+    return app.storage.get_s3_client()
 
 
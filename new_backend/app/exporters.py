@@ -0,0 +1,118 @@
+import os
+import gzip
+import hashlib
+import polars as pl
+import xlsxwriter
+import zstandard
+from typing import BinaryIO, Callable
+from dataclasses import dataclass
+
+# Export formats for session tables. Every writer takes a writable (not
+# necessarily seekable) binary stream, such as app.storage.StreamingUpload, and
+# writes the table batch by batch where the format allows it.
+EXPORT_EXCLUDED_COLUMNS = {"row_id", "simplified_descriptions"}
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", 50000))
+EXPORT_ZSTD_LEVEL = int(os.getenv("EXPORT_ZSTD_LEVEL", 3))
+XLSX_MAX_ROWS = 1048576 # per worksheet, including the header row
+
+# Export files are content addressed: the object key is derived from the session
+# table's digest, the export type and the columns export_table actually wrote.
+# The export cache maps a table digest and export type to that object key, so
+# repeated downloads of an unchanged table reuse the uploaded file (once a HEAD
+# request confirms it's still in the bucket). Any edit changes the digest, which
+# retires the old entry. Bump EXPORT_CACHE_VERSION whenever a writer's output changes.
+EXPORT_CACHE_VERSION = 1
+EXPORT_CACHE_TTL_SECONDS = int(os.getenv("EXPORT_CACHE_TTL_SECONDS", 10800)) # 3 hours
+
+@dataclass(frozen=True)
+class ExportFormat:
+    extension: str
+    content_type: str
+    write: Callable[[pl.DataFrame, BinaryIO], None]
+
+def export_table(df: pl.DataFrame) -> pl.DataFrame:
+    """Selects the columns of a session table that are exported, in table order"""
+    return df.select([col for col in df.columns if col not in EXPORT_EXCLUDED_COLUMNS])
+
+def csv_chunks(df: pl.DataFrame, batch_rows: int = EXPORT_BATCH_ROWS):
+    """Yields the table as CSV, EXPORT_BATCH_ROWS rows at a time, so the file is never built whole"""
+    include_header = True
+    for batch in df.iter_slices(batch_rows):
+        yield batch.write_csv(include_header=include_header).encode("utf-8")
+        include_header = False
+
+    if include_header: # empty table, still send the header
+        yield df.write_csv().encode("utf-8")
+
+def write_csv(df: pl.DataFrame, fileobj: BinaryIO) -> None:
+    for chunk in csv_chunks(df):
+        fileobj.write(chunk)
+
+def write_csv_gzip(df: pl.DataFrame, fileobj: BinaryIO) -> None:
+    with gzip.GzipFile(fileobj=fileobj, mode="wb") as gz:
+        write_csv(df, gz)
+
+def write_csv_zstd(df: pl.DataFrame, fileobj: BinaryIO) -> None:
+    with zstandard.ZstdCompressor(level=EXPORT_ZSTD_LEVEL).stream_writer(fileobj, closefd=False) as zst:
+        write_csv(df, zst)
+
+def write_parquet(df: pl.DataFrame, fileobj: BinaryIO) -> None:
+    df.write_parquet(fileobj, compression="zstd")
+
+def write_arrow(df: pl.DataFrame, fileobj: BinaryIO) -> None:
+    df.write_ipc(fileobj, compression="zstd")
+
+def write_xlsx(df: pl.DataFrame, fileobj: BinaryIO) -> None:
+    """
+    Writes the table with xlsxwriter's constant_memory mode: rows are flushed to a
+    temporary file as they're written, instead of building the workbook in memory.
+    Tables longer than a worksheet continue on further worksheets.
+    """
+    workbook = xlsxwriter.Workbook(fileobj, {
+        "constant_memory": True,
+        "default_date_format": "yyyy-mm-dd",
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+        "strings_to_numbers": False,
+    })
+
+    worksheet, row_index = None, XLSX_MAX_ROWS
+    for batch in df.iter_slices(EXPORT_BATCH_ROWS):
+        for row in batch.iter_rows():
+            if row_index == XLSX_MAX_ROWS:
+                worksheet = workbook.add_worksheet()
+                worksheet.write_row(0, 0, df.columns)
+                row_index = 1
+            worksheet.write_row(row_index, 0, row)
+            row_index += 1
+
+    if worksheet is None: # empty table, still write the header
+        workbook.add_worksheet().write_row(0, 0, df.columns)
+
+    workbook.close()
+
+EXPORT_FORMATS = {
+    "csv": ExportFormat("csv", "text/csv", write_csv),
+    "csv.gz": ExportFormat("csv.gz", "application/gzip", write_csv_gzip),
+    "csv.zst": ExportFormat("csv.zst", "application/zstd", write_csv_zstd),
+    "parquet": ExportFormat("parquet", "application/vnd.apache.parquet", write_parquet),
+    "arrow": ExportFormat("arrow", "application/vnd.apache.arrow.file", write_arrow),
+    "xlsx": ExportFormat("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_xlsx),
+}
+
+def export_object_key(data_digest: str, export_type: str, columns: list[str]) -> str:
+    """Object key of the export file of a session table with the given digest, columns being export_table's"""
+    export_format = get_format(export_type)
+    columns = ",".join(columns)
+    digest = hashlib.sha256(f"{EXPORT_CACHE_VERSION}|{data_digest}|{export_type}|{columns}".encode("utf-8")).hexdigest()
+    return f"export-{digest[:32]}.{export_format.extension}"
+
+def export_cache_key(data_digest: str, export_type: str) -> str:
+    """Redis key holding the object key of the export file of a session table with the given digest"""
+    return f'export-cache:{EXPORT_CACHE_VERSION}:{data_digest}:{export_type}'
+
+def get_format(export_type: str) -> ExportFormat:
+    try:
+        return EXPORT_FORMATS[export_type]
+    except KeyError:
+        raise ValueError(f"Can't export {export_type} files.")
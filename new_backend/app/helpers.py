@@ -1,65 +1,31 @@
 import os
+import io
 import uuid
-import boto3
 import fasttext
-import socketio
 import numpy as np
 import polars as pl
-import networkx as nx
 from fastapi import UploadFile
-from datasketch import MinHash, MinHashLSH
-from app.dependencies import UPLOAD_EXTENSIONS
+from fastapi.concurrency import run_in_threadpool
+import app.metrics
+import app.minhash
+import app.notifier
+import app.storage
+from app.dependencies import UPLOAD_EXTENSIONS, normalization_cache
 from botocore.exceptions import ClientError
 import tempfile
+import sqlalchemy as sa
 import sqlalchemy.orm as so
+import app.models.database_models as db_models
 from mypy_boto3_s3.client import S3Client
 
-PAYMENT_TERMS = [
-    r"\b(?:re|e)?pay(?:ment|mt|mnt)?s?\b",
-    r"\b(?:post)?paid\b",
-    r"\b(?:pmt|pymnt|pmnt)s?\b",
-    r"(?:merchant\s+)?(?:web)?payment\b",
-    r"(?:mobile)?\bpurchase(?:s)?\b(?:\s+(?:authorized|at|-visa))?",
-]
-
-TRANSACTION_CHANNELS = [
-    r"\b(?:debit|direct|initiated|pending)\b",
-    r"\b(?:ach(?:billpay)?|ccd|ppd|atm|visa|zelle|paypal|venmo|cash\s+app)\b",
-]
-
-GENERIC_TERMS = [
-    r"\b(?:web|electronic|checkcard|deduction(?:s)?|transaction(?:s)?)\b",
-    r"\b(?:recur(?:ring)?|service(?:s)?|corporate|online|authorized)\b",
-    r"\b(?:card|ref|sq(?:u)?)\b",
-]
-
-STOPWORDS = [
-    r"\b(?:from|www|amp|the|and|of|by|to|on|at|in)\b",
-]
-
-# US state codes
-STATE_CODES = r"\b(?:al|ak|az|ar|ca|co|ct|de|fl|ga|hi|id|il|in|ia|ks|ky|la|me|md|ma|mn|ms|mo|mt|ne|nv|nh|nj|nm|ny|nc|nd|oh|ok|or|pa|ri|sc|sd|tn|tx|ut|vt|va|wa|wv|wi|wy)\b"
-
-# Combine all patterns
-NOISE_PATTERN = "|".join([
-    r"https?://\S+|www\.\S+",  # URLs
-    *PAYMENT_TERMS,
-    *TRANSACTION_CHANNELS,
-    *GENERIC_TERMS,
-    *STOPWORDS,
-    STATE_CODES,
-    r"\.com\b.*",  # .com and everything after
-    r"\d{3,}",  # Long numbers (keep short ones like "7-11")
-    r"[x]{2,}\d*",  # xxx123 patterns
-])
+# rows per INSERT/COPY batch in bulk_insert
+BULK_INSERT_CHUNK_SIZE = int(os.getenv("BULK_INSERT_CHUNK_SIZE", 10000))
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def upload_file_to_s3(file: UploadFile):
-    s3_client = boto3.Session().client("s3")
-
     # check file extension
     file_ext = os.path.splitext(file.filename)[1]
     if file_ext not in UPLOAD_EXTENSIONS:
@@ -68,90 +34,55 @@ def upload_file_to_s3(file: UploadFile):
     # upload file to s3
     object_key = f"{uuid.uuid4()}_{file.filename}"
     try:
-        s3_client.upload_fileobj(file.file, os.getenv("BUCKET_NAME"), object_key)
+        app.storage.upload_fileobj(file.file, object_key)
     except ClientError as e:
         raise
     else:
         return object_key
 
-def get_minhash(text):
-    m = MinHash(num_perm=128)
-    
-    words = text.split() #[:3]
-    for shingle in set(words):
-        m.update(shingle.encode('utf8'))
-        
-    return m
+async def upload_file_to_s3_async(file: UploadFile):
+    """upload_file_to_s3 for async handlers, the blocking boto3 upload runs in the threadpool"""
+    return await run_in_threadpool(upload_file_to_s3, file)
 
 def group(descriptions: pl.Series, table_height: int):
     """Groups similar transactions using MinHash LSH algorithm """
-    lsh = MinHashLSH(threshold=0.6, num_perm=128)
-    minhashes = {}
+    signatures = app.minhash.signatures(descriptions)
+    src, dst = app.minhash.candidate_edges(app.minhash.band_labels(signatures, threshold=0.6))
 
-    for idx, text in enumerate(descriptions.to_list()):
-        m = get_minhash(str(text))
-        lsh.insert(str(idx), m)
-        minhashes[str(idx)] = m
-        
-    # get graph edges
-    all_edges = []
-    for key in minhashes.keys():
-        edges = [(key, x) for x in lsh.query(minhashes[key])]
-        all_edges.extend(edges)
-
-    # create graph and find connected components from edges
-    G = nx.Graph()
-    G.add_edges_from(all_edges)
-    connected_components = list(nx.connected_components(G))
-    
-    # add table column for accessing connection group of each unresolved vendor
-    # Build a mapping of row_index -> group_id
-    mapping = {
-        int(item): group_id
-        for group_id, group in enumerate(connected_components)
-        for item in group
-    }
-
-    # Convert to Polars Series
-    group_series = pl.Series("group", [mapping.get(i, -1) for i in range(table_height)])
+    # label connected components of the candidate graph directly by row index
+    labels = app.minhash.component_labels(src, dst, table_height)
 
-    return group_series
+    return pl.Series("group", labels)
 
-def classify(
-    descriptions: pl.Series, 
-    model: fasttext.FastText
-):
-    """Predicts the vendors and chart of accounts of given transaction(s)"""
+def simplify_descriptions(descriptions: pl.Series) -> pl.Series:
+    """Strips noise (payment terms, channels, state codes, long numbers, ...) from descriptions, see app.normalization"""
+    return normalization_cache.simplify(descriptions)
 
-    # Clean transactions 
-    simplified_descriptions  = (
-        descriptions
-        .fill_null("")
-        .str.to_lowercase()
-        .str.strip_chars()
-        .str.replace_all(r"\.", ' ')
-        .str.replace_all(NOISE_PATTERN, ' ')
-        # .str.replace_all(r'[^\w\s]', ' ')
-        .str.replace_all(r'\s+', ' ')
+def format_labels(labels: pl.Series) -> pl.Series:
+    """Turns training labels (see clean_data) into the account names predictions are shown with"""
+    return (
+        labels
+        .str.replace_all(r'__label__', '')
+        .str.replace_all(r'_', ' ')
+        .str.to_titlecase()
         .str.strip_chars()
     )
 
+def predict_accounts(
+    descriptions: pl.Series,
+    model: fasttext.FastText
+) -> tuple[pl.Series, pl.Series]:
+    """Predicts the account and confidence group of each (simplified) description"""
+
     # classify transactions
-    results, confidences = model.predict(simplified_descriptions.to_list(), k=1)
+    results, confidences = model.predict(descriptions.to_list(), k=1)
     
     # remove fasttext formatting from vendor classifications
     labels = [
         lbl[0].replace('__label__', '') for lbl in results
     ]
 
-    accounts = pl.Series("account", labels)
-    accounts = (
-        accounts
-        .str.replace_all(r'__label__', '')
-        .str.replace_all(r'_', ' ')
-        .str.to_titlecase()
-        .str.strip_chars()
-    )
+    accounts = format_labels(pl.Series("account", labels))
 
     # define thresholds using numpy's select method
     probs = np.array([prob[0] for prob in confidences])
@@ -163,22 +94,91 @@ def classify(
     choices = ["Low", "Medium", "High"]
     confidenceGroups = np.select(conditions, choices, "None")
 
-    # prepare new columns
-    prediction_confidence = pl.Series("prediction_confidence", confidenceGroups)
-    #simplified_descriptions = pl.Series("simplified_descriptions", descriptions)
-    groups = group(simplified_descriptions, simplified_descriptions.len())
+    return accounts, pl.Series("prediction_confidence", confidenceGroups)
+
+def lookup_accounts(
+    descriptions: pl.Series,
+    model: fasttext.FastText,
+    label_index: pl.DataFrame | None = None
+) -> tuple[pl.Series, pl.Series]:
+    """
+    predict_accounts for distinct simplified descriptions, except that descriptions
+    found in the template's label index (see app.label_index) get their confirmed
+    account with "High" confidence, and only the rest go through the model.
+    """
+    if label_index is None or label_index.is_empty():
+        return predict_accounts(descriptions, model)
+
+    known = (
+        descriptions.to_frame("simplified_descriptions")
+        .join(label_index, on="simplified_descriptions", how="left", maintain_order="left")
+        ["account"]
+    )
+    unseen = known.is_null().arg_true()
+    app.metrics.LABEL_INDEX_LOOKUPS.labels("hit").inc(descriptions.len() - unseen.len())
+    app.metrics.LABEL_INDEX_LOOKUPS.labels("miss").inc(unseen.len())
+
+    confidence = pl.Series("prediction_confidence", ["High"] * descriptions.len(), dtype=pl.String)
+    if unseen.is_empty():
+        return known, confidence
+
+    accounts, prediction_confidence = predict_accounts(descriptions.gather(unseen), model)
+    return known.scatter(unseen, accounts), confidence.scatter(unseen, prediction_confidence)
+
+def classify(
+    descriptions: pl.Series, 
+    model: fasttext.FastText,
+    label_index: pl.DataFrame | None = None
+):
+    """Predicts the vendors and chart of accounts of given transaction(s)"""
+
+    # Clean transactions 
+    with app.metrics.stage("normalize"):
+        simplified_descriptions = simplify_descriptions(descriptions)
+
+    # bank exports repeat the same merchant many times, so classify and group each
+    # distinct description once and broadcast the results back to the rows
+    unique_descriptions = simplified_descriptions.unique().sort()
+    row_to_unique = simplified_descriptions.rank("dense") - 1
+
+    with app.metrics.stage("predict"):
+        accounts, prediction_confidence = lookup_accounts(unique_descriptions, model, label_index)
+    with app.metrics.stage("group"):
+        groups = group(unique_descriptions, unique_descriptions.len())
    
-    return accounts, prediction_confidence, simplified_descriptions.alias("simplified_descriptions"), groups
+    return (
+        accounts.gather(row_to_unique),
+        prediction_confidence.gather(row_to_unique),
+        simplified_descriptions.alias("simplified_descriptions"),
+        groups.gather(row_to_unique)
+    )
+
+ITEMIZED_COLUMNS = ["row_id", "date", "number", "payee", "description", "amount", "account", "group"]
+
+def page_table(
+    df: pl.DataFrame,
+    offset: int,
+    limit: int,
+    sort_by: str | None = None,
+    descending: bool = False,
+    search: str | None = None
+) -> tuple[pl.DataFrame, int]:
+    """Filters, sorts and slices a table view, returning the page and the filtered row count"""
+    if search:
+        df = df.filter(
+            pl.col("description").str.to_lowercase().str.contains(search.lower(), literal=True)
+        )
+
+    if sort_by:
+        if sort_by not in df.columns:
+            raise ValueError(f"Can't sort by {sort_by}")
+        df = df.sort(sort_by, descending=descending, nulls_last=True, maintain_order=True)
+
+    return df.slice(offset, limit), df.height
 
 def emit_job_status(user_id: int, job_type: str, status: str):
-    with socketio.SimpleClient() as sio:
-        sio.connect('http://localhost:3000')
-        sio.emit(job_type, {
-            'recipient': str(user_id),
-            'job_type': job_type,
-            'status': status
-        })
-    print("emitted")
+    """Queues a job status notification for the user, sent in the background by app.notifier"""
+    app.notifier.notify(user_id, job_type, status)
 
 def clean_data(data: pl.DataFrame) -> pl.DataFrame:
     """
@@ -187,15 +187,7 @@ def clean_data(data: pl.DataFrame) -> pl.DataFrame:
     """
     cleaned = data.with_columns([
         # Description cleaning
-        pl.col("description")
-        .fill_null("")
-        .str.to_lowercase()
-        .str.strip_chars()
-        .str.replace_all(r"\.", ' ')
-        .str.replace_all(NOISE_PATTERN, ' ')
-        # .str.replace_all(r'[^\w\s]', ' ')
-        .str.replace_all(r'\s+', ' ')
-        .str.strip_chars(),
+        simplify_descriptions(data["description"]),
         
         # Account cleaning
         pl.col("account")
@@ -212,6 +204,51 @@ def clean_data(data: pl.DataFrame) -> pl.DataFrame:
         (pl.col("account") != "Unknown")
     )
 
+def train_classifier(cleaned_data: pl.DataFrame, lr: float, epoch: int, thread: int) -> fasttext.FastText:
+    """Trains a fastText classifier on the description/account pairs of clean_data's output"""
+    lines = [
+        f"__label__{t['account']} {t['description']}"
+        for t in cleaned_data.iter_rows(named=True)
+    ]
+
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".txt") as train_fp:
+        train_fp.write("\n".join(lines))
+        train_fp.flush()
+        return fasttext.train_supervised(input=train_fp.name, lr=lr, epoch=epoch, thread=thread)
+
+def copy_statement(dialect: sa.Dialect, table: sa.Table, columns: list[str]) -> str:
+    """COPY ... FROM STDIN statement for the given columns of a table, identifiers quoted by the dialect"""
+    preparer = dialect.identifier_preparer
+    column_list = ", ".join(preparer.format_column(table.c[col]) for col in columns)
+    return f"COPY {preparer.format_table(table)} ({column_list}) FROM STDIN WITH (FORMAT csv)"
+
+def bulk_insert(
+    session: so.Session,
+    table: sa.Table,
+    data: pl.DataFrame,
+    chunk_size: int = BULK_INSERT_CHUNK_SIZE
+) -> None:
+    """
+    Inserts the rows of a DataFrame (columns named after the table's columns) in
+    batches, without building ORM objects. PostgreSQL gets the batches through
+    COPY, other databases through executemany.
+    """
+    connection = session.connection()
+
+    if connection.dialect.name == "postgresql":
+        statement = copy_statement(connection.dialect, table, data.columns)
+        cursor = connection.connection.cursor()
+        for chunk in data.iter_slices(chunk_size):
+            buffer = io.BytesIO()
+            chunk.write_csv(buffer, include_header=False)
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+        return
+
+    statement = sa.insert(table)
+    for chunk in data.iter_slices(chunk_size):
+        connection.execute(statement, chunk.to_dicts())
+
 def create_coa(session: so.Session, user_id: int, coa_group_name: str, coa_entries: pl.Series) -> int:
     """ Creates COA group and its corresponding access and COA table entries """
 
@@ -231,12 +268,11 @@ def create_coa(session: so.Session, user_id: int, coa_group_name: str, coa_entri
     )
 
     # populate COA table with group's items
-    coa_items = [
-        db_models.COA(group_id=coa_group_id, account=account) 
-        for account in coa_entries.unique().str.replace_all(r'[^\w\s]', '').str.replace_all(r'\s+', ' ').str.to_titlecase().to_list()
-    ]
+    coa_items = pl.DataFrame({
+        "account": coa_entries.unique().str.replace_all(r'[^\w\s]', '').str.replace_all(r'\s+', ' ').str.to_titlecase()
+    }).with_columns(pl.lit(coa_group_id).alias("group_id"))
 
-    session.add_all(coa_items)
+    bulk_insert(session, db_models.COA.__table__, coa_items)
 
     return coa_group_id
 
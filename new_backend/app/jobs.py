@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import uuid
+import signal
+import socket
+import logging
+import importlib
+import multiprocessing
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+import app.metrics
+
+# CPU heavy work (classification, exports, template training) runs in separate
+# worker processes fed from Redis lists, one list per job type. The API only
+# enqueues jobs, so request handling never competes with jobs for the GIL.
+# Delivery is at least once: a worker moves each job it takes onto its own
+# processing list (LMOVE) and removes it only after the job has run, and on
+# startup puts whatever is left there (jobs of a worker that died) back on the
+# front of their queues. WORKER_ID must therefore be stable across restarts and
+# unique per worker; it defaults to the host name.
+@dataclass(frozen=True)
+class JobType:
+    task: str         # dotted path of the task function
+    priority: int     # lower values are picked up first
+    concurrency: int  # max jobs of this type running at once
+
+JOB_TYPES = {
+    "classify": JobType("app.tasks.process_transactions_task", 0, int(os.getenv("JOB_CONCURRENCY_CLASSIFY", 4))),
+    "export": JobType("app.tasks.create_export_file", 1, int(os.getenv("JOB_CONCURRENCY_EXPORT", 2))),
+    "coa": JobType("app.tasks.create_coa", 2, int(os.getenv("JOB_CONCURRENCY_COA", 2))),
+    "train": JobType("app.tasks.create_template", 3, int(os.getenv("JOB_CONCURRENCY_TRAIN", 1))),
+}
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 2))
+WORKER_ID = os.getenv("WORKER_ID", socket.gethostname())
+JOB_RECORD_TTL_SECONDS = 86400 # 1 day
+POLL_TIMEOUT_SECONDS = 1
+
+logger = logging.getLogger(__name__)
+
+def queue_key(job_type: str) -> str:
+    return f'jobs:queue:{job_type}'
+
+def processing_key(worker_id: str) -> str:
+    return f'jobs:processing:{worker_id}'
+
+def job_key(job_id: str) -> str:
+    return f'job:{job_id}'
+
+def _queue_job(pipe, job_type: str, user_id: int, args: tuple) -> str:
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    job_id = uuid.uuid4().hex
+    pipe.hset(job_key(job_id), mapping={
+        "type": job_type,
+        "user_id": user_id,
+        "args": json.dumps(args),
+        "status": "queued",
+        "enqueued_at": time.time()
+    })
+    pipe.expire(job_key(job_id), JOB_RECORD_TTL_SECONDS)
+    pipe.rpush(queue_key(job_type), job_id)
+
+    return job_id
+
+def enqueue(redis_client: Redis, job_type: str, user_id: int, *args) -> str:
+    """Queues a job of the given type and returns its id. Arguments must be JSON serializable."""
+    pipe = redis_client.pipeline()
+    job_id = _queue_job(pipe, job_type, user_id, args)
+    pipe.execute()
+
+    return job_id
+
+async def enqueue_async(redis_client: AsyncRedis, job_type: str, user_id: int, *args) -> str:
+    """enqueue for request handlers using the asyncio Redis client"""
+    pipe = redis_client.pipeline()
+    job_id = _queue_job(pipe, job_type, user_id, args)
+    await pipe.execute()
+
+    return job_id
+
+def get_job(redis_client: Redis, job_id: str) -> dict | None:
+    """Returns the job's status record (without its arguments)"""
+    record = redis_client.hgetall(job_key(job_id))
+    if not record:
+        return None
+
+    job = {key.decode("utf-8"): value.decode("utf-8") for key, value in record.items()}
+    job.pop("args", None)
+    job["id"] = job_id
+    job["user_id"] = int(job["user_id"])
+    return job
+
+def run_job(job_id: str, redis_client: Redis | None = None) -> None:
+    """Executes a queued job, recording its status. Runs inside a worker process."""
+    if redis_client is None:
+        from app.dependencies import get_redis_connection
+        redis_client = get_redis_connection()
+
+    # worker processes are spawned, so they don't inherit the supervisor's logging setup
+    app.metrics.configure_logging()
+
+    job_type, args, enqueued_at = redis_client.hmget(job_key(job_id), ["type", "args", "enqueued_at"])
+    if job_type is None:
+        logger.info(f"Job {job_id} expired before it ran")
+        return
+
+    job_type = job_type.decode("utf-8")
+    module_name, func_name = JOB_TYPES[job_type].task.rsplit(".", 1)
+    task = getattr(importlib.import_module(module_name), func_name)
+
+    started_at = time.time()
+    if enqueued_at is not None:
+        app.metrics.JOB_QUEUE_WAIT.labels(job_type).observe(max(started_at - float(enqueued_at), 0))
+    redis_client.hset(job_key(job_id), mapping={"status": "running", "started_at": started_at})
+    with app.metrics.job_context(job_id, job_type):
+        try:
+            task(*json.loads(args))
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            status = "failed"
+            redis_client.hset(job_key(job_id), mapping={"status": status, "error": str(e), "finished_at": time.time()})
+        else:
+            status = "finished"
+            redis_client.hset(job_key(job_id), mapping={"status": status, "finished_at": time.time()})
+
+    app.metrics.JOB_DURATION.labels(job_type, status).observe(time.time() - started_at)
+
+class Worker:
+    """
+    Pulls jobs off the Redis queues and runs them in a pool of worker processes,
+    highest priority first, without exceeding each job type's concurrency limit.
+    With processes=0 jobs run inline, which is handy against a fake Redis.
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis,
+        processes: int = WORKER_PROCESSES,
+        job_types: dict[str, JobType] = JOB_TYPES,
+        worker_id: str = WORKER_ID
+    ):
+        self.redis_client = redis_client
+        self.processes = processes
+        self.job_types = dict(sorted(job_types.items(), key=lambda item: item[1].priority))
+        self.running = {job_type: 0 for job_type in self.job_types}
+        self.processing_key = processing_key(worker_id)
+        self._futures: dict[Future, tuple[str, str]] = {}
+        self._stopping = False
+
+    def stop(self, *_) -> None:
+        self._stopping = True
+
+    def available_queues(self) -> list[str]:
+        """Queue keys of the job types that have a free slot, highest priority first"""
+        return [
+            queue_key(job_type)
+            for job_type, spec in self.job_types.items()
+            if self.running[job_type] < spec.concurrency
+        ]
+
+    def requeue_unfinished(self) -> int:
+        """
+        Puts the jobs left on this worker's processing list (taken by a previous run
+        of the worker that died before finishing them) back on the front of their
+        queues. Returns how many were requeued.
+        """
+        requeued = 0
+        while (job_id := self.redis_client.lindex(self.processing_key, 0)) is not None:
+            job_type = self.redis_client.hget(job_key(job_id.decode("utf-8")), "type")
+            if job_type is None or job_type.decode("utf-8") not in self.job_types:
+                self.redis_client.lpop(self.processing_key) # expired, or not run by this worker
+                continue
+            self.redis_client.lmove(self.processing_key, queue_key(job_type.decode("utf-8")), "LEFT", "LEFT")
+            requeued += 1
+
+        if requeued:
+            logger.warning(f"Requeued {requeued} unfinished jobs")
+        return requeued
+
+    def next_job(self) -> tuple[str, str] | None:
+        """
+        Moves the next job of the highest priority type that has a free slot onto
+        this worker's processing list, returning its type and id
+        """
+        keys = self.available_queues()
+        if not keys:
+            return None
+
+        # BLMOVE watches a single list, so sweep the queues in priority order and
+        # only block (on the highest priority one) when they're all empty
+        for block in (False, True):
+            for key in keys[:1] if block else keys:
+                if block:
+                    job_id = self.redis_client.blmove(key, self.processing_key, POLL_TIMEOUT_SECONDS, "LEFT", "RIGHT")
+                else:
+                    job_id = self.redis_client.lmove(key, self.processing_key, "LEFT", "RIGHT")
+                if job_id is not None:
+                    return key.rsplit(":", 1)[1], job_id.decode("utf-8")
+
+        return None
+
+    def finish(self, job_id: str) -> None:
+        """Drops a job that has run (whatever its outcome) from the processing list"""
+        self.redis_client.lrem(self.processing_key, 1, job_id)
+
+    def run(self, max_jobs: int | None = None) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.requeue_unfinished()
+
+        if self.processes == 0:
+            self._run_inline(max_jobs)
+            return
+
+        # spawn keeps workers from inheriting the supervisor's connection pools
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=context) as pool:
+            started = 0
+            while not self._stopping and (max_jobs is None or started < max_jobs):
+                # all processes busy, or every job type with queued work is at its limit
+                if len(self._futures) >= self.processes or not self.available_queues():
+                    self._reap(wait(self._futures, timeout=POLL_TIMEOUT_SECONDS, return_when=FIRST_COMPLETED).done)
+                    continue
+
+                job = self.next_job()
+                self._reap([future for future in self._futures if future.done()])
+                if job is None:
+                    continue
+
+                job_type, job_id = job
+                self.running[job_type] += 1
+                self._futures[pool.submit(run_job, job_id)] = job
+                started += 1
+
+            self._reap(wait(self._futures).done)
+
+    def _run_inline(self, max_jobs: int | None) -> None:
+        started = 0
+        while not self._stopping and (max_jobs is None or started < max_jobs):
+            job = self.next_job()
+            if job is None:
+                if max_jobs is not None:
+                    return
+                continue
+
+            run_job(job[1], self.redis_client)
+            self.finish(job[1])
+            started += 1
+
+    def _reap(self, futures) -> None:
+        for future in futures:
+            job_type, job_id = self._futures.pop(future)
+            self.running[job_type] -= 1
+            if future.exception():
+                # run_job records task errors itself, this is the process dying
+                logger.error(f"Worker process failed: {future.exception()}")
+                self.redis_client.hset(job_key(job_id), mapping={"status": "failed", "error": str(future.exception()), "finished_at": time.time()})
+            self.finish(job_id)
@@ -0,0 +1,109 @@
+import os
+import polars as pl
+import sqlalchemy as sa
+import app.helpers
+import app.normalization
+import app.session_store
+import app.models.database_models as db_models
+from app.dependencies import Session
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+# Per template index from normalized (simplified) description to confirmed
+# account, so descriptions the template already knows skip fastText. It is
+# built from the template's Transaction rows, keeping the descriptions whose
+# labels agree, and stored in Redis as an Arrow IPC frame next to the session
+# tables. Accounts users set in the itemized and summary editors are kept in a
+# separate hash per template and take precedence over the built index. Keys
+# include the normalization rules version, since the index is keyed by
+# normalized descriptions.
+LABEL_INDEX_TTL_SECONDS = int(os.getenv("LABEL_INDEX_TTL_SECONDS", 86400)) # 1 day, rebuilt from the database
+LABEL_INDEX_EDITS_TTL_SECONDS = int(os.getenv("LABEL_INDEX_EDITS_TTL_SECONDS", 30 * 86400))
+# share of a description's transactions that must carry the same account for it to be indexed
+LABEL_INDEX_MIN_AGREEMENT = float(os.getenv("LABEL_INDEX_MIN_AGREEMENT", 0.9))
+# template access levels whose table edits are recorded, since they relabel every user's uploads
+LABEL_INDEX_EDITOR_ACCESS_LEVELS = {"administrator"}
+
+INDEX_SCHEMA = {"simplified_descriptions": pl.String, "account": pl.String}
+
+def index_key(template_id: int) -> str:
+    return f'label-index:{template_id}:{app.normalization.RULES_VERSION}'
+
+def edits_key(template_id: int) -> str:
+    return f'label-index-edits:{template_id}:{app.normalization.RULES_VERSION}'
+
+def build_index(cleaned_data: pl.DataFrame) -> pl.DataFrame:
+    """
+    Indexes training data (the output of helpers.clean_data) by description. A
+    description is kept when at least LABEL_INDEX_MIN_AGREEMENT of its rows share
+    one account, which is stored the way the model would predict it.
+    """
+    index = (
+        cleaned_data
+        .group_by("description", "account")
+        .agg(pl.len().alias("count"))
+        .filter(pl.col("count") >= LABEL_INDEX_MIN_AGREEMENT * pl.col("count").sum().over("description"))
+        .sort("description", "count", descending=[False, True])
+        .unique("description", keep="first", maintain_order=True)
+    )
+    return pl.DataFrame(
+        {
+            "simplified_descriptions": index["description"],
+            "account": app.helpers.format_labels(index["account"]),
+        },
+        schema=INDEX_SCHEMA
+    )
+
+def store_index(redis_client: Redis, template_id: int, index: pl.DataFrame) -> None:
+    redis_client.set(index_key(template_id), app.session_store.encode_table(index), ex=LABEL_INDEX_TTL_SECONDS)
+
+def _query_index(template_id: int) -> pl.DataFrame:
+    with Session() as session:
+        rows = session.execute(
+            sa.select(db_models.Transaction.description, db_models.Transaction.account)
+            .where(db_models.Transaction.template_id == template_id)
+        ).all()
+
+    data = pl.DataFrame(rows, schema={"description": pl.String, "account": pl.String}, orient="row")
+    return build_index(app.helpers.clean_data(data))
+
+def get_index(redis_client: Redis, template_id: int) -> pl.DataFrame:
+    """Returns the template's label index with accepted edits applied, building it on a miss"""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(index_key(template_id))
+    pipe.hgetall(edits_key(template_id))
+    data, edits = pipe.execute()
+
+    if data is None:
+        index = _query_index(template_id)
+        store_index(redis_client, template_id, index)
+    else:
+        index = app.session_store.decode_table(data)
+
+    if not edits:
+        return index
+
+    edited = pl.DataFrame(
+        {
+            "simplified_descriptions": [description.decode("utf-8") for description in edits],
+            "account": [account.decode("utf-8") for account in edits.values()],
+        },
+        schema=INDEX_SCHEMA
+    )
+    return pl.concat([
+        index.filter(~pl.col("simplified_descriptions").is_in(edited["simplified_descriptions"])),
+        edited
+    ])
+
+async def record_edits_async(redis_client: AsyncRedis, template_id: int, descriptions: pl.Series, account: str) -> None:
+    """Adds descriptions a user assigned an account to in the table editors to the template's index"""
+    descriptions = descriptions.drop_nulls().unique()
+    descriptions = descriptions.filter(descriptions != "")
+    if descriptions.is_empty():
+        return
+
+    key = edits_key(template_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hset(key, mapping={description: account for description in descriptions.to_list()})
+    pipe.expire(key, LABEL_INDEX_EDITS_TTL_SECONDS)
+    await pipe.execute()
@@ -0,0 +1,122 @@
+import os
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+from prometheus_client import (
+    REGISTRY,
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Prometheus metrics for endpoints, background jobs and the stages inside them,
+# served by GET /metrics. Jobs run in separate worker processes, so set
+# PROMETHEUS_MULTIPROC_DIR to a directory shared by the API and the workers
+# (emptied before they start) for /metrics to include the workers' samples.
+# Only counters and histograms are used, which need no cleanup when a process exits.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+LOG_FORMAT = "%(asctime)s %(levelname)s [job %(job_id)s %(job_type)s] %(name)s: %(message)s"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+JOB_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request, by route template",
+    ["method", "route", "status"],
+    buckets=REQUEST_BUCKETS
+)
+JOB_DURATION = Histogram(
+    "job_duration_seconds",
+    "Time a background job ran, by job type and outcome",
+    ["job_type", "status"],
+    buckets=JOB_BUCKETS
+)
+JOB_QUEUE_WAIT = Histogram(
+    "job_queue_wait_seconds",
+    "Time a background job waited in its queue",
+    ["job_type"],
+    buckets=JOB_BUCKETS
+)
+STAGE_DURATION = Histogram(
+    "job_stage_duration_seconds",
+    "Time spent in each stage of a background job",
+    ["job_type", "stage"],
+    buckets=JOB_BUCKETS
+)
+S3_TRANSFER_BYTES = Counter("s3_transfer_bytes", "Bytes moved to or from S3", ["operation"])
+S3_TRANSFER_SECONDS = Counter("s3_transfer_seconds", "Time spent moving data to or from S3", ["operation"])
+NORMALIZATION_CACHE_LOOKUPS = Counter(
+    "normalization_cache_lookups",
+    "Distinct descriptions looked up in the normalization cache, by result",
+    ["result"]
+)
+LABEL_INDEX_LOOKUPS = Counter(
+    "label_index_lookups",
+    "Distinct descriptions looked up in a template's label index, by result (misses go to the model)",
+    ["result"]
+)
+
+logger = logging.getLogger(__name__)
+
+# the job being run by the current thread (or asyncio task), for stage labels and log lines
+_job_id = contextvars.ContextVar("job_id", default="-")
+_job_type = contextvars.ContextVar("job_type", default="-")
+
+@contextmanager
+def job_context(job_id: str, job_type: str):
+    """Attributes the stages and log lines inside the with block to the given job"""
+    id_token = _job_id.set(job_id)
+    type_token = _job_type.set(job_type)
+    try:
+        yield
+    finally:
+        _job_id.reset(id_token)
+        _job_type.reset(type_token)
+
+@contextmanager
+def stage(name: str):
+    """Times the with block as a stage of the current job, whether or not it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_DURATION.labels(_job_type.get(), name).observe(seconds)
+        logger.info(f"Stage {name} took {seconds:.3f}s")
+
+def observe_transfer(operation: str, transferred: int, seconds: float) -> None:
+    S3_TRANSFER_BYTES.labels(operation).inc(transferred)
+    S3_TRANSFER_SECONDS.labels(operation).inc(seconds)
+
+class JobContextFilter(logging.Filter):
+    """Adds the current job's id and type to log records"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.job_id = _job_id.get()
+        record.job_type = _job_type.get()
+        return True
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Logs with LOG_FORMAT, so every line carries the job it belongs to. Safe to call repeatedly."""
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(level=level, format=LOG_FORMAT)
+
+    for handler in root.handlers:
+        if not any(isinstance(f, JobContextFilter) for f in handler.filters):
+            handler.addFilter(JobContextFilter())
+
+def render() -> bytes:
+    """The metrics in Prometheus' text format, collected from every process in multiprocess mode"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
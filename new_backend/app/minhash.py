@@ -0,0 +1,162 @@
+import hashlib
+import numpy as np
+import polars as pl
+from functools import cache
+from scipy.integrate import quad as integrate
+from scipy.sparse import coo_array
+from scipy.sparse.csgraph import connected_components
+
+# Batched MinHash/LSH over a whole Polars Series.
+# Signatures are bit-for-bit the ones datasketch.MinHash(num_perm=128) produces
+# for the set of whitespace separated words of each description (sha1_hash32 +
+# seeded universal hashing), and bands use the same (b, r) parameters as
+# datasketch.MinHashLSH, so candidate pairs match the per-row implementation.
+NUM_PERM = 128
+SEED = 1
+THRESHOLD = 0.6
+
+# rows hashed per block when reducing token hashes to signatures, bounds the
+# (tokens, num_perm) intermediate matrix
+SIGNATURE_BLOCK_ROWS = 16384
+
+_mersenne_prime = np.uint64((1 << 61) - 1)
+_max_hash = np.uint64((1 << 32) - 1)
+
+@cache
+def permutations(num_perm: int = NUM_PERM, seed: int = SEED) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the (a, b) universal hashing parameters used by datasketch.MinHash"""
+    gen = np.random.RandomState(seed)
+    a, b = np.array(
+        [
+            (
+                gen.randint(1, _mersenne_prime, dtype=np.uint64),
+                gen.randint(0, _mersenne_prime, dtype=np.uint64),
+            )
+            for _ in range(num_perm)
+        ],
+        dtype=np.uint64,
+    ).T
+    return a, b
+
+@cache
+def optimal_param(threshold: float = THRESHOLD, num_perm: int = NUM_PERM) -> tuple[int, int]:
+    """Returns the (bands, rows per band) datasketch.MinHashLSH picks for a threshold"""
+    min_error = float("inf")
+    opt = (0, 0)
+    for b in range(1, num_perm + 1):
+        for r in range(1, num_perm // b + 1):
+            fp, _ = integrate(lambda s: 1 - (1 - s ** float(r)) ** float(b), 0.0, threshold)
+            fn, _ = integrate(lambda s: 1 - (1 - (1 - s ** float(r)) ** float(b)), threshold, 1.0)
+            error = 0.5 * fp + 0.5 * fn
+            if error < min_error:
+                min_error = error
+                opt = (b, r)
+    return opt
+
+def hash_tokens(tokens: pl.Series) -> np.ndarray:
+    """32-bit sha1 hash of each token (datasketch's sha1_hash32)"""
+    return np.fromiter(
+        (
+            int.from_bytes(hashlib.sha1(token.encode("utf8")).digest()[:4], "little")
+            for token in tokens.to_list()
+        ),
+        dtype=np.uint64,
+        count=tokens.len(),
+    )
+
+def signatures(descriptions: pl.Series, num_perm: int = NUM_PERM) -> np.ndarray:
+    """Computes the (n, num_perm) uint64 MinHash signature matrix of a Series of descriptions"""
+    height = descriptions.len()
+    sigs = np.full((height, num_perm), _max_hash, dtype=np.uint64)
+    if height == 0:
+        return sigs
+
+    # one row per (description, distinct word) pair; descriptions without words keep
+    # the empty signature, same as a MinHash that was never updated
+    tokens = (
+        pl.DataFrame({
+            "row": np.arange(height, dtype=np.int64),
+            "token": descriptions.cast(pl.String).fill_null("None").str.extract_all(r"\S+").list.unique(),
+        })
+        .explode("token")
+        .drop_nulls("token")
+    )
+    if tokens.is_empty():
+        return sigs
+
+    # hash and permute each distinct word once
+    vocab = tokens.select(pl.col("token").unique()).with_row_index("token_id")
+    a, b = permutations(num_perm)
+    vocab_hashes = hash_tokens(vocab["token"])
+    permuted = np.bitwise_and((a * vocab_hashes[:, None] + b) % _mersenne_prime, _max_hash)
+
+    tokens = tokens.join(vocab, on="token", how="left", maintain_order="left")
+    rows = tokens["row"].to_numpy()
+    token_ids = tokens["token_id"].to_numpy()
+
+    # min-reduce permuted hashes per description, a block of rows at a time
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    for block_start in range(0, len(starts), SIGNATURE_BLOCK_ROWS):
+        block = starts[block_start:block_start + SIGNATURE_BLOCK_ROWS]
+        lo = block[0]
+        hi = starts[block_start + SIGNATURE_BLOCK_ROWS] if block_start + SIGNATURE_BLOCK_ROWS < len(starts) else len(rows)
+        sigs[rows[block]] = np.minimum.reduceat(permuted[token_ids[lo:hi]], block - lo, axis=0)
+
+    return sigs
+
+def band_labels(sigs: np.ndarray, threshold: float = THRESHOLD) -> np.ndarray:
+    """Returns an (n, bands) matrix whose entries are the bucket of each row in each LSH band"""
+    num_bands, band_rows = optimal_param(threshold, sigs.shape[1])
+    labels = np.empty((sigs.shape[0], num_bands), dtype=np.int64)
+    for band in range(num_bands):
+        band_sigs = np.ascontiguousarray(sigs[:, band * band_rows:(band + 1) * band_rows])
+        _, labels[:, band] = np.unique(band_sigs, axis=0, return_inverse=True)
+    return labels
+
+def band_keys(sigs: np.ndarray, threshold: float = THRESHOLD) -> np.ndarray:
+    """
+    Returns an (n, bands) uint64 matrix with a 64-bit hash of each row's values in
+    each LSH band. Unlike band_labels, keys from separately hashed batches can be
+    compared, so only these (not the full signatures) need to be kept around.
+    """
+    num_bands, band_rows = optimal_param(threshold, sigs.shape[1])
+    keys = np.empty((sigs.shape[0], num_bands), dtype=np.uint64)
+    for band in range(num_bands):
+        # FNV-1a over the band's 32-bit hash values
+        key = np.full(sigs.shape[0], 0xcbf29ce484222325, dtype=np.uint64)
+        for col in range(band * band_rows, (band + 1) * band_rows):
+            key = (key ^ sigs[:, col]) * np.uint64(0x100000001b3)
+        keys[:, band] = key
+    return keys
+
+def candidate_edges(labels: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns (src, dst) row index arrays linking every row to the first row of each
+    LSH bucket it falls in, given per band bucket labels (or keys). Rows are
+    connected by these edges exactly when they are connected by
+    datasketch.MinHashLSH query results.
+    """
+    rows = np.arange(labels.shape[0], dtype=np.int64)
+
+    src, dst = [], []
+    for band in range(labels.shape[1]):
+        _, first_rows, inverse = np.unique(labels[:, band], return_index=True, return_inverse=True)
+        representative = first_rows[inverse]
+        linked = representative != rows
+        src.append(rows[linked])
+        dst.append(representative[linked])
+
+    return np.concatenate(src), np.concatenate(dst)
+
+def component_labels(src: np.ndarray, dst: np.ndarray, height: int) -> np.ndarray:
+    """Labels the connected components of the graph on rows 0..height-1 given by (src, dst) edges"""
+    if height == 0:
+        return np.empty(0, dtype=np.int64)
+
+    graph = coo_array(
+        (np.ones(len(src), dtype=np.int8), (src, dst)),
+        shape=(height, height),
+    ).tocsr()
+    _, labels = connected_components(graph, directed=False)
+
+    return labels.astype(np.int64)
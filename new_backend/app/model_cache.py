@@ -0,0 +1,158 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import fasttext
+import app.storage
+from collections import OrderedDict
+from dataclasses import dataclass
+from botocore.exceptions import ClientError
+
+# Process-wide cache for fastText models, keyed by Template.model_name.
+# Tier 1 keeps loaded models in memory (LRU, bounded by model file size).
+# Tier 2 keeps downloaded model files on local disk, addressed by the S3 ETag,
+# so a restarted or evicted model only has to be re-loaded, not re-downloaded.
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+MODEL_CACHE_DISK_MAX_BYTES = int(os.getenv("MODEL_CACHE_DISK_MAX_BYTES", 10 * 1024 ** 3))
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "model_cache"))
+MODEL_CACHE_REVALIDATE_SECONDS = float(os.getenv("MODEL_CACHE_REVALIDATE_SECONDS", 60))
+# misses are serialized per model by a fixed pool of locks, so it doesn't grow with every model seen
+MODEL_CACHE_LOCK_STRIPES = int(os.getenv("MODEL_CACHE_LOCK_STRIPES", 64))
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CachedModel:
+    model: fasttext.FastText
+    etag: str
+    size: int
+    validated_at: float
+
+class ModelCache:
+    """In-memory LRU of loaded fastText models backed by an on-disk store"""
+
+    def __init__(
+        self,
+        max_bytes: int = MODEL_CACHE_MAX_BYTES,
+        cache_dir: str = MODEL_CACHE_DIR,
+        disk_max_bytes: int = MODEL_CACHE_DISK_MAX_BYTES,
+        revalidate_seconds: float = MODEL_CACHE_REVALIDATE_SECONDS,
+        lock_stripes: int = MODEL_CACHE_LOCK_STRIPES
+    ):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self._entries: OrderedDict[str, CachedModel] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._model_locks = [threading.Lock() for _ in range(max(lock_stripes, 1))]
+
+    def get(self, s3_client, model_name: str):
+        """Returns the loaded model for model_name, downloading it only if needed"""
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry and time.monotonic() - entry.validated_at < self.revalidate_seconds:
+                self._entries.move_to_end(model_name)
+                return entry.model
+
+        # serialize misses per model so concurrent jobs don't download the same file twice
+        with self._model_lock(model_name):
+            response = s3_client.head_object(Bucket=os.getenv("BUCKET_NAME"), Key=model_name)
+            etag = response["ETag"].strip('"')
+
+            with self._lock:
+                entry = self._entries.get(model_name)
+                if entry and entry.etag == etag:
+                    entry.validated_at = time.monotonic()
+                    self._entries.move_to_end(model_name)
+                    return entry.model
+
+            model_path = self._disk_path(model_name, etag)
+            if os.path.exists(model_path):
+                os.utime(model_path) # mark as recently used for disk eviction
+            else:
+                self._download(s3_client, model_name, model_path)
+
+            model = fasttext.load_model(model_path)
+            self._insert(model_name, CachedModel(model, etag, os.path.getsize(model_path), time.monotonic()))
+            self._prune_disk()
+
+            return model
+
+    def invalidate(self, model_name: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(model_name, None)
+            if entry:
+                self._total_bytes -= entry.size
+
+    def _model_lock(self, model_name: str) -> threading.Lock:
+        # models sharing a stripe also share misses, which only costs some waiting
+        return self._model_locks[hash(model_name) % len(self._model_locks)]
+
+    def _disk_path(self, model_name: str, etag: str) -> str:
+        file_ext = os.path.splitext(model_name)[1] or ".bin"
+        digest = hashlib.sha256(etag.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}{file_ext}")
+
+    def _download(self, s3_client, model_name: str, model_path: str) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # download next to the final path and rename, so readers never see partial files
+        with tempfile.NamedTemporaryFile(mode="wb", dir=self.cache_dir, suffix=".part", delete=False) as model_fp:
+            try:
+                app.storage.download_fileobj(model_name, model_fp, s3_client)
+            except ClientError:
+                model_fp.close()
+                os.remove(model_fp.name)
+                raise
+
+        os.replace(model_fp.name, model_path)
+
+    def _insert(self, model_name: str, entry: CachedModel) -> None:
+        with self._lock:
+            previous = self._entries.pop(model_name, None)
+            if previous:
+                self._total_bytes -= previous.size
+
+            if entry.size > self.max_bytes:
+                logger.info(f"Model {model_name} ({entry.size} bytes) exceeds model cache budget, not caching")
+                return
+
+            self._entries[model_name] = entry
+            self._total_bytes += entry.size
+
+            # evict least recently used models until we're back under budget
+            while self._total_bytes > self.max_bytes:
+                evicted_name, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.size
+                logger.info(f"Evicted model {evicted_name} from model cache")
+
+    def _prune_disk(self) -> None:
+        try:
+            files = [
+                entry for entry in os.scandir(self.cache_dir)
+                if entry.is_file() and not entry.name.endswith(".part")
+            ]
+        except FileNotFoundError:
+            return
+
+        # oldest files first; the model that was just loaded is always the newest
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        disk_bytes = sum(entry.stat().st_size for entry in files)
+        for entry in files[:-1]:
+            if disk_bytes <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                logger.info(f"Couldn't remove cached model file {entry.path}: {e}")
+            else:
+                disk_bytes -= entry.stat().st_size
+
+model_cache = ModelCache()
+
+def get_model(s3_client, model_name: str):
+    return model_cache.get(s3_client, model_name)
@@ -36,6 +36,5 @@ class SummaryRow(BaseModel):
     group: int
 
 class ItemizedRow(BaseModel):
-    description: str
-    account: str
-    date: int
\ No newline at end of file
+    row_id: int
+    account: str
\ No newline at end of file
@@ -125,6 +125,10 @@ class Template(Base):
         DateTime(timezone=True),
         nullable=True
     )
+    # top-1 accuracy of the full model on its training data, and what quantizing it
+    # (see app.quantization) changed that by; both null for models that aren't quantized
+    model_accuracy: so.Mapped[float | None] = so.mapped_column(sa.Float, nullable=True)
+    quantized_accuracy_delta: so.Mapped[float | None] = so.mapped_column(sa.Float, nullable=True)
 
     # users: so.Mapped[List["UserTemplateAccess"]] = so.relationship(back_populates="template")
 
@@ -0,0 +1,312 @@
+import os
+import hashlib
+import logging
+import threading
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import app.metrics
+from redis import Redis
+
+# Description normalization (lowercasing and stripping the noise below) with a
+# cache from raw to simplified description, shared by classification and
+# training. Bank exports repeat the same merchant strings across uploads, users
+# and templates, so most descriptions are looked up instead of run through the
+# NOISE_PATTERN regex. Tier 1 is an in-process LRU; tier 2 (optional) is a Redis
+# hash shared by every API and worker process. Both are keyed by RULES_VERSION, a
+# hash of the normalization steps, so changing a rule starts a fresh cache.
+PAYMENT_TERMS = [
+    r"\b(?:re|e)?pay(?:ment|mt|mnt)?s?\b",
+    r"\b(?:post)?paid\b",
+    r"\b(?:pmt|pymnt|pmnt)s?\b",
+    r"(?:merchant\s+)?(?:web)?payment\b",
+    r"(?:mobile)?\bpurchase(?:s)?\b(?:\s+(?:authorized|at|-visa))?",
+]
+
+TRANSACTION_CHANNELS = [
+    r"\b(?:debit|direct|initiated|pending)\b",
+    r"\b(?:ach(?:billpay)?|ccd|ppd|atm|visa|zelle|paypal|venmo|cash\s+app)\b",
+]
+
+GENERIC_TERMS = [
+    r"\b(?:web|electronic|checkcard|deduction(?:s)?|transaction(?:s)?)\b",
+    r"\b(?:recur(?:ring)?|service(?:s)?|corporate|online|authorized)\b",
+    r"\b(?:card|ref|sq(?:u)?)\b",
+]
+
+STOPWORDS = [
+    r"\b(?:from|www|amp|the|and|of|by|to|on|at|in)\b",
+]
+
+# US state codes
+STATE_CODES = r"\b(?:al|ak|az|ar|ca|co|ct|de|fl|ga|hi|id|il|in|ia|ks|ky|la|me|md|ma|mn|ms|mo|mt|ne|nv|nh|nj|nm|ny|nc|nd|oh|ok|or|pa|ri|sc|sd|tn|tx|ut|vt|va|wa|wv|wi|wy)\b"
+
+# Combine all patterns
+NOISE_PATTERN = "|".join([
+    r"https?://\S+|www\.\S+",  # URLs
+    *PAYMENT_TERMS,
+    *TRANSACTION_CHANNELS,
+    *GENERIC_TERMS,
+    *STOPWORDS,
+    STATE_CODES,
+    r"\.com\b.*",  # .com and everything after
+    r"\d{3,}",  # Long numbers (keep short ones like "7-11")
+    r"[x]{2,}\d*",  # xxx123 patterns
+])
+
+# The noise rules as a token engine. Descriptions are lowercased, dots become
+# spaces, and each description is split into space separated tokens once. Whole
+# tokens that NOISE_PATTERN's \b...\b rules match are dropped with a set lookup
+# (NOISE_WORDS), and the structural rules that match inside a token (long digit
+# runs, xxx123, a ...payment tail) run as one regex over the distinct tokens
+# that contain a digit, "xx", "payment" or punctuation, split into word runs so
+# the word boundaries stay where NOISE_PATTERN has them. The rules that span
+# tokens (URLs, "merchant payment", "purchase at ...", "cash app") are left to
+# the NOISE_PATTERN regex, for just the rows that contain one. The \.com and
+# www\. rules never match once dots are spaces, in either path.
+NOISE_WORDS = frozenset([
+    *(prefix + "pay" + suffix + plural for prefix in ("", "re", "e") for suffix in ("", "ment", "mt", "mnt") for plural in ("", "s")),
+    "paid", "postpaid",
+    *(term + plural for term in ("pmt", "pymnt", "pmnt") for plural in ("", "s")),
+    "purchase", "purchases",
+    "debit", "direct", "initiated", "pending",
+    "ach", "achbillpay", "ccd", "ppd", "atm", "visa", "zelle", "paypal", "venmo",
+    "web", "electronic", "checkcard", "deduction", "deductions", "transaction", "transactions",
+    "recur", "recurring", "service", "services", "corporate", "online", "authorized",
+    "card", "ref", "sq", "squ",
+    "from", "www", "amp", "the", "and", "of", "by", "to", "on", "at", "in",
+    *STATE_CODES.removeprefix(r"\b(?:").removesuffix(r")\b").split("|"),
+])
+CROSS_TOKEN_PATTERN = r"https?://|merchant\s+(?:web)?payment\b|\bpurchases?\b\s+(?:authorized|at|-visa)|\bcash\s+app\b"
+# tokens the structural rules (or punctuation) may change
+STRUCTURAL_TOKEN_PATTERN = r"\d|xx|payment|\W"
+TOKEN_PATTERN = r"\d{3,}|x{2,}\d*|(?:web)?payment$"
+
+# bump when normalize changes its output without the rules above changing
+NORMALIZATION_STEPS_VERSION = 1
+RULES_VERSION = hashlib.sha256(repr((
+    NORMALIZATION_STEPS_VERSION, NOISE_PATTERN, sorted(NOISE_WORDS), CROSS_TOKEN_PATTERN, TOKEN_PATTERN
+)).encode("utf-8")).hexdigest()[:16]
+
+NORMALIZATION_CACHE_MAX_ENTRIES = int(os.getenv("NORMALIZATION_CACHE_MAX_ENTRIES", 500000))
+NORMALIZATION_CACHE_TTL_SECONDS = int(os.getenv("NORMALIZATION_CACHE_TTL_SECONDS", 604800)) # 1 week
+NORMALIZATION_CACHE_USE_REDIS = os.getenv("NORMALIZATION_CACHE_USE_REDIS", "false").lower() in ("1", "true", "yes")
+NORMALIZATION_CACHE_BATCH = 10000 # fields per HMGET/HSET
+
+logger = logging.getLogger(__name__)
+
+MAPPING_SCHEMA = {"raw": pl.String, "simplified": pl.String}
+# an over budget cache is compacted down to this share of max_entries, so
+# eviction doesn't run again on the very next miss
+NORMALIZATION_CACHE_EVICT_TO = 0.75
+
+def _noise_words() -> pl.Series:
+    return pl.Series(sorted(NOISE_WORDS), dtype=pl.String).implode()
+
+def _simplify_tokens(tokens: pl.Series) -> pl.Series:
+    """Applies the noise rules to tokens (free of spaces), each split into word and non-word runs"""
+    runs = tokens.str.extract_all(r"\w+|\W+")
+    return (
+        runs.list.eval(
+            pl.when(pl.element().is_in(_noise_words()))
+            .then(pl.lit(" "))
+            .when(pl.element().str.contains(r"^\w"))
+            .then(pl.element().str.replace_all(TOKEN_PATTERN, " "))
+            .otherwise(pl.element())
+        )
+        .list.join("")
+        .str.replace_all(r"\s+", " ")
+        .str.strip_chars()
+    )
+
+def _normalize_regex(text: pl.Series) -> pl.Series:
+    """NOISE_PATTERN applied to lowercased, dot free text with a regex scan"""
+    return text.str.replace_all(NOISE_PATTERN, " ").str.replace_all(r"\s+", " ").str.strip_chars()
+
+def normalize(descriptions: pl.Series) -> pl.Series:
+    """Strips noise (payment terms, channels, state codes, long numbers, ...) from descriptions, without the cache"""
+    text = descriptions.cast(pl.String).fill_null("").str.to_lowercase().str.replace_all(".", " ", literal=True)
+    tokens = text.str.split(" ")
+    flat = tokens.explode()
+
+    noise = flat.is_in(_noise_words())
+    structural = (flat.str.contains(STRUCTURAL_TOKEN_PATTERN) & ~noise).arg_true()
+    if not structural.is_empty():
+        changed = flat.gather(structural)
+        distinct = changed.unique()
+        flat = flat.scatter(structural, changed.replace_strict(distinct, _simplify_tokens(distinct)))
+
+    # dropped tokens (and the empty ones between repeated spaces) become nulls join skips
+    flat = pl.select(pl.when(pl.lit(noise) | (pl.lit(flat) == "")).then(None).otherwise(pl.lit(flat))).to_series()
+    # back into lists with the tokens' own offsets, so each row joins its own tokens
+    offsets = np.zeros(tokens.len() + 1, dtype=np.int64)
+    np.cumsum(tokens.list.len().to_numpy(), out=offsets[1:])
+    simplified = pl.from_arrow(pa.LargeListArray.from_arrays(pa.array(offsets), flat.to_arrow())).list.join(" ", ignore_nulls=True)
+
+    cross_token = text.str.contains(CROSS_TOKEN_PATTERN).arg_true()
+    if not cross_token.is_empty():
+        simplified = simplified.scatter(cross_token, _normalize_regex(text.gather(cross_token)))
+    return simplified.alias(descriptions.name)
+
+def cache_key(rules_version: str = RULES_VERSION) -> str:
+    return f'normalization:{rules_version}'
+
+class _Run:
+    """Tier 1 entries sorted by raw description, with the call that last used each one"""
+
+    def __init__(self, table: pl.DataFrame, used: np.ndarray):
+        self.raw = table["raw"]
+        self.simplified = table["simplified"]
+        self.used = used
+
+    def __len__(self) -> int:
+        return self.raw.len()
+
+    def to_frame(self) -> pl.DataFrame:
+        return pl.DataFrame({"raw": self.raw, "simplified": self.simplified, "used": self.used})
+
+    @classmethod
+    def from_frame(cls, table: pl.DataFrame) -> "_Run":
+        table = table.sort("raw")
+        return cls(table.select(list(MAPPING_SCHEMA)), table["used"].to_numpy().copy())
+
+class NormalizationCache:
+    """Maps raw descriptions to their normalized form, normalizing only the ones never seen before"""
+
+    def __init__(
+        self,
+        redis_client: Redis | None = None,
+        max_entries: int = NORMALIZATION_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = NORMALIZATION_CACHE_TTL_SECONDS,
+        rules_version: str = RULES_VERSION
+    ):
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.key = cache_key(rules_version)
+        # Tier 1 is a few runs of entries sorted by raw description, so a lookup is a
+        # binary search per run, O(batch log cache), and marking entries used is an in
+        # place write. New entries form a run of their own, merged with runs of similar
+        # size, which keeps the number of runs logarithmic. Least recently used entries
+        # are evicted only once the runs exceed max_entries.
+        self._runs: list[_Run] = []
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def simplify(self, descriptions: pl.Series) -> pl.Series:
+        """Normalizes descriptions, row for row (nulls become empty strings)"""
+        descriptions = descriptions.cast(pl.String).fill_null("")
+        # sorted, so the binary searches walk each run in order
+        raw = descriptions.unique().sort()
+        with self._lock:
+            self._calls += 1
+            call = self._calls
+            simplified = self._lookup(raw, call)
+
+        mapping = pl.DataFrame({"raw": raw, "simplified": simplified}, schema=MAPPING_SCHEMA)
+        missing = mapping.filter(pl.col("simplified").is_null())["raw"]
+        mapping = mapping.filter(pl.col("simplified").is_not_null())
+
+        if not missing.is_empty() and self.redis_client is not None:
+            found = self._get_redis(missing.to_list())
+            if found:
+                mapping = pl.concat([mapping, pl.DataFrame({"raw": list(found), "simplified": list(found.values())}, schema=MAPPING_SCHEMA)])
+                missing = missing.filter(~missing.is_in(pl.Series(list(found), dtype=pl.String).implode()))
+
+        app.metrics.NORMALIZATION_CACHE_LOOKUPS.labels("hit").inc(mapping.height)
+        app.metrics.NORMALIZATION_CACHE_LOOKUPS.labels("miss").inc(missing.len())
+
+        if not missing.is_empty():
+            computed = pl.DataFrame({"raw": missing, "simplified": normalize(missing)}, schema=MAPPING_SCHEMA)
+            mapping = pl.concat([mapping, computed])
+            if self.redis_client is not None:
+                self._set_redis(dict(zip(computed["raw"].to_list(), computed["simplified"].to_list())))
+
+        # entries tier 1 didn't have, whether they came from Redis or were computed
+        added = mapping.filter(~pl.col("raw").is_in(raw.filter(simplified.is_not_null()).implode()))
+        if not added.is_empty():
+            with self._lock:
+                self._add(added, call)
+
+        return (
+            descriptions.to_frame("raw")
+            .join(mapping, on="raw", how="left", maintain_order="left")["simplified"]
+            .alias(descriptions.name)
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._runs = []
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self._runs)
+
+    def _lookup(self, raw: pl.Series, call: int) -> pl.Series:
+        """Tier 1 values of raw (null on a miss), marking the entries found as used by this call"""
+        simplified = pl.Series("simplified", [None] * raw.len(), dtype=pl.String)
+        pending = np.arange(raw.len())
+        for run in self._runs:
+            if pending.size == 0:
+                break
+
+            keys = raw.gather(pending)
+            positions = run.raw.search_sorted(keys).to_numpy().clip(0, len(run) - 1)
+            hits = (run.raw.gather(positions) == keys).to_numpy()
+            run.used[positions[hits]] = call
+            simplified = simplified.scatter(pending[hits], run.simplified.gather(positions[hits]))
+            pending = pending[~hits]
+
+        return simplified
+
+    def _add(self, mapping: pl.DataFrame, call: int) -> None:
+        self._runs.append(_Run.from_frame(mapping.with_columns(used=pl.lit(call, dtype=pl.UInt64))))
+
+        # merge the newest run into the previous one while they're of similar size,
+        # so every entry takes part in O(log cache) merges
+        while len(self._runs) > 1 and 2 * len(self._runs[-1]) >= len(self._runs[-2]):
+            newest, previous = self._runs.pop(), self._runs.pop()
+            self._runs.append(_Run(*self._merge([previous, newest])))
+
+        if len(self) > self.max_entries:
+            # concurrent misses can add the same description twice, keep its latest use
+            table = (
+                pl.concat([run.to_frame() for run in self._runs])
+                .sort("used", descending=True)
+                .unique("raw", keep="first", maintain_order=True)
+                .head(int(self.max_entries * NORMALIZATION_CACHE_EVICT_TO))
+            )
+            self._runs = [_Run.from_frame(table)] if not table.is_empty() else []
+
+    @staticmethod
+    def _merge(runs: list[_Run]) -> tuple[pl.DataFrame, np.ndarray]:
+        table = runs[0].to_frame().merge_sorted(runs[1].to_frame(), key="raw")
+        return table.select(list(MAPPING_SCHEMA)), table["used"].to_numpy().copy()
+
+    def _get_redis(self, raw: list[str]) -> dict[str, str]:
+        found = {}
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for start in range(0, len(raw), NORMALIZATION_CACHE_BATCH):
+                pipe.hmget(self.key, raw[start:start + NORMALIZATION_CACHE_BATCH])
+            # the hash lives while it's in use; old rule versions expire on their own
+            pipe.expire(self.key, self.ttl_seconds)
+            values = [value for batch in pipe.execute()[:-1] for value in batch]
+        except Exception as e:
+            logger.warning(f"Normalization cache unavailable: {e}")
+            return found
+
+        for description, value in zip(raw, values):
+            if value is not None:
+                found[description] = value.decode("utf-8")
+        return found
+
+    def _set_redis(self, entries: dict[str, str]) -> None:
+        items = list(entries.items())
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for start in range(0, len(items), NORMALIZATION_CACHE_BATCH):
+                pipe.hset(self.key, mapping=dict(items[start:start + NORMALIZATION_CACHE_BATCH]))
+            pipe.expire(self.key, self.ttl_seconds)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Normalization cache unavailable: {e}")
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import redis
+import socketio
+
+# Job status notifications for the frontend relay. Each process keeps one
+# long-lived connection, owned by a background thread, so emitting never waits
+# on a handshake or a slow relay. Statuses queued while a send is in flight are
+# coalesced: the relay only ever shows a user's latest status per job type, so
+# only that one is sent.
+#
+# NOTIFIER_TRANSPORT selects how messages leave the process:
+#   socketio - emit to the Socket.IO relay at NOTIFIER_URL (default)
+#   redis    - publish {"event", "payload"} JSON to NOTIFIER_CHANNEL, for a relay
+#              subscribed to it, with no per process Socket.IO connection
+NOTIFIER_TRANSPORT = os.getenv("NOTIFIER_TRANSPORT", "socketio")
+NOTIFIER_URL = os.getenv("NOTIFIER_URL", "http://localhost:3000")
+NOTIFIER_CHANNEL = os.getenv("NOTIFIER_CHANNEL", "job-status")
+NOTIFIER_QUEUE_SIZE = int(os.getenv("NOTIFIER_QUEUE_SIZE", 1000))
+NOTIFIER_RETRY_SECONDS = float(os.getenv("NOTIFIER_RETRY_SECONDS", 1))
+NOTIFIER_MAX_RETRY_SECONDS = float(os.getenv("NOTIFIER_MAX_RETRY_SECONDS", 30))
+NOTIFIER_FLUSH_SECONDS = float(os.getenv("NOTIFIER_FLUSH_SECONDS", 5))
+
+logger = logging.getLogger(__name__)
+
+class SocketIOTransport:
+    def __init__(self, url: str = NOTIFIER_URL):
+        self.url = url
+        self.client = socketio.Client(reconnection=False)
+
+    def send(self, event: str, payload: dict) -> None:
+        if not self.client.connected:
+            self.client.connect(self.url, wait_timeout=5)
+        self.client.emit(event, payload)
+
+    def close(self) -> None:
+        if self.client.connected:
+            self.client.disconnect()
+
+class RedisTransport:
+    def __init__(self, url: str | None = None, channel: str = NOTIFIER_CHANNEL):
+        self.client = redis.Redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        self.channel = channel
+
+    def send(self, event: str, payload: dict) -> None:
+        self.client.publish(self.channel, json.dumps({"event": event, "payload": payload}))
+
+    def close(self) -> None:
+        self.client.close()
+
+TRANSPORTS = {
+    "socketio": SocketIOTransport,
+    "redis": RedisTransport,
+}
+
+class Notifier:
+    """Queues status messages and sends them from a background thread over one persistent transport"""
+
+    def __init__(self, transport_factory=None, queue_size: int = NOTIFIER_QUEUE_SIZE):
+        self.transport_factory = transport_factory or TRANSPORTS[NOTIFIER_TRANSPORT]
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue: queue.Queue
+        self._thread: threading.Thread
+
+    def notify(self, user_id: int, job_type: str, status: str) -> None:
+        """Queues a status message, never blocking the caller"""
+        self._ensure_started()
+        item = (job_type, {
+            'recipient': str(user_id),
+            'job_type': job_type,
+            'status': status
+        })
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                # the relay is falling behind, the oldest status is the least useful one
+                try:
+                    dropped = self._queue.get_nowait()
+                    self._queue.task_done()
+                    logger.warning(f"Notifier queue full, dropped {dropped[0]} status for user {dropped[1]['recipient']}")
+                except queue.Empty:
+                    pass
+
+    def flush(self, timeout: float = NOTIFIER_FLUSH_SECONDS) -> bool:
+        """Waits until every queued message was sent or superseded. Returns False on timeout."""
+        if self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            # every queued message is marked done once it was sent or superseded
+            if self._queue.unfinished_tasks == 0:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _ensure_started(self) -> None:
+        # the thread and its connection belong to one process, a forked child starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self) -> None:
+        transport = None
+        pending: dict[tuple[str, str], tuple[str, dict]] = {}
+        retry_seconds = NOTIFIER_RETRY_SECONDS
+
+        while True:
+            if not pending:
+                self._coalesce(pending, self._queue.get())
+
+            # take everything queued meanwhile, keeping the latest status per recipient and job type
+            while True:
+                try:
+                    self._coalesce(pending, self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                if transport is None:
+                    transport = self.transport_factory()
+                while pending:
+                    key = next(iter(pending))
+                    event, payload = pending[key]
+                    transport.send(event, payload)
+                    del pending[key]
+                    self._queue.task_done()
+                retry_seconds = NOTIFIER_RETRY_SECONDS
+            except Exception as e:
+                logger.warning(f"Notifier send failed, retrying in {retry_seconds}s: {e}")
+                if transport is not None:
+                    try:
+                        transport.close()
+                    except Exception:
+                        pass
+                transport = None
+                time.sleep(retry_seconds)
+                retry_seconds = min(retry_seconds * 2, NOTIFIER_MAX_RETRY_SECONDS)
+
+    def _coalesce(self, pending: dict, item: tuple[str, dict]) -> None:
+        event, payload = item
+        key = (payload['recipient'], event)
+        # re-insert so messages keep their arrival order
+        if pending.pop(key, None) is not None:
+            self._queue.task_done()
+        pending[key] = item
+
+notifier = Notifier()
+
+# give queued statuses a chance to go out when a worker process exits
+atexit.register(notifier.flush)
+
+def notify(user_id: int, job_type: str, status: str) -> None:
+    notifier.notify(user_id, job_type, status)
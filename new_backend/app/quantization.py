@@ -0,0 +1,133 @@
+import os
+import logging
+import argparse
+import tempfile
+import fasttext
+import polars as pl
+import sqlalchemy as sa
+import app.helpers
+import app.storage
+import app.models.database_models as db_models
+from datetime import datetime, timezone
+from app.dependencies import Session
+
+# Compact (.ftz) fastText models. Quantizing a model compresses its input matrix
+# with product quantization, and keeps only the FASTTEXT_QUANTIZE_CUTOFF most
+# important words and n-grams when that's set, so S3 downloads, the model cache
+# and load times shrink with it. The accuracy lost is measured on the model's
+# training data and stored on its template. Existing templates are converted with
+#
+#   python -m app.quantization [--template-id ID ...] [--keep-originals]
+#
+FASTTEXT_QUANTIZE = os.getenv("FASTTEXT_QUANTIZE", "true").lower() in ("1", "true", "yes")
+FASTTEXT_QUANTIZE_CUTOFF = int(os.getenv("FASTTEXT_QUANTIZE_CUTOFF", 100000)) # 0 keeps every row
+FASTTEXT_QUANTIZE_DSUB = int(os.getenv("FASTTEXT_QUANTIZE_DSUB", 2))
+# accuracy is measured on a sample of the training data this large
+QUANTIZE_EVAL_ROWS = int(os.getenv("QUANTIZE_EVAL_ROWS", 50000))
+# fastText's product quantizer needs at least this many input matrix rows (256 centroids)
+QUANTIZE_MIN_ROWS = 256
+
+QUANTIZED_MODEL_EXT = ".ftz"
+
+logger = logging.getLogger(__name__)
+
+def quantized_model_name(model_name: str) -> str:
+    return f"{os.path.splitext(model_name)[0]}{QUANTIZED_MODEL_EXT}"
+
+def accuracy(model: fasttext.FastText, cleaned_data: pl.DataFrame) -> float:
+    """Share of clean_data's rows (or a sample of them) the model predicts the account of"""
+    if cleaned_data.height > QUANTIZE_EVAL_ROWS:
+        cleaned_data = cleaned_data.sample(QUANTIZE_EVAL_ROWS, seed=0)
+    if cleaned_data.is_empty():
+        return 0.0
+
+    labels, _ = model.predict(cleaned_data["description"].to_list(), k=1)
+    predicted = pl.Series([label[0] if label else "" for label in labels], dtype=pl.String)
+    return (predicted == ("__label__" + cleaned_data["account"])).mean()
+
+def quantize(model: fasttext.FastText, cleaned_data: pl.DataFrame) -> tuple[float, float] | None:
+    """
+    Quantizes a model in place, returning its accuracy before and the change in
+    accuracy after (see accuracy). Returns None, leaving the model as it was, when
+    it's too small to quantize.
+    """
+    rows = model.get_input_matrix().shape[0]
+    if rows < QUANTIZE_MIN_ROWS:
+        logger.info(f"Model has {rows} input rows, too few to quantize")
+        return None
+
+    full_accuracy = accuracy(model, cleaned_data)
+    model.quantize(cutoff=FASTTEXT_QUANTIZE_CUTOFF, dsub=FASTTEXT_QUANTIZE_DSUB, qnorm=True, retrain=False)
+    return full_accuracy, accuracy(model, cleaned_data) - full_accuracy
+
+def _training_data(session, template_id: int) -> pl.DataFrame:
+    rows = session.execute(
+        sa.select(db_models.Transaction.description, db_models.Transaction.account)
+        .where(db_models.Transaction.template_id == template_id)
+    ).all()
+    data = pl.DataFrame(rows, schema={"description": pl.String, "account": pl.String}, orient="row")
+    return app.helpers.clean_data(data)
+
+def migrate_template(session, s3_client, template: db_models.Template, keep_originals: bool = False) -> bool:
+    """
+    Replaces a template's .bin model with a quantized one, returning whether it
+    did. The template is committed pointing at the new model before the old one
+    is deleted; classification jobs look the model up by template when they run,
+    so jobs queued before the migration load the new one. Only a job that was
+    already downloading the old model can miss it, keep_originals avoids that.
+    """
+    model_name = template.model_name
+    with tempfile.TemporaryDirectory() as model_dir:
+        model_path = os.path.join(model_dir, model_name)
+        app.storage.download_file(model_name, model_path, s3_client)
+        model = fasttext.load_model(model_path)
+
+        result = quantize(model, _training_data(session, template.id))
+        if result is None:
+            return False
+
+        new_model_name = quantized_model_name(model_name)
+        new_model_path = os.path.join(model_dir, new_model_name)
+        model.save_model(new_model_path)
+        app.storage.upload_file(new_model_path, new_model_name, s3_client)
+        logger.info(
+            f"Template {template.id}: {model_name} ({os.path.getsize(model_path)} bytes) -> "
+            f"{new_model_name} ({os.path.getsize(new_model_path)} bytes), accuracy delta {result[1]:+.4f}"
+        )
+
+    template.model_name = new_model_name
+    template.model_accuracy, template.quantized_accuracy_delta = result
+    template.updated_at = datetime.now(timezone.utc)
+    session.commit()
+
+    if not keep_originals:
+        app.helpers.delete_s3_object(s3_client, model_name)
+    return True
+
+def migrate(template_ids: list[int] | None = None, keep_originals: bool = False) -> int:
+    """Quantizes the models of the given (or every) template that still has a .bin model"""
+    s3_client = app.storage.get_s3_client()
+    migrated = 0
+
+    with Session() as session:
+        query = sa.select(db_models.Template).where(db_models.Template.model_name.not_like(f"%{QUANTIZED_MODEL_EXT}"))
+        if template_ids:
+            query = query.where(db_models.Template.id.in_(template_ids))
+
+        for template in session.scalars(query).all():
+            try:
+                migrated += migrate_template(session, s3_client, template, keep_originals)
+            except Exception as e:
+                session.rollback()
+                logger.exception(f"Couldn't quantize the model of template {template.id}")
+
+    return migrated
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Replace templates' fastText models with quantized ones")
+    parser.add_argument("--template-id", type=int, action="append", dest="template_ids", help="repeatable; defaults to every template")
+    parser.add_argument("--keep-originals", action="store_true", help="leave the .bin models in the bucket")
+    args = parser.parse_args()
+
+    print(f"Quantized {migrate(args.template_ids, args.keep_originals)} models")
@@ -0,0 +1,40 @@
+import os
+import polars as pl
+from typing import IO
+
+# Uploaded files (transactions, charts of accounts) are read through scan_upload,
+# which picks a reader from the file extension. Every format gets the same
+# lowercase header normalization. Excel files are parsed natively with calamine
+# (fastexcel), and only the requested columns are loaded.
+
+def normalize_columns(cols: list[str]) -> list[str]:
+    return [col.lower() for col in cols]
+
+def read_excel(source: str | bytes, columns: list[str] | None = None) -> pl.DataFrame:
+    """Reads the first sheet of an XLSX file, keeping only the given (lowercase) columns"""
+    selected = None
+    if columns is not None:
+        # read the header row alone to find the matching column names
+        header = pl.read_excel(source, engine="calamine", read_options={"n_rows": 0})
+        selected = [col for col in header.columns if col.lower() in columns]
+        if not selected:
+            return pl.DataFrame()
+
+    df = pl.read_excel(source, engine="calamine", columns=selected)
+    return df.rename(dict(zip(df.columns, normalize_columns(df.columns))))
+
+def scan_upload(source: str | bytes | IO[bytes], file_ext: str, columns: list[str] | None = None) -> pl.LazyFrame:
+    """
+    Returns a LazyFrame over an uploaded file with lowercase column names.
+    columns lists the (lowercase) columns the caller may use; other columns
+    may be left out.
+    """
+    match file_ext.lower():
+        case ".csv":
+            return pl.scan_csv(source, with_column_names=normalize_columns)
+        case ".xlsx":
+            if not isinstance(source, (str, bytes, os.PathLike)):
+                source = source.read()
+            return read_excel(source, columns).lazy()
+        case _:
+            raise ValueError(f"Can't process {file_ext} files.")
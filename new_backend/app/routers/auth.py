@@ -2,7 +2,8 @@ from typing import Annotated
 from fastapi import Depends, HTTPException, status, Form, APIRouter, Body
 import app.models.app_models as app_models
 import app.models.database_models as db_models
-from app.dependencies import get_session, current_user
+from app.dependencies import get_session, current_user, get_redis_connection, token_cache, logger
+import app.session_store
 import sqlalchemy as sa
 import argon2
 import secrets
@@ -45,25 +46,30 @@ async def login(
     token_dict = authenticate_user(data, provider, session)
     return token_dict
 
-@router.delete("/api/tokens")
+@router.delete("/tokens")
 async def sign_out(
-    user: Annotated[db_models.User, Depends(current_user)], 
+    user: Annotated[dict, Depends(current_user)], 
     session: Annotated[so.Session, Depends(get_session)]
 ):
+    access_token = user["access_token"]
+
     account = session.scalars(
         sa.select(db_models.Account)
         .where(
             sa.and_(
-                db_models.Account.access_token == user.access_token,
+                db_models.Account.access_token == access_token,
             )
         )
     ).first()
 
-    access_token = user["access_token"]
-
-    # delete user session and expire token
-    r.delete(f'user-session:{access_token}')
-    account.access_expiration = datetime.now(timezone.utc) - timedelta(seconds=1)
+    # delete user session and expire token; the session expires on its own if Redis is down
+    try:
+        get_redis_connection().delete(app.session_store.session_key(access_token))
+    except Exception as e:
+        logger.warning(f"Couldn't delete the session of a signed out user: {e}")
+    token_cache.invalidate(access_token)
+    if account:
+        account.access_expiration = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1)
 
     session.commit()
 
@@ -104,6 +110,9 @@ def authenticate_user(
                 session.add(new_user_account)
                 user_account = new_user_account
         
+    # the previous token stops validating, so drop it from the cache too
+    if user_account.access_token:
+        token_cache.invalidate(user_account.access_token)
     user_account.access_token = secrets.token_hex(16)
     user_account.access_expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=expires_in)
     session.commit()
@@ -1,12 +1,16 @@
 import os
-import io
-from typing import Annotated, Dict, Union
-from fastapi import APIRouter, File, UploadFile, Depends, BackgroundTasks, Header, Form, HTTPException
+from typing import Annotated, Dict, Literal, Union
+from fastapi import APIRouter, File, UploadFile, Depends, Header, Form, HTTPException, Query
 from fastapi.responses import StreamingResponse
-from app.dependencies import get_session, logger, current_user, get_s3_client, UPLOAD_EXTENSIONS, get_redis_connection
+from fastapi.concurrency import run_in_threadpool
+from app.dependencies import get_session, get_async_session, logger, current_user, get_s3_client, UPLOAD_EXTENSIONS, get_redis_connection, get_async_redis_connection
 import app.models.app_models as app_models
-import app.tasks
+import app.jobs
 import app.helpers
+import app.exporters
+import app.storage
+import app.session_store
+import app.label_index
 import datetime
 import sqlalchemy as sa
 import sqlalchemy.orm as so
@@ -16,6 +20,8 @@ import boto3
 from mypy_boto3_s3.client import S3Client
 import uuid
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy.ext.asyncio import AsyncSession
 from botocore.exceptions import ClientError
 
 router = APIRouter(
@@ -23,26 +29,27 @@ router = APIRouter(
 )
 
 @router.post("/{user_id}/coa")
-def create_new_chart_of_accounts(
-    coa_group_name: Annotated[int, Form()],
+async def create_new_chart_of_accounts(
+    user_id: int,
+    coa_group_name: Annotated[str, Form()],
     coa_file: Annotated[UploadFile, File()],
     user: Annotated[Dict[str, Union[db_models.User, str]], Depends(current_user)],
-    background_tasks: BackgroundTasks
+    redis_client: Annotated[AsyncRedis, Depends(get_async_redis_connection)]
 ):
     if user["user"].id != user_id:
         raise HTTPException(status_code=401, detail="Incorrect credentials")
 
     try:
-        object_key = app.helpers.upload_file_to_s3(coa_file)
+        object_key = await app.helpers.upload_file_to_s3_async(coa_file)
     except ValueError as e:
         raise HTTPException(status_code=422, detail="Invalid file type")
     except Exception as e:
         # log
         raise HTTPException(status_code=500, detail="Server error")
     else:
-        background_tasks.add_task(app.tasks.create_coa, coa_group_name, object_key, user_id)
+        job_id = await app.jobs.enqueue_async(redis_client, "coa", user_id, coa_group_name, object_key, user_id)
 
-    return {"message": "processing..."}
+    return {"message": "processing...", "job_id": job_id}
 
 @router.get("/{user_id}/templates")
 def get_user_templates(
@@ -63,21 +70,21 @@ def get_user_templates(
     return {"templates": [{"id": item.id, "title":item.title} for item in template_records]}
 
 @router.post("/{user_id}/templates")
-def create_template(
+async def create_template(
     user_id: int,
     template_title: Annotated[str, Form()],
     template_coa_group_id: Annotated[int, Form()],
     transactions_file: Annotated[UploadFile, File()],
-    background_tasks: BackgroundTasks, 
     user: Annotated[Dict[str, Union[db_models.User, str]], Depends(current_user)],
-    session: Annotated[so.Session, Depends(get_session)]
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    redis_client: Annotated[AsyncRedis, Depends(get_async_redis_connection)]
 ):
     if user_id != user["user"].id:
         raise HTTPException(status_code=401)
 
     if template_coa_group_id != -1:
         # check that user has access to coa group, if not raise exception
-        result = session.execute(
+        result = (await session.execute(
             sa.select(db_models.UserCOAAccess.access_level)
             .where(
                 sa.and_(
@@ -85,13 +92,13 @@ def create_template(
                     db_models.UserCOAAccess.group_id == template_coa_group_id
                 )
             )
-        )
+        )).first()
 
         if not result:
             raise HTTPException(status_code=401, detail="Unauthorized to use COA group")
 
     try:
-        object_key = app.helpers.upload_file_to_s3(transactions_file)
+        object_key = await app.helpers.upload_file_to_s3_async(transactions_file)
     except ValueError as e:
         raise HTTPException(status_code=422, detail=f"{e}")
     except (ClientError, Exception) as e:
@@ -99,17 +106,16 @@ def create_template(
         raise HTTPException(status_code=500, detail="Server failure")
     else:
         template_info = app_models.TemplateInfo(title=template_title, coa_group_id=template_coa_group_id)
-        background_tasks.add_task(app.tasks.create_template, template_info, user_id, object_key)
-        return {"message": "Processing data"}
+        job_id = await app.jobs.enqueue_async(redis_client, "train", user_id, template_info.model_dump(), user_id, object_key)
+        return {"message": "Processing data", "job_id": job_id}
 
 @router.post("/transactions")
 async def process_transactions(
         template_id: Annotated[int, Form()],
         transactions_file: Annotated[UploadFile, File()],
         user: Annotated[Dict[str, Union[db_models.User, str]], Depends(current_user)],
-        session: Annotated[so.Session, Depends(get_session)],
-        s3_client: Annotated[S3Client, Depends(get_s3_client)],
-        background_tasks: BackgroundTasks,
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_connection)],
 ):
     # check if file is acceptable (https://blog.miguelgrinberg.com/post/handling-file-uploads-with-flask)
     file_ext = os.path.splitext(transactions_file.filename)[1]
@@ -117,7 +123,7 @@ async def process_transactions(
         raise HTTPException(status_code=400, detail="File type not accepted")
 
     # check if user has access to given template_id
-    template_access = session.execute(
+    template_access = (await session.execute(
         sa.select(
             db_models.UserTemplateAccess.access_level, 
             db_models.Template.model_name
@@ -129,173 +135,308 @@ async def process_transactions(
                 db_models.UserTemplateAccess.template_id == template_id
             )
         )
-    ).first()
+    )).first()
 
     if not template_access:
         raise HTTPException(status_code=401, detail="Unauthorized to access resource")
 
     # upload file to s3
     try:
-        object_key = app.helpers.upload_file_to_s3(transactions_file)
+        object_key = await app.helpers.upload_file_to_s3_async(transactions_file)
     except ValueError as e:
         raise HTTPException(status_code=422, detail=f"{e}")
 
     if not object_key:
         raise HTTPException(status_code=500, detail=f"Server failed")
 
-    background_tasks.add_task(
-        app.tasks.process_transactions_task,
+    job_id = await app.jobs.enqueue_async(
+        redis_client,
+        "classify",
+        user['user'].id,
         user['user'].id,
         template_id,
         object_key, 
         template_access.model_name, 
         user['access_token']
     )
-    return {"message": "Notification sent in the background"}
+    return {"message": "Notification sent in the background", "job_id": job_id}
 
-@router.get("/tables")
-def send_table_data(
+@router.get("/jobs/{job_id}")
+def get_job_status(
+    job_id: str,
     user: Annotated[Dict[str, Union[db_models.User, str]], Depends(current_user)],
-    session: Annotated[so.Session, Depends(get_session)],
     redis_client: Annotated[Redis, Depends(get_redis_connection)]
+):
+    job = app.jobs.get_job(redis_client, job_id)
+    if not job or job["user_id"] != user["user"].id:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job
+
+@router.get("/tables")
+async def send_table_data(
+    user: Annotated[Dict[str, Union[db_models.User, str]], Depends(current_user)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    redis_client: Annotated[AsyncRedis, Depends(get_async_redis_connection)]
 ):
     access_token = user["access_token"]
-    session_data = redis_client.hgetall(f'user-session:{access_token}')
-    
-    serialized_lf = session_data.get(b'data') #replace with get()
-    if not serialized_lf:
-        raise HTTPException(status_code=400, detail="Couldn't find your data")
 
-    # send data view to client
+    # the rows themselves are fetched a page at a time from /tables/{table_type}
     try:
-        lf = pl.LazyFrame.deserialize(io.BytesIO(serialized_lf))
+        counts = await app.session_store.load_session_counts_async(redis_client, access_token)
+        template_id = await app.session_store.load_session_template_id_async(redis_client, access_token)
     except Exception as e:
         raise HTTPException(status_code=500)
 
-    df = lf.collect()
-
-    itemized = df.select(["date", "number", "payee", "description", "amount", "account", "group"]).to_dicts()
-
-    summary = (
-        df.group_by(
-            pl.col("group"),
-            pl.col("account")
-        )
-        .agg(
-            pl.col("description").first(),
-            # pl.col("amount").sum().alias("total"), # schema currently detects amount column as string, change this at processing task
-            pl.len().alias("instances")
-        )
-        .to_dicts()
-    )
-
-    # Additionally send COA
-    template_id = int(session_data[b'template_id'].decode('utf-8'))
+    if counts is None or template_id is None:
+        raise HTTPException(status_code=400, detail="Couldn't find your data")
 
-    coa_group_id = session.execute(
-        sa.select(db_models.Template.coa_group_id)
+    template = (await session.execute(
+        sa.select(db_models.Template.title, db_models.Template.coa_group_id)
         .where(db_models.Template.id == template_id)
-    ).scalar_one_or_none()
+    )).one_or_none()
+
+    if template is None:
+        raise HTTPException(status_code=400, detail="Couldn't find your data")
 
     options = (
-        session.execute(
+        await session.execute(
             sa.select(db_models.COA.account)
-            .where(db_models.COA.group_id == coa_group_id)
+            .where(db_models.COA.group_id == template.coa_group_id)
             .order_by(db_models.COA.account.asc())
         )
     )
 
     return {
-        "itemized": itemized,
-        "summary": summary,
+        "template": {"id": template_id, "title": template.title},
+        "totals": {"itemized": counts[0], "summary": counts[1]},
         "options": [row.account for row in options],
     }
 
-@router.put("/tables/itemized")
-def update_itemized_table(
-    data: app_models.ItemizedRow,
+@router.get("/tables/{table_type}")
+async def send_table_page(
+    table_type: Literal["itemized", "summary"],
     user: Annotated[Dict[str, Union[db_models.User, str]], Depends(current_user)],
-    redis_client: Annotated[Redis, Depends(get_redis_connection)]
+    redis_client: Annotated[AsyncRedis, Depends(get_async_redis_connection)],
+    offset: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    sort_by: str | None = None,
+    descending: bool = False,
+    search: str | None = None
 ):
     access_token = user["access_token"]
 
-    serialized_lf = redis_client.hget(f'user-session:{access_token}', 'data')
-    if not serialized_lf:
+    # the summary view is read from its materialized frame, without loading the table
+    try:
+        match table_type:
+            case "itemized":
+                view = await app.session_store.load_session_table_async(redis_client, access_token)
+                if view is not None:
+                    view = view.select(app.helpers.ITEMIZED_COLUMNS)
+            case "summary":
+                view = await app.session_store.load_session_summary_async(redis_client, access_token)
+                if view is not None:
+                    view = view.sort("group")
+    except Exception as e:
+        raise HTTPException(status_code=500)
+
+    if view is None:
         raise HTTPException(status_code=400, detail="Couldn't find your data")
 
+    # only the requested page is sent, along with the size of the filtered view
     try:
-        lf = pl.LazyFrame.deserialize(io.BytesIO(serialized_lf))
+        page, total = await run_in_threadpool(app.helpers.page_table, view, offset, limit, sort_by, descending, search)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"{e}")
+
+    return {
+        "rows": page.to_dicts(),
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+    }
+
+def edit_itemized_rows(session: app.session_store.EditableSession, data: app_models.ItemizedRow) -> tuple[pl.Series, pl.DataFrame, pl.Series]:
+    """
+    Sets the account of the row with the given id, returning the edited account
+    column and summary. Row ids are row positions (see app.session_store), so the
+    row is found without a scan. Also returns its simplified description, for the
+    label index.
+    """
+    df = session.table
+    if not 0 <= data.row_id < df.height:
+        raise KeyError(data.row_id)
+
+    edited = df.slice(data.row_id, 1)
+    accounts = df["account"].clone().scatter(data.row_id, data.account)
+    summary = app.session_store.update_summary(session.summary, df.with_columns(accounts), session.group_index, edited["group"])
+    return accounts, summary, edited["simplified_descriptions"]
+
+def edit_summary_group(session: app.session_store.EditableSession, data: app_models.SummaryRow) -> tuple[pl.Series, pl.DataFrame, pl.Series]:
+    """
+    Sets the account of every row in the group, returning the edited account
+    column and summary. The group's rows are found with the session's group
+    index. Also returns their simplified descriptions, for the label index.
+    """
+    df = session.table
+    rows = app.session_store.group_rows(session.group_index, [data.group])
+    accounts = df["account"].clone().scatter(rows, data.account)
+    summary = app.session_store.update_summary(session.summary, df.with_columns(accounts), session.group_index, [data.group])
+    return accounts, summary, df["simplified_descriptions"].gather(rows)
+
+async def record_label_edits(
+    session: AsyncSession,
+    redis_client: AsyncRedis,
+    user_id: int,
+    access_token: str,
+    descriptions: pl.Series,
+    account: str
+) -> None:
+    """
+    Adds an accepted edit to the label index of the session's template, so later
+    uploads skip the model for it. The index is shared by every user of the
+    template, so only edits by users allowed to edit the template are recorded.
+    """
+    try:
+        template_id = await app.session_store.load_session_template_id_async(redis_client, access_token)
+        if template_id is None:
+            return
+
+        access_level = (await session.execute(
+            sa.select(db_models.UserTemplateAccess.access_level)
+            .where(
+                sa.and_(
+                    db_models.UserTemplateAccess.user_id == user_id,
+                    db_models.UserTemplateAccess.template_id == template_id
+                )
+            )
+        )).scalar_one_or_none()
+
+        if access_level in app.label_index.LABEL_INDEX_EDITOR_ACCESS_LEVELS:
+            await app.label_index.record_edits_async(redis_client, template_id, descriptions, account)
+    except Exception as e:
+        logger.warning(f"Couldn't record label edits: {e}")
+
+@router.put("/tables/itemized")
+async def update_itemized_table(
+    data: app_models.ItemizedRow,
+    user: Annotated[Dict[str, Union[db_models.User, str]], Depends(current_user)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    redis_client: Annotated[AsyncRedis, Depends(get_async_redis_connection)]
+):
+    access_token = user["access_token"]
+
+    try:
+        session_data = await app.session_store.load_editable_session_async(redis_client, access_token)
     except Exception as e:
         raise HTTPException(status_code=500)
 
-    lf = lf.with_columns(
-        pl.when(
-            pl.col("date") == data.date, 
-            pl.col("description") == data.description
-        )
-        .then(pl.lit(data.account))
-        .otherwise(pl.col("account"))
-        .alias("account")
-    )
+    if session_data is None:
+        raise HTTPException(status_code=400, detail="Couldn't find your data")
 
     try:
-        updated_serialized_lf = lf.serialize()
-        redis_client.hset(f'user-session:{access_token}', key='data', value=updated_serialized_lf)
+        accounts, summary, edited_descriptions = await run_in_threadpool(edit_itemized_rows, session_data, data)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Couldn't find that row")
+
+    try:
+        saved = await app.session_store.save_session_edit_async(redis_client, access_token, session_data, accounts, summary)
     except Exception as e:
-        print(e)
+        logger.exception("Couldn't save an edited session table")
         raise HTTPException(status_code=500, detail="Couldn't update summary table")
 
+    # the session expired, or was replaced by a new upload, while the edit was applied
+    if not saved:
+        raise HTTPException(status_code=400, detail="Couldn't find your data")
+
+    await record_label_edits(session, redis_client, user["user"].id, access_token, edited_descriptions, data.account)
+
     return {"message": "Row successfully updated"}
 
 @router.put("/tables/summary")
-def update_summary_table(
+async def update_summary_table(
     data: app_models.SummaryRow,
     user: Annotated[Dict[str, Union[db_models.User, str]], Depends(current_user)],
-    redis_client: Annotated[Redis, Depends(get_redis_connection)]
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    redis_client: Annotated[AsyncRedis, Depends(get_async_redis_connection)]
 ):
     access_token = user["access_token"]
-    serialized_lf = redis_client.hget(f'user-session:{access_token}', 'data')
-
-    if not serialized_lf:
-        raise HTTPException(status_code=400, detail="Couldn't find your data")
 
     try:
-        lf = pl.LazyFrame.deserialize(io.BytesIO(serialized_lf))
+        session_data = await app.session_store.load_editable_session_async(redis_client, access_token)
     except Exception as e:
         raise HTTPException(status_code=500)
 
-    lf = lf.with_columns(
-        pl.when(pl.col("group") == data.group)
-        .then(pl.lit(data.account))
-        .otherwise(pl.col("account"))
-        .alias("account")
-    )
+    if session_data is None:
+        raise HTTPException(status_code=400, detail="Couldn't find your data")
+
+    accounts, summary, edited_descriptions = await run_in_threadpool(edit_summary_group, session_data, data)
 
     try:
-        updated_serialized_lf = lf.serialize()
-        redis_client.hset(f'user-session:{access_token}', key='data', value=updated_serialized_lf)
+        saved = await app.session_store.save_session_edit_async(redis_client, access_token, session_data, accounts, summary)
     except Exception as e:
-        print(e)
+        logger.exception("Couldn't save an edited session table")
         raise HTTPException(status_code=500, detail="Couldn't update summary table")
 
+    # the session expired, or was replaced by a new upload, while the edit was applied
+    if not saved:
+        raise HTTPException(status_code=400, detail="Couldn't find your data")
+
+    await record_label_edits(session, redis_client, user["user"].id, access_token, edited_descriptions, data.account)
+
     return {"message": "Values successfully updated"}
 
 @router.get("/documents")
-def download_request(
-    background_tasks: BackgroundTasks,
+async def download_request(
+    redis_client: Annotated[AsyncRedis, Depends(get_async_redis_connection)],
     s3_client: Annotated[S3Client, Depends(get_s3_client)],
-    redis_client: Annotated[Redis, Depends(get_redis_connection)],
     user: Annotated[Dict[str, Union[db_models.User, str]], Depends(current_user)],
     export_type: str = "csv"
 ):
     access_token = user["access_token"]
-    serialized_lf = redis_client.hget(f'user-session:{access_token}', 'data')
 
-    if not serialized_lf:
+    if export_type not in app.exporters.EXPORT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"Can't export {export_type} files.")
+
+    if not await redis_client.hexists(app.session_store.session_key(access_token), 'data'):
         raise HTTPException(status_code=400, detail="Couldn't find your data")
 
-    # run background task that creates tempfile
-    background_tasks.add_task(app.tasks.create_export_file, user["user"].id, user["access_token"], export_type)
+    # an unchanged table was already exported, hand out the existing file if it's
+    # still in the bucket (otherwise the export job rebuilds it)
+    data_digest = await app.session_store.load_session_digest_async(redis_client, access_token)
+    if data_digest:
+        cache_key = app.exporters.export_cache_key(data_digest, export_type)
+        filename = await redis_client.get(cache_key)
+        if filename is not None:
+            filename = filename.decode("utf-8")
+            if await run_in_threadpool(app.storage.object_exists, filename, s3_client):
+                app.helpers.emit_job_status(user["user"].id, "download", f"Success,{filename}")
+                return {"message": "Export ready", "filename": filename}
+            await redis_client.delete(cache_key)
+
+    # queue job that creates the export file
+    job_id = await app.jobs.enqueue_async(redis_client, "export", user["user"].id, user["user"].id, user["access_token"], export_type)
+    return {"message": "Processing export", "job_id": job_id}
+
+@router.get("/documents/stream")
+async def stream_document(
+    user: Annotated[Dict[str, Union[db_models.User, str]], Depends(current_user)],
+    redis_client: Annotated[AsyncRedis, Depends(get_async_redis_connection)]
+):
+    # the CSV is sent batch by batch as it's written, instead of going through an export job
+    try:
+        df = await app.session_store.load_session_table_async(redis_client, user["access_token"])
+    except Exception as e:
+        raise HTTPException(status_code=500)
+
+    if df is None:
+        raise HTTPException(status_code=400, detail="Couldn't find your data")
+
+    return StreamingResponse(
+        app.exporters.csv_chunks(app.exporters.export_table(df)),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="transactions.csv"'},
+    )
 
 @router.get("/{user_id}/documents/{document_name}")
 async def get_document(
@@ -305,7 +446,7 @@ async def get_document(
 ):
     try:
         # Fetch the object (stream, not download)
-        s3_object = s3_client.get_object(Bucket=os.getenv("BUCKET_NAME"), Key=document_name)
+        s3_object = await run_in_threadpool(s3_client.get_object, Bucket=os.getenv("BUCKET_NAME"), Key=document_name)
         file_stream = s3_object["Body"]  # this is a file-like object
 
         # Extract metadata for headers (optional)
@@ -0,0 +1,281 @@
+import io
+import hashlib
+import polars as pl
+from dataclasses import dataclass
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from starlette.concurrency import run_in_threadpool
+
+# Session tables are kept in Redis as a materialized, zstd compressed Arrow IPC
+# frame rather than a serialized LazyFrame plan, so every read costs the same
+# no matter how many edits were applied. Bump SESSION_SCHEMA_VERSION whenever
+# the stored frame's layout changes; older sessions are then treated as missing.
+# Edits only ever change the account column, so it's stored on its own
+# ("accounts") and the other columns ("data") are written once, by create_session.
+# The summary view is materialized next to the table, and a group index (row ids
+# ordered by group) lets an edit re-aggregate just the rows of the groups it
+# touched and splice them into the summary in place.
+# The *_async variants are for request handlers: Redis is awaited and the
+# (CPU bound) IPC encoding and decoding runs in the threadpool, off the event loop.
+# data_digest changes with every edit, so anything derived from the table, like
+# export files, can be cached under it.
+# Every table has a ROW_ID column holding each row's position. Edits never
+# reorder, add or drop rows, so a row id is also the row's index in the table.
+# Only create_session starts a session: edits are written only while the session
+# (its template_id field) still exists, and a hash without template_id is treated
+# as no session at all. It also takes a LazyFrame (e.g. over the Parquet parts of
+# app.streaming), whose fields are then sunk straight to IPC without collecting
+# the whole table.
+SESSION_SCHEMA_VERSION = 4
+ROW_ID = "row_id"
+SESSION_TTL_SECONDS = 10800 # 3 hours
+
+# read with every session field, so partial hashes are treated as missing sessions
+SESSION_FIELDS = ["schema_version", "template_id"]
+TABLE_FIELDS = ["data", "account_position", "accounts"]
+
+def session_key(access_token: str) -> str:
+    return f'user-session:{access_token}'
+
+def table_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def session_digest(base_digest: str, accounts: bytes) -> str:
+    """Digest of a session table, from the digest of its upload and its stored accounts"""
+    return hashlib.sha256(base_digest.encode("utf-8") + accounts).hexdigest()
+
+def encode_table(df: pl.DataFrame | pl.LazyFrame) -> bytes:
+    buffer = io.BytesIO()
+    if isinstance(df, pl.LazyFrame):
+        df.sink_ipc(buffer, compression="zstd")
+    else:
+        df.write_ipc(buffer, compression="zstd")
+    return buffer.getvalue()
+
+def decode_table(data: bytes) -> pl.DataFrame:
+    return pl.read_ipc(io.BytesIO(data))
+
+def summarize_table(df: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Builds the summary view (one row per group and account, in order of first appearance) of a session table"""
+    return (
+        df.group_by(
+            pl.col("group"),
+            pl.col("account"),
+            maintain_order=True
+        )
+        .agg(
+            pl.col("description").first(),
+            # pl.col("amount").sum().alias("total"), # schema currently detects amount column as string, change this at processing task
+            pl.len().alias("instances")
+        )
+    )
+
+def build_group_index(df: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Row ids ordered by group, so the rows of a group are one contiguous slice"""
+    return df.select("group", ROW_ID).sort("group", maintain_order=True)
+
+def group_rows(group_index: pl.DataFrame, groups: pl.Series | list[int]) -> pl.Series:
+    """Row ids of the given groups, in table order, found by binary search in the group index"""
+    groups = pl.Series("group", groups, dtype=group_index["group"].dtype).unique()
+    starts = group_index["group"].search_sorted(groups, side="left")
+    ends = group_index["group"].search_sorted(groups, side="right")
+    rows = [group_index[ROW_ID].slice(start, end - start) for start, end in zip(starts, ends)]
+    return pl.concat(rows).sort() if rows else group_index[ROW_ID].clear()
+
+def update_summary(summary: pl.DataFrame, df: pl.DataFrame, group_index: pl.DataFrame, groups: pl.Series | list[int]) -> pl.DataFrame:
+    """
+    Re-aggregates the summary rows of the given groups from their rows of the
+    edited table. The new rows take the place of the group's old ones, so the
+    summary keeps its order.
+    """
+    groups = pl.Series("group", groups, dtype=summary["group"].dtype).unique()
+    summary = summary.with_row_index("position")
+    edited = summary["group"].is_in(groups.implode())
+    positions = summary.filter(edited).group_by("group").agg(pl.col("position").min())
+
+    updated = (
+        summarize_table(df.gather(group_rows(group_index, groups)))
+        .join(positions, on="group", how="left")
+        .with_columns(pl.int_range(pl.len()).over("group").alias("order"))
+    )
+    return (
+        pl.concat([
+            summary.filter(~edited).with_columns(pl.lit(0, dtype=pl.Int64).alias("order")),
+            updated.select(summary.columns + ["order"]),
+        ])
+        .sort("position", "order")
+        .drop("position", "order")
+    )
+
+@dataclass
+class EditableSession:
+    """A session table loaded for editing, see load_editable_session"""
+    table: pl.DataFrame
+    summary: pl.DataFrame
+    group_index: pl.DataFrame
+    base_digest: str
+
+def create_session(redis_client: Redis, access_token: str, template_id: int, df: pl.DataFrame | pl.LazyFrame) -> None:
+    """Stores a freshly classified table and its summary as the user's session data"""
+    df = df.with_row_index(ROW_ID)
+    key = session_key(access_token)
+    redis_client.delete(key)
+    redis_client.hset(key, mapping={
+        "template_id": template_id,
+        **_encode_session(df)
+    })
+    redis_client.expire(key, SESSION_TTL_SECONDS)
+
+def save_session_edit(redis_client: Redis, access_token: str, session: EditableSession, accounts: pl.Series, summary: pl.DataFrame) -> bool:
+    """
+    Stores the edited account column and summary of a session loaded with
+    load_editable_session, and restarts the session's TTL. Returns False, writing
+    nothing, if the session has expired or was replaced since it was loaded.
+    """
+    key = session_key(access_token)
+    mapping = _encode_edit(session.base_digest, accounts, summary)
+
+    def save(pipe) -> bool:
+        template_id, base_digest = pipe.hmget(key, ["template_id", "base_digest"])
+        if template_id is None or base_digest is None or base_digest.decode("utf-8") != session.base_digest:
+            return False
+        pipe.multi()
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, SESSION_TTL_SECONDS)
+        return True
+
+    # WATCHes the key, retrying if it changes (or expires) before the write
+    return redis_client.transaction(save, key, value_from_callable=True)
+
+async def save_session_edit_async(redis_client: AsyncRedis, access_token: str, session: EditableSession, accounts: pl.Series, summary: pl.DataFrame) -> bool:
+    key = session_key(access_token)
+    mapping = await run_in_threadpool(_encode_edit, session.base_digest, accounts, summary)
+
+    async def save(pipe) -> bool:
+        template_id, base_digest = await pipe.hmget(key, ["template_id", "base_digest"])
+        if template_id is None or base_digest is None or base_digest.decode("utf-8") != session.base_digest:
+            return False
+        pipe.multi()
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, SESSION_TTL_SECONDS)
+        return True
+
+    return await redis_client.transaction(save, key, value_from_callable=True)
+
+def _encode_session(df: pl.DataFrame | pl.LazyFrame) -> dict:
+    data = encode_table(df.drop("account"))
+    accounts = encode_table(df.select("account"))
+    # identifies the upload, so an edit never lands on a newer one
+    base_digest = session_digest(table_digest(data), accounts)
+    return {
+        "schema_version": SESSION_SCHEMA_VERSION,
+        "data": data,
+        "account_position": df.collect_schema().names().index("account"),
+        "accounts": accounts,
+        "base_digest": base_digest,
+        "data_digest": session_digest(base_digest, accounts),
+        "group_index": encode_table(build_group_index(df)),
+        "summary": encode_table(summarize_table(df))
+    }
+
+def _encode_edit(base_digest: str, accounts: pl.Series, summary: pl.DataFrame) -> dict:
+    data = encode_table(accounts.alias("account").to_frame())
+    return {
+        "accounts": data,
+        "data_digest": session_digest(base_digest, data),
+        "summary": encode_table(summary)
+    }
+
+def _is_current(schema_version: bytes | None, template_id: bytes | None) -> bool:
+    return schema_version is not None and int(schema_version) == SESSION_SCHEMA_VERSION and template_id is not None
+
+def _fields(values: list[bytes | None], fields: list[str]) -> dict[str, bytes] | None:
+    """The requested fields of a session hash, or None if it isn't a (current) session"""
+    schema_version, template_id, *values = values
+    if not _is_current(schema_version, template_id) or not all(value is not None for value in values):
+        return None
+    return dict(zip(fields, values))
+
+def _load_fields(redis_client: Redis, access_token: str, fields: list[str]) -> dict[str, bytes] | None:
+    return _fields(redis_client.hmget(session_key(access_token), [*SESSION_FIELDS, *fields]), fields)
+
+async def _load_fields_async(redis_client: AsyncRedis, access_token: str, fields: list[str]) -> dict[str, bytes] | None:
+    return _fields(await redis_client.hmget(session_key(access_token), [*SESSION_FIELDS, *fields]), fields)
+
+def _decode_table(fields: dict[str, bytes]) -> pl.DataFrame:
+    return decode_table(fields["data"]).insert_column(
+        int(fields["account_position"]),
+        decode_table(fields["accounts"]).to_series()
+    )
+
+def _decode_session(fields: dict[str, bytes]) -> tuple[pl.DataFrame, pl.DataFrame]:
+    return _decode_table(fields), decode_table(fields["summary"])
+
+def _decode_editable(fields: dict[str, bytes]) -> EditableSession:
+    return EditableSession(
+        _decode_table(fields),
+        decode_table(fields["summary"]),
+        decode_table(fields["group_index"]),
+        fields["base_digest"].decode("utf-8")
+    )
+
+EDITABLE_FIELDS = [*TABLE_FIELDS, "summary", "group_index", "base_digest"]
+
+def load_session_table(redis_client: Redis, access_token: str) -> pl.DataFrame | None:
+    """Returns the session table, or None if there is no (current) session data"""
+    fields = _load_fields(redis_client, access_token, TABLE_FIELDS)
+    return _decode_table(fields) if fields else None
+
+async def load_session_table_async(redis_client: AsyncRedis, access_token: str) -> pl.DataFrame | None:
+    fields = await _load_fields_async(redis_client, access_token, TABLE_FIELDS)
+    return await run_in_threadpool(_decode_table, fields) if fields else None
+
+def load_session_table_digest(redis_client: Redis, access_token: str) -> tuple[pl.DataFrame, str] | None:
+    """Returns the session table with its digest, or None if there is no (current) session data"""
+    fields = _load_fields(redis_client, access_token, [*TABLE_FIELDS, "data_digest"])
+    return (_decode_table(fields), fields["data_digest"].decode("utf-8")) if fields else None
+
+async def load_session_digest_async(redis_client: AsyncRedis, access_token: str) -> str | None:
+    """Returns the digest of the session table without loading it, or None if there is no (current) session data"""
+    fields = await _load_fields_async(redis_client, access_token, ["data_digest"])
+    return fields["data_digest"].decode("utf-8") if fields else None
+
+async def load_session_template_id_async(redis_client: AsyncRedis, access_token: str) -> int | None:
+    """Returns the id of the template the session table was classified with"""
+    template_id = await redis_client.hget(session_key(access_token), "template_id")
+    return int(template_id) if template_id is not None else None
+
+def load_session_summary(redis_client: Redis, access_token: str) -> pl.DataFrame | None:
+    """Returns the materialized summary view, or None if there is no (current) session data"""
+    fields = _load_fields(redis_client, access_token, ["summary"])
+    return decode_table(fields["summary"]) if fields else None
+
+async def load_session_summary_async(redis_client: AsyncRedis, access_token: str) -> pl.DataFrame | None:
+    fields = await _load_fields_async(redis_client, access_token, ["summary"])
+    return await run_in_threadpool(decode_table, fields["summary"]) if fields else None
+
+def _decode_counts(fields: dict[str, bytes]) -> tuple[int, int]:
+    return decode_table(fields["accounts"]).height, decode_table(fields["summary"]).height
+
+async def load_session_counts_async(redis_client: AsyncRedis, access_token: str) -> tuple[int, int] | None:
+    """Returns the row counts of the session table and its summary, reading just the account column and the summary"""
+    fields = await _load_fields_async(redis_client, access_token, ["accounts", "summary"])
+    return await run_in_threadpool(_decode_counts, fields) if fields else None
+
+def load_session(redis_client: Redis, access_token: str) -> tuple[pl.DataFrame, pl.DataFrame] | None:
+    """Returns the session table and its summary, or None if there is no (current) session data"""
+    fields = _load_fields(redis_client, access_token, [*TABLE_FIELDS, "summary"])
+    return _decode_session(fields) if fields else None
+
+async def load_session_async(redis_client: AsyncRedis, access_token: str) -> tuple[pl.DataFrame, pl.DataFrame] | None:
+    fields = await _load_fields_async(redis_client, access_token, [*TABLE_FIELDS, "summary"])
+    return await run_in_threadpool(_decode_session, fields) if fields else None
+
+def load_editable_session(redis_client: Redis, access_token: str) -> EditableSession | None:
+    """Returns the session table with what an edit needs to update it, see save_session_edit"""
+    fields = _load_fields(redis_client, access_token, EDITABLE_FIELDS)
+    return _decode_editable(fields) if fields else None
+
+async def load_editable_session_async(redis_client: AsyncRedis, access_token: str) -> EditableSession | None:
+    fields = await _load_fields_async(redis_client, access_token, EDITABLE_FIELDS)
+    return await run_in_threadpool(_decode_editable, fields) if fields else None
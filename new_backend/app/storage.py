@@ -0,0 +1,245 @@
+import os
+import time
+import logging
+import threading
+import boto3
+import app.metrics
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, Future
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from mypy_boto3_s3.client import S3Client
+
+# Process-wide S3 access. Building a client resolves credentials and opens a new
+# connection pool, so every task and request handler shares one client per
+# process (boto3 clients are thread safe, but not fork safe). Large objects are
+# moved with multipart transfers tuned through the S3_* settings below, and every
+# transfer is timed so throughput can be logged and inspected with stats().
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") # e.g. a MinIO server
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 50))
+S3_CONNECT_TIMEOUT_SECONDS = float(os.getenv("S3_CONNECT_TIMEOUT_SECONDS", 10))
+S3_READ_TIMEOUT_SECONDS = float(os.getenv("S3_READ_TIMEOUT_SECONDS", 60))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", 5))
+S3_MULTIPART_THRESHOLD_BYTES = int(os.getenv("S3_MULTIPART_THRESHOLD_BYTES", 16 * 1024 ** 2))
+S3_MULTIPART_CHUNK_BYTES = int(os.getenv("S3_MULTIPART_CHUNK_BYTES", 16 * 1024 ** 2))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", 10))
+S3_MIN_PART_BYTES = 5 * 1024 ** 2 # S3's lower bound for every part but the last
+
+logger = logging.getLogger(__name__)
+
+_client: S3Client | None = None
+_client_pid: int | None = None
+_client_lock = threading.Lock()
+
+def bucket_name() -> str:
+    return os.getenv("BUCKET_NAME")
+
+def client_config() -> Config:
+    return Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        connect_timeout=S3_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=S3_READ_TIMEOUT_SECONDS,
+        retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": "adaptive"},
+        tcp_keepalive=True,
+    )
+
+def transfer_config() -> TransferConfig:
+    return TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD_BYTES,
+        multipart_chunksize=S3_MULTIPART_CHUNK_BYTES,
+        max_concurrency=S3_MAX_CONCURRENCY,
+        # one pooled connection per concurrent part
+        use_threads=S3_MAX_CONCURRENCY > 1,
+    )
+
+def get_s3_client() -> S3Client:
+    """Returns this process's shared S3 client, creating it on first use"""
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = boto3.session.Session().client("s3", endpoint_url=S3_ENDPOINT_URL, config=client_config())
+            _client_pid = os.getpid()
+        return _client
+
+@dataclass
+class TransferStats:
+    count: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+_stats: dict[str, TransferStats] = {}
+_stats_lock = threading.Lock()
+
+def stats() -> dict[str, TransferStats]:
+    """Cumulative transfer counts, bytes and seconds per operation (upload, download) in this process"""
+    with _stats_lock:
+        return {operation: TransferStats(s.count, s.bytes, s.seconds) for operation, s in _stats.items()}
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+class _Progress:
+    """boto3 transfer callback counting bytes moved, called from the transfer threads"""
+
+    def __init__(self):
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount: int) -> None:
+        with self._lock:
+            self.bytes += bytes_amount
+
+def _record(operation: str, key: str, transferred: int, seconds: float) -> None:
+    with _stats_lock:
+        entry = _stats.setdefault(operation, TransferStats())
+        entry.count += 1
+        entry.bytes += transferred
+        entry.seconds += seconds
+    app.metrics.observe_transfer(operation, transferred, seconds)
+
+    logger.info(
+        f"S3 {operation} {key}: {transferred / 1024 ** 2:.1f} MiB in {seconds:.2f}s "
+        f"({transferred / 1024 ** 2 / seconds if seconds else 0:.1f} MiB/s)"
+    )
+
+def _transfer(operation: str, key: str, method, *args, **kwargs) -> None:
+    progress = _Progress()
+    start = time.perf_counter()
+    method(*args, Config=transfer_config(), Callback=progress, **kwargs)
+    _record(operation, key, progress.bytes, time.perf_counter() - start)
+
+def upload_fileobj(fileobj, key: str, s3_client: S3Client | None = None) -> None:
+    s3_client = s3_client or get_s3_client()
+    _transfer("upload", key, s3_client.upload_fileobj, fileobj, bucket_name(), key)
+
+def upload_file(filename: str, key: str, s3_client: S3Client | None = None) -> None:
+    s3_client = s3_client or get_s3_client()
+    _transfer("upload", key, s3_client.upload_file, filename, bucket_name(), key)
+
+def download_fileobj(key: str, fileobj, s3_client: S3Client | None = None) -> None:
+    s3_client = s3_client or get_s3_client()
+    _transfer("download", key, s3_client.download_fileobj, bucket_name(), key, fileobj)
+
+def download_file(key: str, filename: str, s3_client: S3Client | None = None) -> None:
+    s3_client = s3_client or get_s3_client()
+    _transfer("download", key, s3_client.download_file, bucket_name(), key, filename)
+
+def object_exists(key: str, s3_client: S3Client | None = None) -> bool:
+    """Checks with a HEAD request that the bucket has an object under key"""
+    s3_client = s3_client or get_s3_client()
+    try:
+        s3_client.head_object(Bucket=bucket_name(), Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
+
+class StreamingUpload:
+    """
+    Writable file-like object that uploads to key while it's being written.
+    Data is sent as multipart parts of S3_MULTIPART_CHUNK_BYTES, up to
+    S3_MAX_CONCURRENCY parts at once, so memory stays bounded by the parts in
+    flight and nothing touches the local disk. Objects smaller than one part
+    are sent with a single PutObject. Leaving the with block on an exception
+    aborts the upload.
+    """
+
+    def __init__(self, key: str, s3_client: S3Client | None = None, content_type: str | None = None):
+        self.key = key
+        self.s3_client = s3_client or get_s3_client()
+        self.content_type = content_type
+        self.part_bytes = max(S3_MULTIPART_CHUNK_BYTES, S3_MIN_PART_BYTES)
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._upload_id: str | None = None
+        self._parts: list[Future] = []
+        self._executor: ThreadPoolExecutor | None = None
+        self._start = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self) -> None:
+        pass
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_bytes:
+            self._send_part(bytes(self._buffer[:self.part_bytes]))
+            del self._buffer[:self.part_bytes]
+        return len(data)
+
+    def close(self) -> None:
+        extra_args = {"ContentType": self.content_type} if self.content_type else {}
+        if self._upload_id is None:
+            self.s3_client.put_object(Bucket=bucket_name(), Key=self.key, Body=bytes(self._buffer), **extra_args)
+        else:
+            if self._buffer:
+                self._send_part(bytes(self._buffer))
+            try:
+                parts = [future.result() for future in self._parts]
+                self.s3_client.complete_multipart_upload(
+                    Bucket=bucket_name(),
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": parts}
+                )
+            except Exception:
+                self.abort()
+                raise
+            finally:
+                self._executor.shutdown()
+        self._buffer.clear()
+
+        _record("upload", self.key, self.bytes_written, time.perf_counter() - self._start)
+
+    def abort(self) -> None:
+        if self._upload_id is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self.s3_client.abort_multipart_upload(Bucket=bucket_name(), Key=self.key, UploadId=self._upload_id)
+            self._upload_id = None
+        self._buffer.clear()
+
+    def _send_part(self, body: bytes) -> None:
+        if self._upload_id is None:
+            extra_args = {"ContentType": self.content_type} if self.content_type else {}
+            response = self.s3_client.create_multipart_upload(Bucket=bucket_name(), Key=self.key, **extra_args)
+            self._upload_id = response["UploadId"]
+            self._executor = ThreadPoolExecutor(max_workers=max(S3_MAX_CONCURRENCY, 1))
+
+        # wait for the oldest part once the concurrency limit is reached, bounding buffered parts
+        in_flight = [future for future in self._parts if not future.done()]
+        if len(in_flight) >= max(S3_MAX_CONCURRENCY, 1):
+            in_flight[0].result()
+
+        self._parts.append(self._executor.submit(self._upload_part, len(self._parts) + 1, body))
+
+    def _upload_part(self, part_number: int, body: bytes) -> dict:
+        response = self.s3_client.upload_part(
+            Bucket=bucket_name(),
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import polars as pl
+import fasttext
+import app.helpers
+import app.minhash
+
+# Transaction files larger than STREAMING_THRESHOLD_BYTES are classified in
+# batches of STREAMING_BATCH_ROWS rows. Classified batches go to Parquet files on
+# disk; only the LSH band keys of each distinct description stay in memory, and
+# groups are assigned from those once every batch has been seen, joining them onto
+# the parts in one streaming pass that writes the finished table to disk as well.
+STREAMING_THRESHOLD_BYTES = int(os.getenv("STREAMING_THRESHOLD_BYTES", 256 * 1024 ** 2))
+STREAMING_BATCH_ROWS = int(os.getenv("STREAMING_BATCH_ROWS", 100_000))
+
+def classify_in_batches(
+    lf: pl.LazyFrame,
+    model: fasttext.FastText,
+    output_dir: str,
+    batch_rows: int = STREAMING_BATCH_ROWS,
+    label_index: pl.DataFrame | None = None
+) -> pl.LazyFrame:
+    """
+    Classifies a transactions LazyFrame batch by batch, writing the results to
+    output_dir. Returns a LazyFrame over the results with the group column added;
+    it reads from output_dir, so use it (e.g. store it with
+    session_store.create_session) before the directory is removed.
+    """
+    seen_descriptions = pl.Series("simplified_descriptions", [], dtype=pl.String)
+    new_descriptions, new_keys = [], []
+
+    for idx, batch in enumerate(lf.collect_batches(chunk_size=batch_rows)):
+        simplified_descriptions = app.helpers.simplify_descriptions(batch["description"])
+        unique_descriptions = simplified_descriptions.unique().sort()
+        row_to_unique = simplified_descriptions.rank("dense") - 1
+
+        accounts, prediction_confidence = app.helpers.lookup_accounts(unique_descriptions, model, label_index)
+        (
+            batch.with_columns([
+                accounts.gather(row_to_unique),
+                prediction_confidence.gather(row_to_unique),
+                simplified_descriptions.alias("simplified_descriptions")
+            ])
+            .write_parquet(os.path.join(output_dir, f"part-{idx:05d}.parquet"))
+        )
+
+        # keep compact band keys for descriptions that earlier batches didn't have
+        unique_descriptions = unique_descriptions.filter(~unique_descriptions.is_in(seen_descriptions.implode()))
+        signatures = app.minhash.signatures(unique_descriptions)
+        new_descriptions.append(unique_descriptions)
+        new_keys.append(app.minhash.band_keys(signatures, threshold=0.6))
+        seen_descriptions = seen_descriptions.append(unique_descriptions)
+
+    # group distinct descriptions across all batches
+    descriptions = pl.concat(new_descriptions) if new_descriptions else seen_descriptions
+    keys = np.vstack(new_keys) if new_keys else np.empty((0, 0), dtype=np.uint64)
+    src, dst = app.minhash.candidate_edges(keys)
+    groups = pl.DataFrame({
+        "simplified_descriptions": descriptions,
+        "group": app.minhash.component_labels(src, dst, descriptions.len())
+    })
+
+    table_path = os.path.join(output_dir, "table.parquet")
+    (
+        pl.scan_parquet(os.path.join(output_dir, "part-*.parquet"))
+        .join(groups.lazy(), on="simplified_descriptions", how="left", maintain_order="left")
+        .sink_parquet(table_path)
+    )
+    return pl.scan_parquet(table_path)
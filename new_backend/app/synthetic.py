@@ -0,0 +1,195 @@
+import argparse
+import numpy as np
+import polars as pl
+from datetime import date
+
+# Synthetic bank transactions for seeding the database and for benchmarks.
+# Descriptions look like bank statement lines: a merchant surrounded by the
+# noise normalization.NOISE_PATTERN strips (payment channels, card numbers, store
+# numbers, cities and state codes, reference ids), merchant popularity is
+# Zipf-like, and a share of rows repeat an earlier description exactly, like
+# recurring charges do. Every merchant maps to one chart of accounts entry, so
+# the account column can be used as the training label.
+MERCHANTS = [
+    ("STARBUCKS", "Meals and Entertainment"),
+    ("MCDONALD'S", "Meals and Entertainment"),
+    ("CHIPOTLE", "Meals and Entertainment"),
+    ("SQ *BLUE BOTTLE COFFEE", "Meals and Entertainment"),
+    ("DOORDASH*DASHPASS", "Meals and Entertainment"),
+    ("UBER EATS", "Meals and Entertainment"),
+    ("SHELL OIL", "Automobile Expense: Fuel"),
+    ("CHEVRON", "Automobile Expense: Fuel"),
+    ("EXXONMOBIL", "Automobile Expense: Fuel"),
+    ("JIFFY LUBE", "Automobile Expense: Repairs"),
+    ("AUTOZONE", "Automobile Expense: Repairs"),
+    ("UBER TRIP", "Travel"),
+    ("LYFT RIDE", "Travel"),
+    ("DELTA AIR LINES", "Travel"),
+    ("UNITED AIRLINES", "Travel"),
+    ("MARRIOTT HOTELS", "Travel"),
+    ("AIRBNB", "Travel"),
+    ("AMZN MKTP US", "Office Supplies"),
+    ("STAPLES", "Office Supplies"),
+    ("OFFICE DEPOT", "Office Supplies"),
+    ("COSTCO WHSE", "Office Supplies"),
+    ("ADOBE CREATIVE CLOUD", "Software and Subscriptions"),
+    ("GOOGLE *GSUITE", "Software and Subscriptions"),
+    ("MICROSOFT*365", "Software and Subscriptions"),
+    ("SLACK TECHNOLOGIES", "Software and Subscriptions"),
+    ("ZOOM.US", "Software and Subscriptions"),
+    ("DROPBOX", "Software and Subscriptions"),
+    ("GITHUB", "Software and Subscriptions"),
+    ("AWS WEB SERVICES", "Cloud Hosting"),
+    ("DIGITALOCEAN", "Cloud Hosting"),
+    ("COMCAST XFINITY", "Utilities: Internet"),
+    ("VERIZON WIRELESS", "Utilities: Phone"),
+    ("AT&T", "Utilities: Phone"),
+    ("PG&E", "Utilities: Electric"),
+    ("CITY WATER DEPT", "Utilities: Water"),
+    ("WEWORK", "Rent"),
+    ("REGUS MANAGEMENT", "Rent"),
+    ("STATE FARM INSURANCE", "Insurance"),
+    ("GEICO", "Insurance"),
+    ("GUSTO PAYROLL", "Payroll Expenses"),
+    ("ADP PAYROLL FEES", "Payroll Expenses"),
+    ("IRS USATAXPYMT", "Taxes"),
+    ("FRANCHISE TAX BD", "Taxes"),
+    ("FACEBK ADS", "Advertising and Marketing"),
+    ("GOOGLE ADS", "Advertising and Marketing"),
+    ("LINKEDIN ADS", "Advertising and Marketing"),
+    ("MAILCHIMP", "Advertising and Marketing"),
+    ("FEDEX", "Postage and Delivery"),
+    ("UPS STORE", "Postage and Delivery"),
+    ("USPS PO", "Postage and Delivery"),
+    ("HOME DEPOT", "Repairs and Maintenance"),
+    ("LOWE'S", "Repairs and Maintenance"),
+    ("CINTAS", "Repairs and Maintenance"),
+    ("STRIPE TRANSFER", "Sales Revenue"),
+    ("SHOPIFY PAYOUT", "Sales Revenue"),
+    ("SQUARE INC DEPOSIT", "Sales Revenue"),
+    ("INTEREST PAYMENT", "Interest Income"),
+    ("MONTHLY SERVICE FEE", "Bank Service Charges"),
+    ("WIRE TRANSFER FEE", "Bank Service Charges"),
+    ("LEGALZOOM", "Legal and Professional Fees"),
+]
+
+# typical amount (log-normal median) per account, negative for money in
+ACCOUNT_AMOUNTS = {
+    "Meals and Entertainment": 18,
+    "Automobile Expense: Fuel": 45,
+    "Automobile Expense: Repairs": 120,
+    "Travel": 220,
+    "Office Supplies": 80,
+    "Software and Subscriptions": 35,
+    "Cloud Hosting": 250,
+    "Utilities: Internet": 90,
+    "Utilities: Phone": 110,
+    "Utilities: Electric": 160,
+    "Utilities: Water": 60,
+    "Rent": 2400,
+    "Insurance": 300,
+    "Payroll Expenses": 150,
+    "Taxes": 1800,
+    "Advertising and Marketing": 400,
+    "Postage and Delivery": 25,
+    "Repairs and Maintenance": 140,
+    "Sales Revenue": -900,
+    "Interest Income": -12,
+    "Bank Service Charges": 15,
+    "Legal and Professional Fees": 350,
+}
+
+CHART_OF_ACCOUNTS = sorted(ACCOUNT_AMOUNTS)
+
+PREFIXES = [
+    "POS PURCHASE ", "DEBIT CARD PURCHASE ", "ACH DEBIT ", "RECURRING PAYMENT ",
+    "ONLINE PAYMENT ", "PURCHASE AUTHORIZED ON ", "VISA ", "WEB PMT ", "PPD ",
+]
+
+CITIES = [
+    ("SAN FRANCISCO", "CA"), ("LOS ANGELES", "CA"), ("SEATTLE", "WA"), ("PORTLAND", "OR"),
+    ("AUSTIN", "TX"), ("DALLAS", "TX"), ("DENVER", "CO"), ("CHICAGO", "IL"),
+    ("NEW YORK", "NY"), ("BROOKLYN", "NY"), ("BOSTON", "MA"), ("MIAMI", "FL"),
+    ("ATLANTA", "GA"), ("PHOENIX", "AZ"), ("NASHVILLE", "TN"), ("COLUMBUS", "OH"),
+]
+
+def generate_transactions(
+    rows: int,
+    seed: int = 0,
+    duplicate_rate: float = 0.35,
+    start: date = date(2024, 1, 1),
+    days: int = 365
+) -> pl.DataFrame:
+    """
+    Generates rows synthetic transactions with the columns of an uploaded bank
+    export (date, number, payee, description, amount) plus the account label.
+    duplicate_rate is the share of rows that repeat an earlier description.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Zipf-like merchant popularity
+    weights = 1 / np.arange(1, len(MERCHANTS) + 1) ** 0.8
+    merchant = rng.choice(len(MERCHANTS), size=rows, p=weights / weights.sum())
+    merchants = pl.Series([name for name, _ in MERCHANTS])
+    accounts = pl.Series([account for _, account in MERCHANTS])
+    city = rng.integers(0, len(CITIES), size=rows)
+
+    def optional(text: pl.Expr, probability: float) -> pl.Expr:
+        return pl.when(pl.Series(rng.random(rows) < probability)).then(text).otherwise(pl.lit(""))
+
+    def digits(low: int, high: int, width: int) -> pl.Expr:
+        return pl.lit(pl.Series(rng.integers(low, high, size=rows))).cast(pl.String).str.zfill(width)
+
+    df = pl.select(
+        date=pl.lit(start) + pl.duration(days=pl.lit(pl.Series(np.sort(rng.integers(0, days, size=rows))))),
+        prefix=optional(pl.lit(pl.Series(PREFIXES).gather(rng.integers(0, len(PREFIXES), size=rows))), 0.6),
+        card_date=optional(pl.concat_str(digits(1, 13, 2), digits(1, 29, 2), pl.lit(" ")), 0.15),
+        merchant=merchants.gather(merchant),
+        store=optional(pl.concat_str(pl.lit(" #"), digits(0, 10000, 4)), 0.4),
+        location=optional(
+            pl.concat_str(
+                pl.lit(" "),
+                pl.lit(pl.Series([c for c, _ in CITIES]).gather(city)),
+                pl.lit(" "),
+                pl.lit(pl.Series([s for _, s in CITIES]).gather(city)),
+            ),
+            0.5
+        ),
+        card=optional(pl.concat_str(pl.lit(" CARD "), digits(0, 10000, 4)), 0.25),
+        reference=optional(pl.concat_str(pl.lit(" REF "), digits(0, 10 ** 9, 9)), 0.15),
+        account=accounts.gather(merchant),
+        scale=rng.lognormal(0, 0.6, size=rows),
+        number=optional(digits(1000, 10000, 4), 0.05),
+    )
+
+    description = pl.concat_str("prefix", "card_date", "merchant", "store", "location", "card", "reference")
+
+    # recurring charges: repeat the description of an earlier (or the same) row
+    source = np.arange(rows)
+    repeated = rng.random(rows) < duplicate_rate
+    source[repeated] = (rng.random(repeated.sum()) * (np.flatnonzero(repeated) + 1)).astype(np.int64)
+
+    df = df.with_columns(description=description).with_columns(
+        description=pl.col("description").gather(source),
+        account=pl.col("account").gather(source),
+    )
+
+    amounts = pl.col("account").replace_strict(ACCOUNT_AMOUNTS, return_dtype=pl.Float64)
+    return df.select(
+        "date",
+        "number",
+        payee=pl.lit(""),
+        description="description",
+        amount=(amounts * pl.col("scale")).round(2),
+        account="account",
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic bank transactions to a CSV file")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("-o", "--output", default="fake_transactions.csv")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.35)
+    args = parser.parse_args()
+
+    generate_transactions(args.rows, args.seed, args.duplicate_rate).write_csv(args.output)
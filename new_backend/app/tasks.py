@@ -1,15 +1,24 @@
 import os
-import io
-import boto3
+import logging
 import secrets
 import tempfile
 import fasttext
 import app.helpers
+import app.label_index
+import app.exporters
+import app.metrics
+import app.model_cache
+import app.quantization
+import app.storage
+import app.readers
+import app.session_store
+import app.streaming
 import polars as pl
 import sqlalchemy.orm as so
 import app.models.app_models as app_models
 import app.models.database_models as db_models
 from typing import Annotated
+from datetime import date
 from fastapi import UploadFile, Depends, HTTPException, BackgroundTasks
 from mypy_boto3_s3.client import S3Client
 from app.dependencies import Session, get_s3_client, get_redis_connection
@@ -17,6 +26,12 @@ from botocore.exceptions import ClientError
 
 FASTTEXT_LEARNING_RATE = 0.5
 FASTTEXT_EPOCH = 20
+# fastText defaults to 12 threads, more than the cores of most workers; it also crashes
+# (SIGFPE) on small training sets split across too many threads
+FASTTEXT_THREADS = int(os.getenv("FASTTEXT_THREADS", os.cpu_count() or 1))
+
+# each task's stages are timed with app.metrics.stage, see job_stage_duration_seconds
+logger = logging.getLogger(__name__)
 
 def create_coa(
     coa_group_name: str,
@@ -26,14 +41,16 @@ def create_coa(
     """
 
     """
-    s3_client = boto3.Session().client("s3")
+    s3_client = app.storage.get_s3_client()
     
     try:
-        s3_object = s3_client.get_object(Bucket=os.getenv("BUCKET_NAME"), Key=s3_object_key)
-        file_stream = s3_object["Body"]
-        lf = pl.scan_csv(file_stream, with_column_names=lambda cols: [col.lower() for col in cols])
+        with app.metrics.stage("read"):
+            s3_object = s3_client.get_object(Bucket=os.getenv("BUCKET_NAME"), Key=s3_object_key)
+            file_stream = s3_object["Body"]
+            file_ext = os.path.splitext(s3_object_key)[1]
+            lf = app.readers.scan_upload(file_stream, file_ext, columns=["account"])
     except Exception as e:
-        print(e)
+        logger.exception(f"Couldn't read {s3_object_key}")
     else:
         with Session() as session:
             lf_columns = set(lf.collect_schema().names())
@@ -48,7 +65,8 @@ def create_coa(
                 #app.helpers.emit_job_status(user_id, "tables", f"Failed,Empty file")
                 return
             
-            app.helpers.create_coa(session, user_id, coa_group_name, data["account"])
+            with app.metrics.stage("insert"):
+                app.helpers.create_coa(session, user_id, coa_group_name, data["account"])
             # app.helpers.emit_job_status(user_id, "new_coa_group", "Success")
 
             app.helpers.delete_s3_object(s3_client, s3_object_key)
@@ -57,7 +75,7 @@ def create_coa(
             return
 
 def create_template(
-    template_info: app_models.TemplateInfo,
+    template_info: app_models.TemplateInfo | dict,
     user_id: str,
     s3_object_key: str
 ):
@@ -66,20 +84,23 @@ def create_template(
     1. Parse uploaded transaction CSV.
     2. Create COA group (if needed).
     3. Insert Template and Transaction records.
-    4. Train FastText model on transactions.
+    4. Train FastText model on transactions, quantizing it when FASTTEXT_QUANTIZE is set.
     5. Upload trained model to S3.
     """
-    s3_client = boto3.Session().client("s3")
+    template_info = app_models.TemplateInfo.model_validate(template_info)
+    s3_client = app.storage.get_s3_client()
     
     # Step 1: Parse uploaded transaction CSV
     try:
-        s3_object = s3_client.get_object(Bucket=os.getenv("BUCKET_NAME"), Key=s3_object_key)
-        transactions = s3_object["Body"]
-        lf = pl.scan_csv(transactions, with_column_names=lambda cols: [col.lower() for col in cols])
+        with app.metrics.stage("read"):
+            s3_object = s3_client.get_object(Bucket=os.getenv("BUCKET_NAME"), Key=s3_object_key)
+            transactions = s3_object["Body"]
+            file_ext = os.path.splitext(s3_object_key)[1]
+            lf = app.readers.scan_upload(transactions, file_ext, columns=["description", "memo", "account", "amount"])
     except ClientError as e:
-        print(e)
+        logger.exception(f"Couldn't download {s3_object_key}")
     except Exception as e:
-        print(e)
+        logger.exception(f"Couldn't read {s3_object_key}")
         #app.helpers.emit_job_status(user_id, "tables", "Failed,Server error")
     else:
         with Session() as session:
@@ -106,7 +127,7 @@ def create_template(
             if coa_group_id == -1:
                 coa_group_id = app.helpers.create_coa(session, user_id, f"{template_info.title}_COA", data["account"])
 
-            # Step 3a: Create Template
+            # Step 3a: Create Template (the model is renamed .ftz if it's quantized)
             model_name = f"{secrets.token_hex(16)}.bin"
             new_template = db_models.Template(title=template_info.title, model_name=model_name, coa_group_id=coa_group_id)
             session.add(new_template)
@@ -115,39 +136,54 @@ def create_template(
             session.add(db_models.UserTemplateAccess(template_id=new_template.id, user_id=user_id, access_level="administrator"))
 
             # Step 3b: Add transactions to database
-            transactions = [db_models.Transaction(description=row['description'], account=row["account"], amount=row['amount'], template_id=new_template.id) for row in data.iter_rows(named=True)]
-            session.add_all(transactions)
+            with app.metrics.stage("insert"):
+                app.helpers.bulk_insert(
+                    session,
+                    db_models.Transaction.__table__,
+                    data.with_columns(pl.lit(new_template.id).alias("template_id"))
+                )
 
             # Step 4: Train Fasttext models on transactions
-            cleaned_data = app.helpers.clean_data(data)
-
-            lines = [
-                f"__label__{t['account']} {t['description']}"
-                for t in cleaned_data.iter_rows(named=True)
-            ]
+            with app.metrics.stage("clean"):
+                cleaned_data = app.helpers.clean_data(data)
         
-            with tempfile.NamedTemporaryFile(mode="w", suffix=".txt") as train_fp, \
-            tempfile.NamedTemporaryFile(mode="w", suffix=".bin") as model_fp:
+            with tempfile.NamedTemporaryFile(mode="w", suffix=".bin") as model_fp:
                 try:
-                    train_fp.write("\n".join(lines))
-                    model = fasttext.train_supervised(input=train_fp.name, lr=FASTTEXT_LEARNING_RATE, epoch=FASTTEXT_EPOCH)
+                    with app.metrics.stage("train"):
+                        model = app.helpers.train_classifier(cleaned_data, lr=FASTTEXT_LEARNING_RATE, epoch=FASTTEXT_EPOCH, thread=FASTTEXT_THREADS)
+
+                    if app.quantization.FASTTEXT_QUANTIZE:
+                        with app.metrics.stage("quantize"):
+                            result = app.quantization.quantize(model, cleaned_data)
+                        if result is not None:
+                            model_name = app.quantization.quantized_model_name(model_name)
+                            new_template.model_name = model_name
+                            new_template.model_accuracy, new_template.quantized_accuracy_delta = result
 
                     # Step 5: Upload model to S3
-                    model.save_model(model_fp.name)
-                    response = s3_client.upload_file(model_fp.name, os.getenv("BUCKET_NAME"), model_name)
+                    with app.metrics.stage("upload"):
+                        model.save_model(model_fp.name)
+                        app.storage.upload_file(model_fp.name, model_name, s3_client)
                 except ClientError as e:
-                    print(f"ERROR: {e}")
+                    logger.exception(f"Couldn't upload model {model_name}")
                     app.helpers.emit_job_status(user_id, "tables", f"Failed,Couldn't upload your template")
                     return
                 except Exception as e:
-                    print(f"ERROR: 1 {e}")
+                    logger.exception(f"Couldn't train model {model_name}")
                     app.helpers.emit_job_status(user_id, "tables", f"Failed,Server error")
                     return
             
             # delete transactions file
             app.helpers.delete_s3_object(s3_client, s3_object_key)
  
+            template_id = new_template.id
             session.commit()
+
+            # the training data is at hand, so index it now instead of on the first classification
+            try:
+                app.label_index.store_index(get_redis_connection(), template_id, app.label_index.build_index(cleaned_data))
+            except Exception as e:
+                logger.exception(f"Couldn't build the label index of template {template_id}")
             return
 
 def process_transactions_task(
@@ -160,14 +196,15 @@ def process_transactions_task(
     """
     s
     """
-    s3_client = boto3.Session().client("s3")
+    s3_client = app.storage.get_s3_client()
     redis_client = get_redis_connection()
     
     # Obtain transactions file from S3
     file_ext = os.path.splitext(object_key)[1]
     with tempfile.NamedTemporaryFile(mode="wb", suffix=file_ext, delete=False) as upload_file_fp:
         try:
-            s3_client.download_fileobj(os.getenv('BUCKET_NAME'), object_key, upload_file_fp)
+            with app.metrics.stage("download"):
+                app.storage.download_fileobj(object_key, upload_file_fp, s3_client)
         except ClientError as e:
             os.remove(upload_file_fp.name)
             app.helpers.emit_job_status(user_id, "tables", "Failed,Server error")
@@ -176,15 +213,16 @@ def process_transactions_task(
 
     # Enter file contents to polars dataframe
     try:
-        lf = (
-            pl.scan_csv(
+        with app.metrics.stage("read"):
+            lf = app.readers.scan_upload(
                 transactions_filepath,
-                with_column_names=lambda cols: [col.lower() for col in cols]
+                file_ext,
+                columns=["description", "amount", "date", "number", "payee"]
             )
-        )
     except Exception as e:
+        os.remove(transactions_filepath)
         app.helpers.emit_job_status(user_id, "tables", "Failed,Server Error")
-        raise HTTPException(status_code=400, detail=f"Invalid CSV file: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid transactions file: {e}")
 
     lf_columns = set(lf.collect_schema().names())
     missing_columns = {"description", "amount"} - lf_columns
@@ -203,54 +241,67 @@ def process_transactions_task(
     if "payee" not in lf_columns:
         lf = lf.with_columns(pl.lit("").alias("payee"))
 
-    data = (
-        lf
-        .select(["description", "amount"])
-        .collect()
-    )
+    # CSV files above the streaming threshold are classified batch by batch in bounded memory,
+    # so only check that they aren't empty here (XLSX files are already read into memory)
+    streaming = file_ext == ".csv" and os.path.getsize(transactions_filepath) > app.streaming.STREAMING_THRESHOLD_BYTES
+    with app.metrics.stage("collect"):
+        data = lf.select(["description", "amount"]).head(1).collect() if streaming else lf.collect()
 
     if data.is_empty():
         raise HTTPException(status_code=400, detail="Transaction file is empty")
 
-    # download fasttext model from s3
-    with tempfile.NamedTemporaryFile(mode="wb", suffix=".bin", delete=False) as model_fp:
-        try:
-            s3_client.download_fileobj(os.getenv('BUCKET_NAME'), model_name, model_fp)
-        except ClientError as e:
-            os.remove(model_fp.name)
-            raise HTTPException(status_code=500, detail=f"Failed to download model from S3: {e}")
-        model_path = model_fp.name
+    # the template's model may have been replaced (see app.quantization) since the job
+    # was queued, so load the one it points at now; model_name is only a fallback
+    with Session() as session:
+        template = session.get(db_models.Template, template_id)
+        if template is not None:
+            model_name = template.model_name
 
+    # load fasttext model, skipping the download and load when it's already cached
     try:
-        model = fasttext.load_model(model_path)
-    except Exception as e:
-        os.remove(model_path)
-        raise
+        with app.metrics.stage("load_model"):
+            model = app.model_cache.get_model(s3_client, model_name)
+    except ClientError as e:
+        app.helpers.emit_job_status(user_id, "tables", "Failed,Server error")
+        raise HTTPException(status_code=500, detail=f"Failed to download model from S3: {e}")
 
-    # Classify transactions
+    # descriptions the template already has confirmed accounts for skip the model
     try:
-        descriptions = data['description']
-        account, prediction_confidence, simplified_descriptions, group = app.helpers.classify(descriptions, model)
-        data = data.with_columns([account, prediction_confidence, simplified_descriptions,group]).lazy()
-        lf = lf.join(data, on='description', how='left')
+        with app.metrics.stage("load_label_index"):
+            label_index = app.label_index.get_index(redis_client, template_id)
     except Exception as e:
-        app.helpers.emit_job_status(user_id, "tables", f"Failed,Server error")
-        raise
-    finally:
-        os.remove(model_path)
+        logger.exception(f"Couldn't load the label index of template {template_id}")
+        label_index = None
 
-    try:
-        response = s3_client.delete_object(Bucket=os.getenv('BUCKET_NAME'), Key=object_key)
-    except Exception as e:
-        print(e)
+    # Classify transactions. Streamed results stay a LazyFrame over Parquet files in
+    # output_dir until the session store has sunk them, so the whole table is never
+    # collected in memory.
+    with tempfile.TemporaryDirectory() as output_dir:
+        try:
+            if streaming:
+                with app.metrics.stage("classify_batches"):
+                    df = app.streaming.classify_in_batches(lf, model, output_dir, label_index=label_index)
+            else:
+                # classify times its normalize, predict and group stages itself. Its results line up
+                # with the rows, so they're attached positionally rather than joined on description
+                # (a join would multiply the rows of every repeated description).
+                descriptions = data['description']
+                account, prediction_confidence, simplified_descriptions, group = app.helpers.classify(descriptions, model, label_index)
+                df = data.with_columns([account, prediction_confidence, simplified_descriptions, group])
+        except Exception as e:
+            app.helpers.emit_job_status(user_id, "tables", f"Failed,Server error")
+            raise
+        finally:
+            os.remove(transactions_filepath)
 
-    serialized_lf = lf.serialize()
-    redis_client.hset(f'user-session:{access_token}', mapping={
-        "template_id": template_id,
-        "data": serialized_lf
-    })
+        try:
+            response = s3_client.delete_object(Bucket=os.getenv('BUCKET_NAME'), Key=object_key)
+        except Exception as e:
+            logger.warning(f"Couldn't delete {object_key}: {e}")
 
-    redis_client.expire(f'user-session:{access_token}', 10800) # 3 hours
+        # store the materialized table, so it no longer depends on the temp files
+        with app.metrics.stage("save_session"):
+            app.session_store.create_session(redis_client, access_token, template_id, df)
 
     app.helpers.emit_job_status(
         user_id,
@@ -266,46 +317,42 @@ def create_export_file(
     export_type: str,
 ):
     redis_client = get_redis_connection()
-    s3_client = boto3.Session().client("s3")
-    serialized_lf = redis_client.hget(f'user-session:{access_token}', 'data')
-
-    if not serialized_lf:
-        app.helpers.emit_job_status(user_id, "download", "Failed,Server error")
+    s3_client = app.storage.get_s3_client()
+    try:
+        export_format = app.exporters.get_format(export_type)
+    except ValueError as e:
+        app.helpers.emit_job_status(user_id, "download", "Failed,Invalid file type")
+        return
 
     try:
-        lf = pl.LazyFrame.deserialize(io.BytesIO(serialized_lf))
+        with app.metrics.stage("load_session"):
+            session_data = app.session_store.load_session_table_digest(redis_client, access_token)
     except Exception as e:
+        app.helpers.emit_job_status(user_id, "download", "Failed,Server error")
         raise HTTPException(status_code=500)
 
-    lf_columns = set(lf.collect_schema().names())
-    export_columns = list(lf_columns - {"amount_right", "simplified_descriptions"})
-    data = (
-        lf
-        .select(export_columns)
-        .collect()
-    )
-
-    file_ext = "." + export_type
-    with tempfile.NamedTemporaryFile(mode="wb", suffix=file_ext) as fp:
-        match export_type:
-            case "xlsx":
-                data.write_excel(workbook=fp)
-            case "csv":
-                data.write_csv(fp)
-            case "_":
-                app.helpers.emit_job_status(user_id, "download", "Failed,Invalid file type") 
-                return
-                
-        try:
-            filename = os.path.basename(fp.name)
-            response = s3_client.upload_file(fp.name, os.getenv("BUCKET_NAME"), filename)
-            app.helpers.emit_job_status(user_id, "download", f"Success,{filename}") # optionally split like os.path.splitext(fp.name)[0]
-        except ClientError as e:
-            app.helpers.emit_job_status(user_id, "download", "Failed,Server error")  
-        else:
-            print(filename)
-            return           
-    
+    if session_data is None:
+        app.helpers.emit_job_status(user_id, "download", "Failed,Server error")
+        return
+
+    # the file is addressed by the exported table's content, an identical export may already exist
+    df, data_digest = session_data
+    cache_key = app.exporters.export_cache_key(data_digest, export_type)
+    filename = redis_client.get(cache_key)
+    if filename is not None and app.storage.object_exists(filename.decode("utf-8"), s3_client):
+        app.helpers.emit_job_status(user_id, "download", f"Success,{filename.decode('utf-8')}")
+        return
+
+    # written batch by batch straight into a multipart upload, without a local file
+    data = app.exporters.export_table(df)
+    filename = app.exporters.export_object_key(data_digest, export_type, data.columns)
+    try:
+        with app.metrics.stage("export"), app.storage.StreamingUpload(filename, s3_client, content_type=export_format.content_type) as upload:
+            export_format.write(data, upload)
+    except Exception as e:
+        # writer errors (unsupported dtypes, XLSX row limits) abort the upload just like S3 errors
+        app.helpers.emit_job_status(user_id, "download", "Failed,Server error")
+        raise
 
-    
-    
\ No newline at end of file
+    redis_client.set(cache_key, filename, ex=app.exporters.EXPORT_CACHE_TTL_SECONDS)
+    app.helpers.emit_job_status(user_id, "download", f"Success,{filename}")
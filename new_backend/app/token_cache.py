@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from redis import Redis
+
+# Cache of validated bearer tokens, so authenticated requests don't query the
+# User/Account tables every time. Entries are keyed by the token's sha256 (raw
+# tokens are never stored) and expire no later than the account's
+# access_expiration. Tier 1 is an in-process LRU; tier 2 is Redis, shared by
+# every API process, and on by default whenever REDIS_URL is set. Sign-out
+# removes the token from Redis and publishes its key on
+# TOKEN_CACHE_REVOCATION_CHANNEL; every process listens there (from a background
+# thread) and drops the key from its tier 1. Revocations published while a
+# listener is disconnected are lost, so it clears its tier 1 whenever it
+# (re)subscribes. Without Redis, other processes may keep serving their tier 1
+# entry for up to TOKEN_CACHE_LOCAL_TTL_SECONDS.
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", 10000))
+TOKEN_CACHE_LOCAL_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_LOCAL_TTL_SECONDS", 30))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", 300))
+TOKEN_CACHE_USE_REDIS = os.getenv("TOKEN_CACHE_USE_REDIS", "true" if os.getenv("REDIS_URL") else "false").lower() in ("1", "true", "yes")
+TOKEN_CACHE_REVOCATION_CHANNEL = os.getenv("TOKEN_CACHE_REVOCATION_CHANNEL", "auth-token-revoked")
+TOKEN_CACHE_RETRY_SECONDS = 1
+TOKEN_CACHE_MAX_RETRY_SECONDS = 30
+
+logger = logging.getLogger(__name__)
+
+def token_hash(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+def token_key(access_token: str) -> str:
+    return f'auth-token:{token_hash(access_token)}'
+
+def expiration_timestamp(expiration: datetime) -> float:
+    """UTC timestamp of an access_expiration value (naive values are stored in UTC)"""
+    if expiration.tzinfo is None:
+        expiration = expiration.replace(tzinfo=timezone.utc)
+    return expiration.timestamp()
+
+class TokenCache:
+    """Maps token hashes to the owning user's fields until the token (or the cache entry) expires"""
+
+    def __init__(
+        self,
+        redis_client: Redis | None = None,
+        max_entries: int = TOKEN_CACHE_MAX_ENTRIES,
+        local_ttl_seconds: float = TOKEN_CACHE_LOCAL_TTL_SECONDS,
+        ttl_seconds: int = TOKEN_CACHE_TTL_SECONDS,
+        revocation_channel: str = TOKEN_CACHE_REVOCATION_CHANNEL
+    ):
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.local_ttl_seconds = local_ttl_seconds
+        self.ttl_seconds = ttl_seconds
+        self.revocation_channel = revocation_channel
+        self._entries: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self.subscribed = threading.Event()
+
+    def get(self, access_token: str) -> dict | None:
+        """Returns the cached user fields for a token, or None on a miss"""
+        self._ensure_listening()
+        key = token_key(access_token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+                del self._entries[key]
+
+        if self.redis_client is None:
+            return None
+
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.get(key)
+            pipe.ttl(key)
+            value, ttl = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Token cache unavailable: {e}")
+            return None
+
+        if value is None or ttl <= 0:
+            return None
+
+        fields = json.loads(value)
+        self._insert(key, fields, now + min(ttl, self.local_ttl_seconds))
+        return fields
+
+    def set(self, access_token: str, fields: dict, expiration: datetime) -> None:
+        """Caches a validated token's user fields, never past the token's expiration"""
+        self._ensure_listening()
+        key = token_key(access_token)
+        now = time.time()
+        expires_at = min(expiration_timestamp(expiration), now + self.ttl_seconds)
+        if expires_at <= now:
+            return
+
+        self._insert(key, fields, min(expires_at, now + self.local_ttl_seconds))
+
+        if self.redis_client is not None:
+            try:
+                # whole seconds, rounded down so the entry never outlives the token
+                ttl = int(expires_at - now)
+                if ttl > 0:
+                    self.redis_client.set(key, json.dumps(fields), ex=ttl)
+            except Exception as e:
+                logger.warning(f"Token cache unavailable: {e}")
+
+    def invalidate(self, access_token: str) -> None:
+        key = token_key(access_token)
+        with self._lock:
+            self._entries.pop(key, None)
+
+        if self.redis_client is not None:
+            try:
+                pipe = self.redis_client.pipeline()
+                pipe.delete(key)
+                pipe.publish(self.revocation_channel, key)
+                pipe.execute()
+            except Exception as e:
+                # the entry still expires with its TTL, at most TOKEN_CACHE_TTL_SECONDS later
+                logger.warning(f"Token cache unavailable: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _ensure_listening(self) -> None:
+        # the listener thread belongs to one process, a forked child starts its own
+        if self.redis_client is None or self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self.subscribed = threading.Event()
+            threading.Thread(target=self._listen, name="token-revocations", daemon=True).start()
+            self._listener_pid = os.getpid()
+
+    def _listen(self) -> None:
+        """Drops tokens revoked by other processes from tier 1"""
+        retry_seconds = TOKEN_CACHE_RETRY_SECONDS
+        while True:
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.revocation_channel)
+                # revocations sent before this point never reach us
+                self.clear()
+                self.subscribed.set()
+                retry_seconds = TOKEN_CACHE_RETRY_SECONDS
+                for message in pubsub.listen():
+                    with self._lock:
+                        self._entries.pop(message["data"].decode("utf-8"), None)
+            except Exception as e:
+                logger.warning(f"Token revocation listener disconnected, retrying in {retry_seconds}s: {e}")
+                self.subscribed.clear()
+                time.sleep(retry_seconds)
+                retry_seconds = min(retry_seconds * 2, TOKEN_CACHE_MAX_RETRY_SECONDS)
+
+    def _insert(self, key: str, fields: dict, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (fields, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,86 @@
+import sys
+import time
+import argparse
+import polars as pl
+import app.normalization
+from app.synthetic import generate_transactions
+
+# Checks that app.normalization.normalize gives exactly the output of the
+# original normalization pipeline (one replace_all per step) and compares their
+# speed. tests/test_normalization.py runs the same comparison on a smaller
+# corpus. Run from new_backend/ after changing the normalization rules or steps:
+#
+#   python -m benchmarks.golden --rows 200000
+#
+# exits 1 and prints the differing descriptions on a mismatch.
+
+# inputs that exercise the overlapping and context dependent noise rules
+EDGE_CASES = [
+    None, "", "   ", "...", "\t\n", "PAY", "Payments", "REPAYMENT", "epaymts", "prepayment",
+    "xyzpayment", "paymentx", "WebPayment", "merchant payment", "MERCHANT   WEBPAYMENT",
+    "merchantpayment", "mobile purchase", "mobilepurchase", "PURCHASE AUTHORIZED ON 01/02",
+    "purchase at target", "purchase atlanta", "purchases -visa", "purchase\tauthorizedx",
+    "cash app", "CASH    APP*JOHN", "cashapp", "ach billpay", "achbillpay", "ACH-BILLPAY",
+    "https://example.com/path?q=1 AMAZON", "http://a.b.c", "xhttps://x.com", "www.site.com shop",
+    "site.com/extra stuff", "AT&T", "SQ *BLUE BOTTLE", "sq*blue", "squ", "123ca", "ca123",
+    "7-11", "7-111", "xx", "XXXX1234", "boxx", "EXXONMOBIL", "xx12ab", "1234xx", "#1234",
+    "ref#99999", "card 1234 ref 5678", "ONLINE TRANSFER FROM CHK 1234", "in in in",
+    "café pay", "café ca", "pay ca", " debit ", "straße 123", "٣٣٣ digits",
+    "naïve_paid", "under_score pay_ment", "PAID.", ".paid.", "TX.", "WA.NY", "amp;the",
+]
+
+def reference_normalize(descriptions: pl.Series) -> pl.Series:
+    """The original normalization pipeline: NOISE_PATTERN as one regex scan"""
+    return (
+        descriptions
+        .fill_null("")
+        .str.to_lowercase()
+        .str.strip_chars()
+        .str.replace_all(r"\.", ' ')
+        .str.replace_all(app.normalization.NOISE_PATTERN, ' ')
+        .str.replace_all(r'\s+', ' ')
+        .str.strip_chars()
+    )
+
+def corpus(rows: int, seeds: int) -> pl.Series:
+    edge_cases = pl.Series("description", EDGE_CASES, dtype=pl.String)
+    generated = [generate_transactions(rows, seed)["description"] for seed in range(seeds)]
+    return pl.concat([edge_cases, *generated])
+
+def best_time(func, descriptions: pl.Series, repeat: int) -> float:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(descriptions)
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare normalization against the reference pipeline")
+    parser.add_argument("--rows", type=int, default=100000, help="synthetic rows per seed")
+    parser.add_argument("--seeds", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    descriptions = corpus(args.rows, args.seeds)
+    expected = reference_normalize(descriptions)
+    actual = app.normalization.normalize(descriptions)
+
+    mismatches = pl.DataFrame({"description": descriptions, "expected": expected, "actual": actual}).filter(
+        pl.col("expected") != pl.col("actual")
+    )
+    if not mismatches.is_empty():
+        print(f"{mismatches.height} of {descriptions.len():,} descriptions differ")
+        with pl.Config(tbl_rows=20, fmt_str_lengths=80):
+            print(mismatches.head(20))
+        return 1
+
+    reference_seconds = best_time(reference_normalize, descriptions, args.repeat)
+    seconds = best_time(app.normalization.normalize, descriptions, args.repeat)
+    print(f"{descriptions.len():,} descriptions identical")
+    print(f"reference {descriptions.len() / reference_seconds:>12,.0f} rows/sec")
+    print(f"normalize {descriptions.len() / seconds:>12,.0f} rows/sec ({reference_seconds / seconds:.2f}x)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from app.synthetic import generate_transactions
+from benchmarks.stages import STAGES
+
+# Runs the pipeline stage benchmarks on synthetic transactions of each size and
+# prints rows/sec and peak memory per stage. Run from new_backend/:
+#
+#   python -m benchmarks.run --sizes 10000,100000,1000000 --output results.json
+#   python -m benchmarks.run --baseline results.json   # fails on regressions
+#
+# Memory regressions are judged on run_rss_mb, the memory each timed run added
+# (see benchmarks/stages.py), not the process peak, which includes setup.
+# Generated data is cached in --data-dir, keyed by size and seed.
+
+def data_path(data_dir: str, rows: int, seed: int) -> str:
+    path = os.path.join(data_dir, f"transactions-{rows}-{seed}.parquet")
+    if not os.path.exists(path):
+        generate_transactions(rows, seed).write_parquet(path)
+    return path
+
+def run_stage(stage: str, path: str) -> dict:
+    # a fresh interpreter per measurement, so peak memory isn't carried over
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.stages", stage, path],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def regressions(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """Stages whose throughput dropped, or run memory grew, by more than tolerance against baseline"""
+    previous = {(r["stage"], r["rows"]): r for r in baseline}
+    found = []
+    for result in results:
+        before = previous.get((result["stage"], result["rows"]))
+        if before is None:
+            continue
+        if result["rows_per_sec"] < before["rows_per_sec"] * (1 - tolerance):
+            found.append(f"{result['stage']} @ {result['rows']} rows: {before['rows_per_sec']:,.0f} -> {result['rows_per_sec']:,.0f} rows/sec")
+        # baselines recorded before run_rss_mb existed only have the process peak
+        if "run_rss_mb" in before and result["run_rss_mb"] > before["run_rss_mb"] * (1 + tolerance):
+            found.append(f"{result['stage']} @ {result['rows']} rows: {before['run_rss_mb']:,.0f} -> {result['run_rss_mb']:,.0f} MiB used by the run")
+    return found
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the classification pipeline stages")
+    parser.add_argument("--sizes", default="10000,100000", help="comma separated row counts")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma separated stage names")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="keep the fastest of n runs")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "benchmark_data"))
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    stages = args.stages.split(",")
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    results = []
+    print(f"{'stage':<16} {'rows':>10} {'seconds':>9} {'rows/sec':>12} {'run MiB':>9} {'peak MiB':>9}")
+    for rows in (int(size) for size in args.sizes.split(",")):
+        path = data_path(args.data_dir, rows, args.seed)
+        for stage in stages:
+            result = min((run_stage(stage, path) for _ in range(args.repeat)), key=lambda r: r["seconds"])
+            results.append(result)
+            print(f"{stage:<16} {rows:>10,} {result['seconds']:>9.3f} {result['rows_per_sec']:>12,.0f} {result['run_rss_mb']:>9,.0f} {result['peak_rss_mb']:>9,.0f}")
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            found = regressions(results, json.load(fp), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        return 1 if found else 0
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import gc
+import sys
+import json
+import time
+import resource
+import polars as pl
+import app.tasks
+import app.helpers
+import app.session_store
+import app.label_index
+
+# Pipeline stages measured by benchmarks/run.py. Each stage has a setup, which
+# isn't timed, and a run. A stage is measured in its own process, so the peak
+# resident memory (ru_maxrss) reported is that stage's alone:
+#
+#   python -m benchmarks.stages <stage> <data.parquet>
+#
+# prints one JSON object with the rows, seconds, rows/sec and peak memory.
+# run_rss_mb is the memory the run itself added: its peak above the resident
+# memory it started with. On Linux the peak is reset after setup (through
+# /proc/self/clear_refs), so spikes during setup, such as training a model,
+# don't hide it; elsewhere only growth past the setup's peak is seen.
+
+# the classify stage predicts with a small model trained on this many rows
+CLASSIFY_MODEL_ROWS = 20000
+CLASSIFY_MODEL_EPOCH = 5
+
+def setup_clean_data(df: pl.DataFrame):
+    return df.select(["description", "account", "amount"])
+
+def run_clean_data(data: pl.DataFrame):
+    return app.helpers.clean_data(data)
+
+def setup_simplify(df: pl.DataFrame):
+    return df["description"]
+
+def run_simplify(descriptions: pl.Series):
+    return app.helpers.simplify_descriptions(descriptions)
+
+def setup_simplify_cached(df: pl.DataFrame):
+    # a repeat upload: every description is already in the normalization cache
+    app.helpers.simplify_descriptions(df["description"])
+    return df["description"]
+
+def setup_group(df: pl.DataFrame):
+    # classify groups each distinct simplified description once
+    return app.helpers.simplify_descriptions(df["description"]).unique().sort()
+
+def run_group(descriptions: pl.Series):
+    return app.helpers.group(descriptions, descriptions.len())
+
+def setup_classify(df: pl.DataFrame):
+    sample = app.helpers.clean_data(df.head(CLASSIFY_MODEL_ROWS))
+    model = app.helpers.train_classifier(sample, lr=app.tasks.FASTTEXT_LEARNING_RATE, epoch=CLASSIFY_MODEL_EPOCH, thread=app.tasks.FASTTEXT_THREADS)
+    return df["description"], model
+
+def run_classify(state):
+    descriptions, model = state
+    return app.helpers.classify(descriptions, model)
+
+def setup_classify_indexed(df: pl.DataFrame):
+    # descriptions labeled in the training sample are answered by the label index
+    sample = app.helpers.clean_data(df.head(CLASSIFY_MODEL_ROWS))
+    model = app.helpers.train_classifier(sample, lr=app.tasks.FASTTEXT_LEARNING_RATE, epoch=CLASSIFY_MODEL_EPOCH, thread=app.tasks.FASTTEXT_THREADS)
+    return df["description"], model, app.label_index.build_index(sample)
+
+def run_classify_indexed(state):
+    descriptions, model, label_index = state
+    return app.helpers.classify(descriptions, model, label_index)
+
+def setup_train(df: pl.DataFrame):
+    return app.helpers.clean_data(df.select(["description", "account", "amount"]))
+
+def run_train(cleaned_data: pl.DataFrame):
+    return app.helpers.train_classifier(
+        cleaned_data,
+        lr=app.tasks.FASTTEXT_LEARNING_RATE,
+        epoch=app.tasks.FASTTEXT_EPOCH,
+        thread=app.tasks.FASTTEXT_THREADS
+    )
+
+def setup_session_store(df: pl.DataFrame):
+    return df
+
+def run_session_store(df: pl.DataFrame):
+    return app.session_store.decode_table(app.session_store.encode_table(df))
+
+STAGES = {
+    "clean_data": (setup_clean_data, run_clean_data),
+    "simplify": (setup_simplify, run_simplify),
+    "simplify_cached": (setup_simplify_cached, run_simplify),
+    "group": (setup_group, run_group),
+    "classify": (setup_classify, run_classify),
+    "classify_indexed": (setup_classify_indexed, run_classify_indexed),
+    "train": (setup_train, run_train),
+    "session_store": (setup_session_store, run_session_store),
+}
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _proc_status_mb(field: str) -> float | None:
+    try:
+        with open("/proc/self/status") as fp:
+            for line in fp:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024 # kB
+    except OSError:
+        pass
+    return None
+
+def reset_peak_rss() -> bool:
+    """Resets the process's resident memory high water mark (VmHWM), where the OS allows it"""
+    try:
+        with open("/proc/self/clear_refs", "w") as fp:
+            fp.write("5")
+    except OSError:
+        return False
+    return _proc_status_mb("VmHWM") is not None
+
+def measure(stage: str, data_path: str) -> dict:
+    setup, run = STAGES[stage]
+    df = pl.read_parquet(data_path)
+    state = setup(df)
+    setup_rss = peak_rss_mb()
+
+    gc.collect()
+    reset = reset_peak_rss()
+    start_rss = _proc_status_mb("VmRSS") if reset else setup_rss
+
+    start = time.perf_counter()
+    run(state)
+    seconds = time.perf_counter() - start
+    run_peak = _proc_status_mb("VmHWM") if reset else peak_rss_mb()
+
+    return {
+        "stage": stage,
+        "rows": df.height,
+        "seconds": seconds,
+        "rows_per_sec": df.height / seconds if seconds else float("inf"),
+        "setup_rss_mb": setup_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "run_rss_mb": max(run_peak - start_rss, 0.0),
+    }
+
+if __name__ == "__main__":
+    print(json.dumps(measure(sys.argv[1], sys.argv[2])))
@@ -5,17 +5,21 @@ import sqlalchemy.orm as so
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 import app.models.database_models as db_models
+from app.helpers import bulk_insert
+from app.synthetic import generate_transactions
 
 load_dotenv()
 ph = argon2.PasswordHasher()
 filepath = os.path.join(os.getcwd(), "fake_transactionsx7.csv")
+# without the seed file, generate transactions (python -m app.synthetic writes one)
+seed_rows = int(os.getenv("SEED_TRANSACTIONS", 100000))
 engine = create_engine(os.getenv("DATABASE_URL"))
 Session = so.sessionmaker(engine)
 
 with Session() as session:
     try:
         data = (
-            pl.scan_csv(filepath)
+            (pl.scan_csv(filepath) if os.path.exists(filepath) else generate_transactions(seed_rows).lazy())
             .select(
                 pl.col("description"),
                 pl.col("account"),
@@ -49,11 +53,11 @@ with Session() as session:
         )
 
         # Populate COA group
-        coa_items = [
-            db_models.COA(group_id=coa_group.group_id, account=account) 
-            for account in data.get_column("account").unique().to_list()
-        ]
-        session.add_all(coa_items)
+        coa_items = (
+            data.select(pl.col("account").unique())
+            .with_columns(pl.lit(coa_group.group_id).alias("group_id"))
+        )
+        bulk_insert(session, db_models.COA.__table__, coa_items)
 
         # Create generic starter template
         new_template = db_models.Template(title="Generic", model_name="generic.bin", coa_group_id=coa_group.group_id)
@@ -64,8 +68,11 @@ with Session() as session:
         session.add(db_models.UserTemplateAccess(template_id=new_template.id, user_id=user.id, access_level="administrator"))
 
         # Add transactions for future training
-        transactions = [db_models.Transaction(description=row['description'], account=row["account"], amount=row['amount'], template_id=new_template.id) for row in data.iter_rows(named=True)]
-        session.add_all(transactions)
+        bulk_insert(
+            session,
+            db_models.Transaction.__table__,
+            data.with_columns(pl.lit(new_template.id).alias("template_id"))
+        )
     except Exception as e:
         session.rollback()
         print(e)
@@ -0,0 +1,31 @@
+import os
+
+# app.dependencies builds its clients at import, so point them at stand-ins
+# before any test module imports the app
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("BUCKET_NAME", "test-bucket")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import pytest
+from moto import mock_aws
+import app.storage
+
+@pytest.fixture
+def s3_client():
+    """A moto backed S3 bucket, shared through app.storage's process-wide client"""
+    with mock_aws():
+        app.storage._client = None
+        client = app.storage.get_s3_client()
+        client.create_bucket(Bucket=app.storage.bucket_name())
+        yield client
+        app.storage._client = None
+
+@pytest.fixture(scope="session")
+def model():
+    """A small fastText classifier trained on synthetic transactions"""
+    import app.helpers
+    from app.synthetic import generate_transactions
+    cleaned = app.helpers.clean_data(generate_transactions(3000, seed=1))
+    return app.helpers.train_classifier(cleaned, lr=0.5, epoch=5, thread=1)
@@ -0,0 +1,219 @@
+import pytest
+import fakeredis
+import polars as pl
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import app.jobs
+import app.tasks
+import app.helpers
+import app.storage
+import app.exporters
+import app.label_index
+import app.session_store
+import app.models.database_models as db_models
+from app import create_app
+from app.dependencies import current_user, get_async_session, get_async_redis_connection
+
+ACCESS_TOKEN = "test-token"
+USER_ID = 1
+TEMPLATE_ID = 1
+
+@pytest.fixture
+def database_url(tmp_path):
+    """A sqlite file with one user who administers one template"""
+    path = tmp_path / "app.db"
+    engine = sa.create_engine(f"sqlite:///{path}")
+    db_models.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(sa.insert(db_models.User), [{"id": USER_ID, "name": "user", "email": "user@example.com", "image": ""}])
+        connection.execute(sa.insert(db_models.COAIDtoGroup), [{"group_id": 1, "group_name": "coa"}])
+        connection.execute(sa.insert(db_models.COA), [{"group_id": 1, "account": "Groceries"}, {"group_id": 1, "account": "Dining"}])
+        connection.execute(sa.insert(db_models.Template), [{"id": TEMPLATE_ID, "title": "template", "model_name": "model.bin", "coa_group_id": 1}])
+        connection.execute(
+            sa.insert(db_models.UserTemplateAccess),
+            [{"template_id": TEMPLATE_ID, "user_id": USER_ID, "access_level": "administrator"}]
+        )
+    engine.dispose()
+    return f"sqlite+aiosqlite:///{path}"
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+@pytest.fixture
+def client(database_url, redis_server, s3_client):
+    api = create_app()
+    sessionmaker = async_sessionmaker(create_async_engine(database_url), expire_on_commit=False)
+    async_redis = fakeredis.FakeAsyncRedis(server=redis_server)
+
+    async def async_session():
+        async with sessionmaker() as session:
+            yield session
+
+    api.dependency_overrides[get_async_session] = async_session
+    api.dependency_overrides[get_async_redis_connection] = lambda: async_redis
+    api.dependency_overrides[current_user] = lambda: {
+        "user": db_models.User(id=USER_ID, name="user", email="user@example.com", image=""),
+        "access_token": ACCESS_TOKEN,
+    }
+
+    with TestClient(api) as client:
+        yield client
+
+@pytest.fixture
+def session_table(redis_server):
+    """A classified table stored as the user's session"""
+    df = pl.DataFrame({
+        "date": ["2024-01-01", "2024-01-01", "2024-01-02"],
+        "number": ["", "", ""],
+        "payee": ["", "", ""],
+        "description": ["TRADER JOES", "TRADER JOES", "CAFE"],
+        "amount": [10.0, 10.0, 4.5],
+        "account": ["Groceries", "Groceries", "Dining"],
+        "prediction_confidence": ["High", "High", "Low"],
+        "simplified_descriptions": ["trader joes", "trader joes", "cafe"],
+        "group": [0, 0, 1],
+    })
+    app.session_store.create_session(fakeredis.FakeRedis(server=redis_server), ACCESS_TOKEN, TEMPLATE_ID, df)
+    return df
+
+def test_upload_transactions(client, redis_server, s3_client):
+    response = client.post(
+        "/api/users/transactions",
+        data={"template_id": TEMPLATE_ID},
+        files={"transactions_file": ("transactions.csv", b"description,amount\nCAFE,4.5\n", "text/csv")},
+    )
+    assert response.status_code == 200
+
+    objects = s3_client.list_objects_v2(Bucket=app.storage.bucket_name())["Contents"]
+    assert [item["Key"].endswith("_transactions.csv") for item in objects] == [True]
+
+    job = app.jobs.get_job(fakeredis.FakeRedis(server=redis_server), response.json()["job_id"])
+    assert job["type"] == "classify" and job["user_id"] == USER_ID
+
+def test_upload_rejects_unknown_template(client):
+    response = client.post(
+        "/api/users/transactions",
+        data={"template_id": 99},
+        files={"transactions_file": ("transactions.csv", b"description,amount\n", "text/csv")},
+    )
+    assert response.status_code == 401
+
+def test_get_tables(client, session_table):
+    response = client.get("/api/users/tables")
+    assert response.status_code == 200
+
+    # only the totals, the rows come a page at a time
+    body = response.json()
+    assert body["totals"] == {"itemized": 3, "summary": 2}
+    assert body["template"]["id"] == TEMPLATE_ID
+    assert body["options"] == ["Dining", "Groceries"]
+    assert "itemized" not in body and "summary" not in body
+
+def test_get_tables_without_session(client):
+    assert client.get("/api/users/tables").status_code == 400
+
+def test_get_table_page(client, session_table):
+    response = client.get("/api/users/tables/itemized", params={"limit": 2, "sort_by": "amount"})
+    assert response.status_code == 200
+
+    body = response.json()
+    assert body["total"] == 3
+    assert [row["amount"] for row in body["rows"]] == [4.5, 10.0]
+
+    response = client.get("/api/users/tables/itemized", params={"search": "cafe"})
+    assert response.json()["total"] == 1
+
+def test_edit_itemized_row(client, session_table):
+    response = client.put("/api/users/tables/itemized", json={"row_id": 1, "account": "Dining"})
+    assert response.status_code == 200
+
+    itemized = client.get("/api/users/tables/itemized").json()["rows"]
+    assert [row["account"] for row in itemized] == ["Groceries", "Dining", "Dining"]
+    summary = client.get("/api/users/tables/summary").json()["rows"]
+    assert [(row["group"], row["account"], row["instances"]) for row in summary] == [
+        (0, "Groceries", 1), (0, "Dining", 1), (1, "Dining", 1)
+    ]
+    assert client.get("/api/users/tables").json()["totals"] == {"itemized": 3, "summary": 3}
+
+def test_edit_unknown_row(client, session_table):
+    response = client.put("/api/users/tables/itemized", json={"row_id": 3, "account": "Dining"})
+    assert response.status_code == 404
+
+def set_access_level(database_url: str, access_level: str) -> None:
+    engine = sa.create_engine(database_url.replace("+aiosqlite", ""))
+    with engine.begin() as connection:
+        connection.execute(sa.update(db_models.UserTemplateAccess).values(access_level=access_level))
+    engine.dispose()
+
+def label_edits(redis_server) -> dict:
+    return fakeredis.FakeRedis(server=redis_server).hgetall(app.label_index.edits_key(TEMPLATE_ID))
+
+def test_administrator_edits_update_label_index(client, session_table, redis_server):
+    assert client.put("/api/users/tables/summary", json={"group": 1, "account": "Groceries"}).status_code == 200
+    assert label_edits(redis_server) == {b"cafe": b"Groceries"}
+
+@pytest.mark.parametrize("access_level", ["viewer", None])
+def test_other_users_edits_stay_in_their_session(client, session_table, redis_server, database_url, access_level):
+    set_access_level(database_url, access_level)
+
+    assert client.put("/api/users/tables/itemized", json={"row_id": 2, "account": "Groceries"}).status_code == 200
+    assert client.get("/api/users/tables/itemized").json()["rows"][2]["account"] == "Groceries"
+    assert label_edits(redis_server) == {}
+
+def test_download_reuses_existing_export(client, session_table, redis_server, s3_client, monkeypatch):
+    redis_client = fakeredis.FakeRedis(server=redis_server)
+    monkeypatch.setattr(app.tasks, "get_redis_connection", lambda: redis_client)
+    monkeypatch.setattr(app.helpers, "emit_job_status", lambda user_id, job_type, status: None)
+    app.tasks.create_export_file(USER_ID, ACCESS_TOKEN, "csv")
+
+    response = client.get("/api/users/documents", params={"export_type": "csv"})
+    assert response.json()["message"] == "Export ready"
+
+def test_download_requeues_deleted_export(client, session_table, redis_server, s3_client, monkeypatch):
+    redis_client = fakeredis.FakeRedis(server=redis_server)
+    monkeypatch.setattr(app.tasks, "get_redis_connection", lambda: redis_client)
+    monkeypatch.setattr(app.helpers, "emit_job_status", lambda user_id, job_type, status: None)
+    app.tasks.create_export_file(USER_ID, ACCESS_TOKEN, "csv")
+    [filename] = [item["Key"] for item in s3_client.list_objects_v2(Bucket=app.storage.bucket_name())["Contents"]]
+    s3_client.delete_object(Bucket=app.storage.bucket_name(), Key=filename)
+
+    response = client.get("/api/users/documents", params={"export_type": "csv"})
+    body = response.json()
+    assert body["message"] == "Processing export"
+    assert app.jobs.get_job(redis_client, body["job_id"])["type"] == "export"
+    assert not redis_client.keys("export-cache:*")
+
+def test_sign_out_without_redis(client, database_url, monkeypatch):
+    import app.routers.auth
+    from app.dependencies import get_session, token_cache
+
+    server = fakeredis.FakeServer()
+    server.connected = False
+    unavailable = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(app.routers.auth, "get_redis_connection", lambda: unavailable)
+    monkeypatch.setattr(token_cache, "redis_client", unavailable)
+
+    engine = sa.create_engine(database_url.replace("+aiosqlite", ""))
+    def sync_session():
+        with so.Session(engine) as session:
+            yield session
+    client.app.dependency_overrides[get_session] = sync_session
+
+    assert client.delete("/api/auth/tokens").status_code == 200
+    engine.dispose()
+
+def test_edit_after_session_expired(client, session_table, redis_server, monkeypatch):
+    # the session expires between loading the table and saving the edit
+    load_editable_session_async = app.session_store.load_editable_session_async
+    async def load_then_expire(redis_client, access_token):
+        session_data = await load_editable_session_async(redis_client, access_token)
+        await redis_client.delete(app.session_store.session_key(access_token))
+        return session_data
+    monkeypatch.setattr(app.session_store, "load_editable_session_async", load_then_expire)
+
+    response = client.put("/api/users/tables/itemized", json={"row_id": 0, "account": "Dining"})
+    assert response.status_code == 400
+    assert not fakeredis.FakeRedis(server=redis_server).exists(app.session_store.session_key(ACCESS_TOKEN))
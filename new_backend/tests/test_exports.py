@@ -0,0 +1,78 @@
+import pytest
+import fakeredis
+import polars as pl
+import app.tasks
+import app.helpers
+import app.storage
+import app.exporters
+import app.session_store
+
+ACCESS_TOKEN = "test-token"
+USER_ID = 1
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    redis_client = fakeredis.FakeRedis()
+    monkeypatch.setattr(app.tasks, "get_redis_connection", lambda: redis_client)
+    df = pl.DataFrame({
+        "date": ["2024-01-01", "2024-01-02"],
+        "description": ["TRADER JOES", "CAFE"],
+        "amount": [10.0, 4.5],
+        "account": ["Groceries", "Dining"],
+        "simplified_descriptions": ["trader joes", "cafe"],
+        "group": [0, 1],
+    })
+    app.session_store.create_session(redis_client, ACCESS_TOKEN, 1, df)
+    return redis_client
+
+@pytest.fixture
+def statuses(monkeypatch):
+    emitted = []
+    monkeypatch.setattr(app.helpers, "emit_job_status", lambda user_id, job_type, status: emitted.append((job_type, status)))
+    return emitted
+
+def test_export_uploads_file(s3_client, redis_client, statuses):
+    app.tasks.create_export_file(USER_ID, ACCESS_TOKEN, "csv")
+
+    [(job_type, status)] = statuses
+    assert job_type == "download" and status.startswith("Success,")
+    filename = status.split(",", 1)[1]
+    body = s3_client.get_object(Bucket=app.storage.bucket_name(), Key=filename)["Body"].read()
+    columns = ["date", "description", "amount", "account", "group"]
+    assert pl.read_csv(body).columns == columns
+    _, data_digest = app.session_store.load_session_table_digest(redis_client, ACCESS_TOKEN)
+    assert filename == app.exporters.export_object_key(data_digest, "csv", columns)
+    assert redis_client.get(app.exporters.export_cache_key(data_digest, "csv")) == filename.encode("utf-8")
+
+def test_export_key_follows_exported_columns():
+    key = app.exporters.export_object_key("digest", "csv", ["date", "description", "account"])
+    assert key != app.exporters.export_object_key("digest", "csv", ["date", "description", "account", "group"])
+    assert key != app.exporters.export_object_key("digest", "csv", ["description", "date", "account"])
+    assert key.endswith(".csv")
+
+def test_export_rebuilds_missing_file(s3_client, redis_client, statuses):
+    app.tasks.create_export_file(USER_ID, ACCESS_TOKEN, "csv")
+    filename = statuses[0][1].split(",", 1)[1]
+    s3_client.delete_object(Bucket=app.storage.bucket_name(), Key=filename)
+
+    app.tasks.create_export_file(USER_ID, ACCESS_TOKEN, "csv")
+    assert statuses[1] == ("download", f"Success,{filename}")
+    assert app.storage.object_exists(filename, s3_client)
+
+def test_export_writer_failure_aborts_upload(s3_client, redis_client, statuses, monkeypatch):
+    def write_broken(df, fileobj):
+        # more than a part, so a multipart upload is already open when the writer fails
+        fileobj.write(bytes(app.storage.S3_MIN_PART_BYTES + 1))
+        raise ValueError("unsupported dtype")
+
+    monkeypatch.setattr(app.storage, "S3_MULTIPART_CHUNK_BYTES", app.storage.S3_MIN_PART_BYTES)
+    monkeypatch.setitem(app.exporters.EXPORT_FORMATS, "csv", app.exporters.ExportFormat("csv", "text/csv", write_broken))
+
+    with pytest.raises(ValueError):
+        app.tasks.create_export_file(USER_ID, ACCESS_TOKEN, "csv")
+
+    assert statuses == [("download", "Failed,Server error")]
+    bucket = app.storage.bucket_name()
+    assert "Uploads" not in s3_client.list_multipart_uploads(Bucket=bucket)
+    assert "Contents" not in s3_client.list_objects_v2(Bucket=bucket)
+    assert not redis_client.keys("export-cache:*")
@@ -0,0 +1,121 @@
+import io
+import polars as pl
+import pytest
+import fakeredis
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from sqlalchemy.dialects import postgresql
+import app.tasks
+import app.helpers
+import app.storage
+import app.models.database_models as db_models
+from app.synthetic import generate_transactions
+
+@pytest.fixture
+def descriptions() -> pl.Series:
+    """Synthetic descriptions, most of them repeated, with nulls and empty strings"""
+    descriptions = generate_transactions(600, seed=5)["description"]
+    return descriptions.scatter([3, 40, 41, 300], None).scatter([7, 500], "")
+
+def predict_row(model, simplified: str) -> tuple[str, str]:
+    """One row the way the model was queried before descriptions were deduplicated"""
+    labels, probs = model.predict(simplified, k=1)
+    account = app.helpers.format_labels(pl.Series([labels[0].replace("__label__", "")]))[0]
+    confidence = "Low" if probs[0] < 0.4 else "Medium" if probs[0] < 0.7 else "High"
+    return account, confidence
+
+def test_classify_matches_per_row_predictions(descriptions, model):
+    accounts, confidences, simplified, groups = app.helpers.classify(descriptions, model)
+    assert accounts.len() == confidences.len() == simplified.len() == groups.len() == descriptions.len()
+    assert simplified.to_list() == app.helpers.simplify_descriptions(descriptions).to_list()
+
+    expected = [predict_row(model, description) for description in simplified.to_list()]
+    assert accounts.to_list() == [account for account, _ in expected]
+    assert confidences.to_list() == [confidence for _, confidence in expected]
+
+def test_classify_groups_repeated_descriptions_together(descriptions, model):
+    _, _, simplified, groups = app.helpers.classify(descriptions, model)
+    frame = pl.DataFrame({"simplified": simplified, "group": groups})
+    assert frame.group_by("simplified").agg(pl.col("group").n_unique())["group"].max() == 1
+
+    # the groups are those of the distinct descriptions, broadcast back to the rows
+    unique = frame.unique("simplified", maintain_order=True)
+    expected = app.helpers.group(unique["simplified"], unique.height)
+    pairs = pl.DataFrame({"a": unique["group"], "b": expected}).unique()
+    assert pairs.height == unique["group"].n_unique() == expected.n_unique()
+
+def test_classify_uses_label_index(descriptions, model):
+    simplified = app.helpers.simplify_descriptions(descriptions)
+    known = simplified.drop_nulls().filter(simplified.drop_nulls() != "").unique().sort().head(3)
+    label_index = pl.DataFrame({"simplified_descriptions": known, "account": ["Rent", "Taxes", "Travel"]})
+
+    accounts, confidences, _, _ = app.helpers.classify(descriptions, model, label_index)
+    for description, account, confidence in zip(simplified.to_list(), accounts.to_list(), confidences.to_list()):
+        if description in known.to_list():
+            assert (account, confidence) == (dict(zip(known.to_list(), ["Rent", "Taxes", "Travel"]))[description], "High")
+        else:
+            assert (account, confidence) == predict_row(model, description)
+
+def test_copy_statement_quotes_identifiers():
+    dialect = postgresql.dialect()
+    assert app.helpers.copy_statement(dialect, db_models.Transaction.__table__, ["description", "account"]) == (
+        'COPY transaction (description, account) FROM STDIN WITH (FORMAT csv)'
+    )
+
+    odd = sa.Table('odd "table', sa.MetaData(), sa.Column("Amount", sa.Float), sa.Column("select", sa.String))
+    assert app.helpers.copy_statement(dialect, odd, ["Amount", "select"]) == (
+        'COPY "odd ""table" ("Amount", "select") FROM STDIN WITH (FORMAT csv)'
+    )
+    with pytest.raises(KeyError):
+        app.helpers.copy_statement(dialect, odd, ['x" ) TO PROGRAM (\'true'])
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    db_models.Base.metadata.create_all(engine)
+    return so.sessionmaker(engine)
+
+def test_bulk_insert_in_chunks(session_factory):
+    data = pl.DataFrame({"group_id": [1] * 25, "account": [f"Account {i}" for i in range(25)]})
+    with session_factory() as session:
+        app.helpers.bulk_insert(session, db_models.COA.__table__, data, chunk_size=10)
+        session.commit()
+
+    with session_factory() as session:
+        assert session.scalars(sa.select(db_models.COA.account).order_by(db_models.COA.id)).all() == data["account"].to_list()
+
+def test_create_coa(session_factory):
+    with session_factory() as session:
+        group_id = app.helpers.create_coa(session, 1, "coa", pl.Series(["office supplies!", "Rent", "Rent"]))
+        session.commit()
+
+    with session_factory() as session:
+        assert sorted(session.scalars(sa.select(db_models.COA.account).where(db_models.COA.group_id == group_id))) == [
+            "Office Supplies", "Rent"
+        ]
+        access = session.get(db_models.UserCOAAccess, (1, group_id))
+        assert access.access_level == "administrator"
+
+def test_create_template(session_factory, s3_client, monkeypatch):
+    monkeypatch.setattr(app.tasks, "Session", session_factory)
+    monkeypatch.setattr(app.tasks, "get_redis_connection", lambda: fakeredis.FakeRedis())
+    monkeypatch.setattr(app.helpers, "emit_job_status", lambda user_id, job_type, status: None)
+    data = generate_transactions(500, seed=8).select("description", "account", "amount")
+    buffer = io.BytesIO()
+    data.write_csv(buffer)
+    app.storage.upload_fileobj(io.BytesIO(buffer.getvalue()), "template.csv", s3_client)
+
+    app.tasks.create_template({"title": "synthetic", "coa_group_id": -1}, 1, "template.csv")
+
+    with session_factory() as session:
+        template = session.scalars(sa.select(db_models.Template)).one()
+        assert template.title == "synthetic"
+        transactions = session.execute(
+            sa.select(db_models.Transaction.description, db_models.Transaction.account, db_models.Transaction.amount)
+            .where(db_models.Transaction.template_id == template.id)
+            .order_by(db_models.Transaction.id)
+        ).all()
+        assert pl.DataFrame(transactions, schema=data.schema, orient="row").equals(data)
+        accounts = session.scalars(sa.select(db_models.COA.account).where(db_models.COA.group_id == template.coa_group_id)).all()
+        assert len(accounts) == data["account"].n_unique()
+    assert app.storage.object_exists(template.model_name, s3_client)
@@ -0,0 +1,88 @@
+import pytest
+import fakeredis
+import app.jobs
+from app.jobs import JobType
+
+CALLS = []
+
+def record(name: str) -> None:
+    CALLS.append(name)
+
+def fail(message: str) -> None:
+    raise RuntimeError(message)
+
+JOB_TYPES = {
+    "urgent": JobType("tests.test_jobs.record", 0, 1),
+    "normal": JobType("tests.test_jobs.record", 1, 2),
+    "broken": JobType("tests.test_jobs.fail", 2, 1),
+}
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    monkeypatch.setattr(app.jobs, "JOB_TYPES", JOB_TYPES)
+    CALLS.clear()
+    return fakeredis.FakeRedis()
+
+def worker(redis_client, worker_id: str = "worker-1") -> app.jobs.Worker:
+    return app.jobs.Worker(redis_client, processes=0, job_types=JOB_TYPES, worker_id=worker_id)
+
+def test_runs_highest_priority_first(redis_client):
+    for job_type, name in [("normal", "n1"), ("urgent", "u1"), ("normal", "n2"), ("urgent", "u2")]:
+        app.jobs.enqueue(redis_client, job_type, 1, name)
+
+    worker(redis_client).run(max_jobs=4)
+    assert CALLS == ["u1", "u2", "n1", "n2"]
+
+def test_skips_job_types_at_their_limit(redis_client):
+    app.jobs.enqueue(redis_client, "urgent", 1, "u1")
+    normal_id = app.jobs.enqueue(redis_client, "normal", 1, "n1")
+
+    jobs = worker(redis_client)
+    jobs.running["urgent"] = 1 # its only slot is taken
+    assert jobs.available_queues() == [app.jobs.queue_key("normal"), app.jobs.queue_key("broken")]
+    assert jobs.next_job() == ("normal", normal_id)
+
+    jobs.running["normal"] = 2
+    jobs.running["broken"] = 1
+    assert jobs.available_queues() == []
+    assert jobs.next_job() is None
+
+def test_records_status(redis_client):
+    finished_id = app.jobs.enqueue(redis_client, "normal", 7, "n1")
+    failed_id = app.jobs.enqueue(redis_client, "broken", 7, "bad input")
+
+    worker(redis_client).run(max_jobs=2)
+    finished = app.jobs.get_job(redis_client, finished_id)
+    failed = app.jobs.get_job(redis_client, failed_id)
+    assert (finished["status"], finished["user_id"], finished["type"]) == ("finished", 7, "normal")
+    assert (failed["status"], failed["error"]) == ("failed", "bad input")
+    assert "finished_at" in failed
+    assert redis_client.llen(app.jobs.processing_key("worker-1")) == 0
+
+def test_unknown_job_type(redis_client):
+    with pytest.raises(ValueError):
+        app.jobs.enqueue(redis_client, "missing", 1)
+
+def test_requeues_jobs_of_a_crashed_worker(redis_client):
+    first_id = app.jobs.enqueue(redis_client, "normal", 1, "n1")
+    second_id = app.jobs.enqueue(redis_client, "normal", 1, "n2")
+
+    # taken off the queue, then the worker dies before running it
+    assert worker(redis_client).next_job() == ("normal", first_id)
+    assert redis_client.lrange(app.jobs.processing_key("worker-1"), 0, -1) == [first_id.encode()]
+
+    # another worker doesn't touch it, the restarted one puts it back first in line
+    assert worker(redis_client, "worker-2").requeue_unfinished() == 0
+    worker(redis_client).run(max_jobs=2)
+    assert CALLS == ["n1", "n2"]
+    assert app.jobs.get_job(redis_client, second_id)["status"] == "finished"
+    assert redis_client.llen(app.jobs.processing_key("worker-1")) == 0
+
+def test_requeue_drops_expired_jobs(redis_client):
+    job_id = app.jobs.enqueue(redis_client, "normal", 1, "n1")
+    worker(redis_client).next_job()
+    redis_client.delete(app.jobs.job_key(job_id))
+
+    assert worker(redis_client).requeue_unfinished() == 0
+    assert redis_client.llen(app.jobs.processing_key("worker-1")) == 0
+    assert redis_client.llen(app.jobs.queue_key("normal")) == 0
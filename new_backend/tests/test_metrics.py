@@ -0,0 +1,57 @@
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+import app.metrics
+from app import create_app
+
+@pytest.fixture
+def client(s3_client):
+    with TestClient(create_app()) as client:
+        yield client
+
+def request_count(method: str, route: str, status: int) -> float:
+    labels = {"method": method, "route": route, "status": str(status)}
+    return REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) or 0
+
+def test_serves_histograms_and_counters(client):
+    with app.metrics.job_context("job-1", "export"):
+        with app.metrics.stage("write"):
+            pass
+    app.metrics.observe_transfer("upload", 2048, 0.5)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == app.metrics.CONTENT_TYPE
+    body = response.text
+    for name, kind in [
+        ("http_request_duration_seconds", "histogram"),
+        ("job_duration_seconds", "histogram"),
+        ("job_queue_wait_seconds", "histogram"),
+        ("job_stage_duration_seconds", "histogram"),
+        ("s3_transfer_bytes_total", "counter"),
+        ("s3_transfer_seconds_total", "counter"),
+        ("normalization_cache_lookups_total", "counter"),
+        ("label_index_lookups_total", "counter"),
+    ]:
+        assert f"# TYPE {name} {kind}" in body
+    assert 'job_stage_duration_seconds_count{job_type="export",stage="write"}' in body
+    assert 's3_transfer_bytes_total{operation="upload"}' in body
+
+def test_requests_are_labelled_by_route_template(client):
+    route = "/api/users/{user_id}/documents/{document_name}"
+    before = request_count("GET", route, 404)
+
+    for document in ["a.csv", "b.csv"]:
+        assert client.get(f"/api/users/1/documents/{document}").status_code == 404
+
+    assert request_count("GET", route, 404) == before + 2
+    body = client.get("/metrics").text
+    assert "/api/users/1/documents/a.csv" not in body
+
+def test_unmatched_paths_share_a_label(client):
+    before = request_count("GET", "unmatched", 404)
+    client.get("/no/such/path")
+    client.get("/another/missing/path")
+
+    assert request_count("GET", "unmatched", 404) == before + 2
+    assert "/no/such/path" not in client.get("/metrics").text
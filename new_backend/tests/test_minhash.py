@@ -0,0 +1,112 @@
+import numpy as np
+import polars as pl
+import pytest
+from datasketch import MinHash, MinHashLSH
+from scipy.sparse import coo_array
+from scipy.sparse.csgraph import connected_components
+import app.minhash
+import app.normalization
+from app.synthetic import generate_transactions
+
+@pytest.fixture(scope="module")
+def descriptions() -> pl.Series:
+    """Simplified synthetic descriptions with repeats, empty strings and nulls mixed in"""
+    simplified = app.normalization.normalize(generate_transactions(1500, seed=2)["description"])
+    extra = pl.Series("description", ["", None, "", "   ", None, "netflix", "netflix", "a b", "b a", "a  b"], dtype=pl.String)
+    return pl.concat([simplified, extra, simplified.head(50)])
+
+def datasketch_minhashes(descriptions: pl.Series) -> list[MinHash]:
+    minhashes = []
+    for description in descriptions.to_list():
+        minhash = MinHash(num_perm=app.minhash.NUM_PERM, seed=app.minhash.SEED)
+        for word in set(str(description).split()):
+            minhash.update(word.encode("utf8"))
+        minhashes.append(minhash)
+    return minhashes
+
+def datasketch_partition(minhashes: list[MinHash]) -> np.ndarray:
+    """Labels rows connected through MinHashLSH query results, by union-find"""
+    lsh = MinHashLSH(threshold=app.minhash.THRESHOLD, num_perm=app.minhash.NUM_PERM)
+    for row, minhash in enumerate(minhashes):
+        lsh.insert(row, minhash)
+
+    parent = list(range(len(minhashes)))
+    def find(row: int) -> int:
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+
+    for row, minhash in enumerate(minhashes):
+        for other in lsh.query(minhash):
+            parent[find(other)] = find(row)
+    return np.array([find(row) for row in range(len(minhashes))])
+
+def same_partition(a: np.ndarray, b: np.ndarray) -> bool:
+    pairs = pl.DataFrame({"a": a, "b": b}).unique()
+    return pairs.height == len(np.unique(a)) == len(np.unique(b))
+
+def test_signatures_match_datasketch(descriptions):
+    sigs = app.minhash.signatures(descriptions)
+    expected = np.array([minhash.hashvalues for minhash in datasketch_minhashes(descriptions)], dtype=np.uint64)
+    assert sigs.shape == (descriptions.len(), app.minhash.NUM_PERM)
+    np.testing.assert_array_equal(sigs, expected)
+
+def test_signatures_of_blocks_match(descriptions, monkeypatch):
+    sigs = app.minhash.signatures(descriptions)
+    monkeypatch.setattr(app.minhash, "SIGNATURE_BLOCK_ROWS", 7)
+    np.testing.assert_array_equal(app.minhash.signatures(descriptions), sigs)
+
+def test_empty_input():
+    assert app.minhash.signatures(pl.Series([], dtype=pl.String)).shape == (0, app.minhash.NUM_PERM)
+    assert len(app.minhash.component_labels(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), 0)) == 0
+
+def test_groups_match_datasketch_lsh(descriptions):
+    sigs = app.minhash.signatures(descriptions)
+    expected = datasketch_partition(datasketch_minhashes(descriptions))
+
+    for keys in (app.minhash.band_labels(sigs), app.minhash.band_keys(sigs)):
+        src, dst = app.minhash.candidate_edges(keys)
+        labels = app.minhash.component_labels(src, dst, descriptions.len())
+        assert same_partition(labels, expected)
+
+    # duplicates, and descriptions with the same words, always share a group
+    labels = app.minhash.component_labels(*app.minhash.candidate_edges(app.minhash.band_keys(sigs)), descriptions.len())
+    frame = pl.DataFrame({"description": descriptions, "group": labels})
+    assert frame.group_by("description").agg(pl.col("group").n_unique())["group"].max() == 1
+    assert frame.filter(pl.col("description").is_in(["a b", "b a", "a  b"]))["group"].n_unique() == 1
+
+def test_band_keys_compare_across_batches(descriptions):
+    # keys hashed batch by batch equal the keys of the whole series, which is what app.streaming relies on
+    keys = app.minhash.band_keys(app.minhash.signatures(descriptions))
+    batches = [
+        app.minhash.band_keys(app.minhash.signatures(descriptions.slice(offset, 400)))
+        for offset in range(0, descriptions.len(), 400)
+    ]
+    np.testing.assert_array_equal(np.vstack(batches), keys)
+
+@pytest.mark.parametrize("threshold, num_perm", [(0.6, 128), (0.5, 128), (0.8, 128), (0.6, 64)])
+def test_optimal_param_matches_datasketch(threshold, num_perm):
+    lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+    assert app.minhash.optimal_param(threshold, num_perm) == (lsh.b, lsh.r)
+
+def test_candidate_edges_connect_lsh_candidates(descriptions):
+    sigs = app.minhash.signatures(descriptions)
+    keys = app.minhash.band_keys(sigs)
+    src, dst = app.minhash.candidate_edges(keys)
+    height = descriptions.len()
+
+    # every edge joins two rows that share a bucket, at most one edge per row and band
+    assert (keys[src] == keys[dst]).any(axis=1).all()
+    assert len(src) <= height * keys.shape[1]
+
+    # the edges span the same components as every MinHashLSH candidate pair does
+    minhashes = datasketch_minhashes(descriptions)
+    lsh = MinHashLSH(threshold=app.minhash.THRESHOLD, num_perm=app.minhash.NUM_PERM)
+    for row, minhash in enumerate(minhashes):
+        lsh.insert(row, minhash)
+    pairs = np.array([(row, other) for row, minhash in enumerate(minhashes) for other in lsh.query(minhash)])
+    graph = coo_array((np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(height, height)).tocsr()
+    _, expected = connected_components(graph, directed=False)
+
+    assert same_partition(app.minhash.component_labels(src, dst, height), expected)
@@ -0,0 +1,107 @@
+import pytest
+import app.storage
+import app.model_cache
+
+def test_model_locks_are_bounded():
+    cache = app.model_cache.ModelCache(cache_dir="", lock_stripes=4)
+    locks = {id(cache._model_lock(f"model-{i}.ftz")) for i in range(1000)}
+
+    assert len(locks) == 4
+    assert cache._model_lock("model-1.ftz") is cache._model_lock("model-1.ftz")
+
+class CountingClient:
+    """Forwards to an S3 client, counting HEAD requests"""
+
+    def __init__(self, s3_client):
+        self.s3_client = s3_client
+        self.heads = 0
+
+    def head_object(self, **kwargs):
+        self.heads += 1
+        return self.s3_client.head_object(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.s3_client, name)
+
+@pytest.fixture
+def models(s3_client, tmp_path, model) -> dict[str, int]:
+    """Three model files in the bucket, with their sizes"""
+    path = tmp_path / "model.bin"
+    model.save_model(str(path))
+    sizes = {}
+    for name in ["a.bin", "b.bin", "c.bin"]:
+        app.storage.upload_file(str(path), name, s3_client)
+        sizes[name] = path.stat().st_size
+    return sizes
+
+@pytest.fixture
+def downloads(monkeypatch) -> list[str]:
+    downloaded = []
+    download_fileobj = app.storage.download_fileobj
+    def counting_download(key, fileobj, s3_client=None):
+        downloaded.append(key)
+        download_fileobj(key, fileobj, s3_client)
+    monkeypatch.setattr(app.storage, "download_fileobj", counting_download)
+    return downloaded
+
+def test_hits_skip_s3(s3_client, models, downloads, tmp_path):
+    client = CountingClient(s3_client)
+    cache = app.model_cache.ModelCache(cache_dir=str(tmp_path / "cache"), revalidate_seconds=60)
+
+    first = cache.get(client, "a.bin")
+    assert cache.get(client, "a.bin") is first
+    assert (client.heads, downloads) == (1, ["a.bin"])
+
+def test_evicts_least_recently_used(s3_client, models, downloads, tmp_path):
+    cache = app.model_cache.ModelCache(max_bytes=models["a.bin"] * 2, cache_dir=str(tmp_path / "cache"))
+    a = cache.get(s3_client, "a.bin")
+    cache.get(s3_client, "b.bin")
+    cache.get(s3_client, "a.bin") # a is now the most recently used
+    cache.get(s3_client, "c.bin")
+
+    assert list(cache._entries) == ["a.bin", "c.bin"]
+    assert cache._total_bytes == models["a.bin"] + models["c.bin"]
+    assert cache.get(s3_client, "a.bin") is a
+
+def test_models_over_budget_are_not_kept(s3_client, models, tmp_path):
+    cache = app.model_cache.ModelCache(max_bytes=models["a.bin"] - 1, cache_dir=str(tmp_path / "cache"))
+    assert cache.get(s3_client, "a.bin") is not None
+    assert len(cache._entries) == 0 and cache._total_bytes == 0
+
+def test_revalidates_etag_after_ttl(s3_client, models, downloads, tmp_path, monkeypatch):
+    client = CountingClient(s3_client)
+    cache = app.model_cache.ModelCache(cache_dir=str(tmp_path / "cache"), revalidate_seconds=60)
+    clock = [1000.0]
+    monkeypatch.setattr(app.model_cache.time, "monotonic", lambda: clock[0])
+
+    first = cache.get(client, "a.bin")
+    clock[0] += 61
+    assert cache.get(client, "a.bin") is first # same ETag, nothing downloaded
+    assert (client.heads, downloads) == (2, ["a.bin"])
+
+    # a replaced model (new ETag) is downloaded and loaded again
+    s3_client.put_object(Bucket=app.storage.bucket_name(), Key="a.bin", Body=s3_client.get_object(Bucket=app.storage.bucket_name(), Key="b.bin")["Body"].read() + b"\0")
+    assert cache.get(client, "a.bin") is first # still within the TTL
+    clock[0] += 61
+    assert cache.get(client, "a.bin") is not first
+    assert downloads == ["a.bin", "a.bin"]
+
+def test_reuses_files_on_disk(s3_client, models, downloads, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    app.model_cache.ModelCache(cache_dir=cache_dir).get(s3_client, "a.bin")
+
+    # a new process (empty memory tier) loads the file it already has
+    client = CountingClient(s3_client)
+    assert app.model_cache.ModelCache(cache_dir=cache_dir).get(client, "a.bin") is not None
+    assert (client.heads, downloads) == (1, ["a.bin"])
+
+def test_prunes_disk_to_budget(s3_client, models, tmp_path):
+    cache_dir = tmp_path / "cache"
+    # room for two of the (slightly larger than a.bin) files written below
+    cache = app.model_cache.ModelCache(cache_dir=str(cache_dir), disk_max_bytes=models["a.bin"] * 2 + 100)
+    for name in ["a.bin", "b.bin", "c.bin"]:
+        s3_client.put_object(Bucket=app.storage.bucket_name(), Key=name, Body=(tmp_path / "model.bin").read_bytes() + name.encode())
+        cache.get(s3_client, name)
+
+    assert len(list(cache_dir.iterdir())) == 2
+    assert sum(path.stat().st_size for path in cache_dir.iterdir()) <= models["a.bin"] * 2 + 100
@@ -0,0 +1,94 @@
+import fakeredis
+import numpy as np
+import polars as pl
+import app.normalization
+from app.normalization import NormalizationCache
+from benchmarks.golden import corpus, reference_normalize
+
+def series(values) -> pl.Series:
+    return pl.Series("description", values, dtype=pl.String)
+
+def test_matches_uncached_normalization():
+    cache = NormalizationCache()
+    batches = [
+        ["PAYMENT TO AMAZON.COM 1234", "SQ *BLUE BOTTLE", None, "SQ *BLUE BOTTLE"],
+        ["SQ *BLUE BOTTLE", "ACH DEBIT COMCAST", ""],
+        ["ACH DEBIT COMCAST", "PAYMENT TO AMAZON.COM 1234", "TARGET 00012 CA"],
+    ]
+    for batch in batches:
+        descriptions = series(batch)
+        assert cache.simplify(descriptions).to_list() == app.normalization.normalize(descriptions).to_list()
+    assert len(cache) == 5
+
+def test_hits_skip_normalization(monkeypatch):
+    cache = NormalizationCache()
+    cache.simplify(series(["A PAYMENT", "B PAYMENT"]))
+
+    calls = []
+    normalize = app.normalization.normalize
+    monkeypatch.setattr(app.normalization, "normalize", lambda d: calls.append(d.to_list()) or normalize(d))
+    assert cache.simplify(series(["B PAYMENT", "C PAYMENT", "A PAYMENT"])).to_list() == ["b", "c", "a"]
+    assert calls == [["C PAYMENT"]]
+
+def test_runs_stay_logarithmic():
+    cache = NormalizationCache()
+    for start in range(0, 6400, 100):
+        cache.simplify(series([f"merchant {i}" for i in range(start, start + 100)]))
+
+    assert len(cache) == 6400
+    assert len(cache._runs) <= 8
+    for run in cache._runs:
+        assert run.raw.is_sorted()
+
+def test_evicts_least_recently_used():
+    cache = NormalizationCache(max_entries=100)
+    cache.simplify(series([f"old {i}" for i in range(60)]))
+    cache.simplify(series([f"kept {i}" for i in range(30)]))
+    cache.simplify(series(["old 0", "old 1"])) # used again, so not evicted
+    cache.simplify(series([f"new {i}" for i in range(20)]))
+
+    assert len(cache) == 75
+    kept = pl.concat([run.raw for run in cache._runs])
+    assert kept.is_in(pl.Series([f"new {i}" for i in range(20)] + [f"kept {i}" for i in range(30)] + ["old 0", "old 1"]).implode()).sum() == 52
+    assert cache.simplify(series(["old 59", "old 0"])).to_list() == ["old 59", "old 0"]
+
+def test_shared_through_redis():
+    redis_client = fakeredis.FakeRedis()
+    NormalizationCache(redis_client).simplify(series(["PAYMENT TO NETFLIX"]))
+
+    other = NormalizationCache(redis_client)
+    assert other.simplify(series(["PAYMENT TO NETFLIX"])).to_list() == ["netflix"]
+    assert len(other) == 1
+    assert redis_client.hget(app.normalization.cache_key(), "PAYMENT TO NETFLIX") == b"netflix"
+
+def test_matches_regex_pipeline_on_golden_corpus():
+    descriptions = corpus(20000, 2)
+    mismatches = pl.DataFrame({
+        "description": descriptions,
+        "expected": reference_normalize(descriptions),
+        "actual": app.normalization.normalize(descriptions),
+    }).filter(pl.col("expected") != pl.col("actual"))
+    assert mismatches.is_empty(), mismatches.head(10)
+
+def test_matches_regex_pipeline_on_mixed_tokens():
+    # descriptions built from noise words, pieces of the structural and cross token
+    # rules, punctuation and odd whitespace, glued together with and without spaces
+    pieces = [
+        *sorted(app.normalization.NOISE_WORDS), "payment", "webpayment", "xx", "xxx9", "1234", "12", "a",
+        "merchant", "purchase", "purchases", "-visa", "cash", "app", "https://", "http://x",
+        "café", "٣٣٣", "_", "*", "#", "&", "-", "/", ".", ",", "com", "www", "AT", "Pay",
+    ]
+    separators = ["", " ", "  ", "\t", ".", "*", " - "]
+    rng = np.random.default_rng(0)
+    descriptions = pl.Series("description", [
+        "".join(pieces[i] + separators[j] for i, j in zip(rng.integers(0, len(pieces), n), rng.integers(0, len(separators), n)))
+        for n in rng.integers(0, 8, 5000)
+    ])
+
+    expected = reference_normalize(descriptions)
+    actual = app.normalization.normalize(descriptions)
+    assert (expected == actual).all(), descriptions.filter(expected != actual).head(10).to_list()
+
+def test_noise_words_are_noise():
+    words = pl.Series(sorted(app.normalization.NOISE_WORDS))
+    assert (reference_normalize(words) == "").all()
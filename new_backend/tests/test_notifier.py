@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+import subprocess
+import pytest
+import app.notifier
+
+class FakeTransport:
+    """Records sent messages; sends block while the gate is closed and fail while failures are left"""
+
+    def __init__(self, sent: list, gate: threading.Event, failures: list):
+        self.sent = sent
+        self.gate = gate
+        self.failures = failures
+        self.closed = False
+
+    def send(self, event: str, payload: dict) -> None:
+        self.gate.wait()
+        if self.failures:
+            raise ConnectionError(self.failures.pop())
+        self.sent.append((payload["recipient"], event, payload["status"]))
+
+    def close(self) -> None:
+        self.closed = True
+
+class Relay:
+    """A notifier with a fake transport, and the state its transports share"""
+
+    def __init__(self):
+        self.sent = []
+        self.gate = threading.Event()
+        self.failures = []
+        self.transports = []
+        self.in_send = threading.Event()
+        self.notifier = app.notifier.Notifier(self.connect, queue_size=3)
+
+    def connect(self) -> FakeTransport:
+        transport = FakeTransport(self.sent, self.gate, self.failures)
+        send = transport.send
+        def tracked_send(event, payload):
+            self.in_send.set()
+            send(event, payload)
+        transport.send = tracked_send
+        self.transports.append(transport)
+        return transport
+
+@pytest.fixture
+def relay():
+    relay = Relay()
+    yield relay
+    relay.gate.set()
+
+def hold_first_send(relay) -> None:
+    """Sends one message and keeps the transport stuck on it, so later ones queue up"""
+    relay.notifier.notify(0, "tables", "first")
+    assert relay.in_send.wait(5)
+
+def test_sends_in_order(relay):
+    relay.gate.set()
+    for user_id in range(3):
+        relay.notifier.notify(user_id, "tables", "Success")
+    assert relay.notifier.flush(5)
+    assert relay.sent == [("0", "tables", "Success"), ("1", "tables", "Success"), ("2", "tables", "Success")]
+
+def test_full_queue_drops_oldest(relay):
+    hold_first_send(relay)
+    for user_id in range(1, 5):
+        relay.notifier.notify(user_id, "tables", "Success")
+
+    relay.gate.set()
+    assert relay.notifier.flush(5)
+    assert [recipient for recipient, _, _ in relay.sent] == ["0", "2", "3", "4"]
+
+def test_coalesces_per_recipient_and_event(relay):
+    hold_first_send(relay)
+    relay.notifier.notify(1, "tables", "Processing")
+    relay.notifier.notify(2, "tables", "Processing")
+    relay.notifier.notify(1, "tables", "Success")
+
+    relay.gate.set()
+    assert relay.notifier.flush(5)
+    assert relay.sent == [("0", "tables", "first"), ("2", "tables", "Processing"), ("1", "tables", "Success")]
+
+def test_coalesces_only_same_event(relay):
+    hold_first_send(relay)
+    relay.notifier.notify(1, "tables", "Success")
+    relay.notifier.notify(1, "download", "Success")
+
+    relay.gate.set()
+    assert relay.notifier.flush(5)
+    assert relay.sent[1:] == [("1", "tables", "Success"), ("1", "download", "Success")]
+
+def test_reconnects_with_backoff(relay, monkeypatch):
+    monkeypatch.setattr(app.notifier, "NOTIFIER_RETRY_SECONDS", 1)
+    monkeypatch.setattr(app.notifier, "NOTIFIER_MAX_RETRY_SECONDS", 4)
+    delays = []
+    sleep = app.notifier.time.sleep
+    def fake_sleep(seconds):
+        if threading.current_thread().name == "notifier":
+            delays.append(seconds)
+            seconds = 0
+        sleep(seconds)
+    monkeypatch.setattr(app.notifier.time, "sleep", fake_sleep)
+
+    relay.failures.extend(["refused"] * 4)
+    relay.gate.set()
+    relay.notifier.notify(1, "tables", "Success")
+    assert relay.notifier.flush(5)
+
+    assert delays == [1, 2, 4, 4]
+    assert relay.sent == [("1", "tables", "Success")]
+    # every failed transport was closed and replaced by a new connection
+    assert len(relay.transports) == 5
+    assert [transport.closed for transport in relay.transports] == [True] * 4 + [False]
+
+    # a successful send resets the backoff
+    relay.failures.append("refused")
+    relay.notifier.notify(1, "tables", "Failed")
+    assert relay.notifier.flush(5)
+    assert delays[4:] == [1]
+
+def test_flush_times_out_while_blocked(relay):
+    hold_first_send(relay)
+    assert not relay.notifier.flush(0.1)
+    relay.gate.set()
+    assert relay.notifier.flush(5)
+
+def test_flushes_at_exit(tmp_path):
+    # a process that exits right after queueing a status still sends it
+    output = tmp_path / "sent.txt"
+    script = f"""
+import time
+import app.notifier
+
+class SlowTransport:
+    def send(self, event, payload):
+        time.sleep(0.2)
+        with open({str(output)!r}, "a") as fp:
+            fp.write(f"{{payload['recipient']}} {{event}} {{payload['status']}}\\n")
+    def close(self):
+        pass
+
+app.notifier.notifier.transport_factory = SlowTransport
+app.notifier.notify(1, "tables", "Success")
+"""
+    env = {**os.environ, "PYTHONPATH": os.path.dirname(os.path.dirname(app.notifier.__file__))}
+    subprocess.run([sys.executable, "-c", script], env=env, check=True, timeout=30)
+    assert output.read_text() == "1 tables Success\n"
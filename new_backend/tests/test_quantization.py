@@ -0,0 +1,130 @@
+import io
+import sys
+import runpy
+import pytest
+import fakeredis
+import numpy as np
+import polars as pl
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+import app.tasks
+import app.helpers
+import app.storage
+import app.dependencies
+import app.model_cache
+import app.quantization
+import app.session_store
+import app.models.database_models as db_models
+from app.synthetic import generate_transactions
+
+TEMPLATE_ID = 1
+MODEL_NAME = "model.bin"
+
+@pytest.fixture(scope="module")
+def training_data() -> pl.DataFrame:
+    # a store code on every row, so the vocabulary is large enough to quantize
+    # (letters, since normalization drops long digit runs)
+    data = generate_transactions(3000, seed=6)
+    rng = np.random.default_rng(6)
+    codes = [f" shop{chr(97 + i // 26)}{chr(97 + i % 26)}" for i in rng.integers(0, 400, data.height)]
+    return data.with_columns(pl.col("description") + pl.Series(codes))
+
+@pytest.fixture(scope="module")
+def cleaned_data(training_data) -> pl.DataFrame:
+    return app.helpers.clean_data(training_data)
+
+def train(cleaned_data: pl.DataFrame):
+    return app.helpers.train_classifier(cleaned_data, lr=0.5, epoch=5, thread=1)
+
+def test_quantize_reports_accuracy(cleaned_data):
+    model = train(cleaned_data)
+    assert model.get_input_matrix().shape[0] >= app.quantization.QUANTIZE_MIN_ROWS
+    full_accuracy = app.quantization.accuracy(model, cleaned_data)
+
+    result = app.quantization.quantize(model, cleaned_data)
+    assert model.is_quantized()
+    assert result[0] == full_accuracy
+    assert result[1] == pytest.approx(app.quantization.accuracy(model, cleaned_data) - full_accuracy)
+
+def test_small_models_stay_as_they_are(model, cleaned_data):
+    # the shared model has too few words for the product quantizer
+    assert model.get_input_matrix().shape[0] < app.quantization.QUANTIZE_MIN_ROWS
+    assert app.quantization.quantize(model, cleaned_data) is None
+    assert not model.is_quantized()
+
+def test_quantized_model_name():
+    assert app.quantization.quantized_model_name("abc.bin") == "abc.ftz"
+
+@pytest.fixture
+def database(tmp_path, monkeypatch, training_data):
+    """A sqlite database with one template and its training transactions, used through app.dependencies.Session"""
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    db_models.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(sa.insert(db_models.COAIDtoGroup), [{"group_id": 1, "group_name": "coa"}])
+        connection.execute(sa.insert(db_models.Template), [{"id": TEMPLATE_ID, "title": "template", "model_name": MODEL_NAME, "coa_group_id": 1}])
+        connection.execute(sa.insert(db_models.Transaction), [
+            {"description": row["description"], "account": row["account"], "amount": row["amount"], "template_id": TEMPLATE_ID}
+            for row in training_data.iter_rows(named=True)
+        ])
+
+    session = so.sessionmaker(engine)
+    monkeypatch.setattr(app.dependencies, "Session", session)
+    monkeypatch.setattr(app.quantization, "Session", session)
+    monkeypatch.setattr(app.tasks, "Session", session)
+    return session
+
+@pytest.fixture
+def stored_model(s3_client, tmp_path, cleaned_data):
+    path = tmp_path / MODEL_NAME
+    train(cleaned_data).save_model(str(path))
+    app.storage.upload_file(str(path), MODEL_NAME, s3_client)
+
+def template_model(database) -> tuple[str, float | None]:
+    with database() as session:
+        template = session.get(db_models.Template, TEMPLATE_ID)
+        return template.model_name, template.quantized_accuracy_delta
+
+@pytest.mark.parametrize("keep_originals", [False, True])
+def test_migrate_replaces_model(database, stored_model, s3_client, keep_originals):
+    assert app.quantization.migrate([TEMPLATE_ID], keep_originals) == 1
+
+    model_name, delta = template_model(database)
+    assert model_name == "model.ftz" and delta is not None
+    assert app.storage.object_exists("model.ftz", s3_client)
+    assert app.storage.object_exists(MODEL_NAME, s3_client) == keep_originals
+
+    # already quantized templates are skipped
+    assert app.quantization.migrate() == 0
+
+def test_migrate_leaves_small_models(database, s3_client, tmp_path, model):
+    model.save_model(str(tmp_path / MODEL_NAME))
+    app.storage.upload_file(str(tmp_path / MODEL_NAME), MODEL_NAME, s3_client)
+
+    assert app.quantization.migrate() == 0
+    assert template_model(database) == (MODEL_NAME, None)
+    assert app.storage.object_exists(MODEL_NAME, s3_client)
+
+def test_cli(database, stored_model, s3_client, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["app.quantization", "--template-id", str(TEMPLATE_ID), "--keep-originals"])
+    monkeypatch.delitem(sys.modules, "app.quantization") # run_module warns about re-running an imported module
+    runpy.run_module("app.quantization", run_name="__main__")
+
+    assert capsys.readouterr().out.strip() == "Quantized 1 models"
+    assert template_model(database)[0] == "model.ftz"
+    assert app.storage.object_exists(MODEL_NAME, s3_client)
+
+def test_queued_job_uses_migrated_model(database, stored_model, s3_client, monkeypatch, tmp_path):
+    redis_client = fakeredis.FakeRedis()
+    monkeypatch.setattr(app.tasks, "get_redis_connection", lambda: redis_client)
+    monkeypatch.setattr(app.helpers, "emit_job_status", lambda user_id, job_type, status: None)
+    monkeypatch.setattr(app.model_cache, "model_cache", app.model_cache.ModelCache(cache_dir=str(tmp_path / "cache")))
+    app.storage.upload_fileobj(io.BytesIO(b"description,amount\nSTARBUCKS shopab,4.5\n"), "upload.csv", s3_client)
+
+    # queued with the .bin model, which the migration then deletes
+    app.quantization.migrate()
+    assert not app.storage.object_exists(MODEL_NAME, s3_client)
+    app.tasks.process_transactions_task(1, TEMPLATE_ID, "upload.csv", MODEL_NAME, "test-token")
+
+    df = app.session_store.load_session_table(redis_client, "test-token")
+    assert df["account"].to_list() == ["Meals And Entertainment"]
@@ -0,0 +1,48 @@
+import io
+import pytest
+import polars as pl
+import app.readers
+
+COLUMNS = ["description", "amount"]
+
+def upload(data: pl.DataFrame, file_ext: str) -> io.BytesIO:
+    buffer = io.BytesIO()
+    if file_ext == ".csv":
+        data.write_csv(buffer)
+    else:
+        data.write_excel(buffer)
+    buffer.seek(0)
+    return buffer
+
+@pytest.fixture
+def data() -> pl.DataFrame:
+    return pl.DataFrame({"Description": ["CAFE", "RENT"], "AMOUNT": [4.5, 1200.0], "Memo": ["a", "b"]})
+
+@pytest.mark.parametrize("file_ext", [".csv", ".CSV", ".xlsx", ".XLSX"])
+def test_reads_with_lowercase_columns(data, file_ext):
+    df = app.readers.scan_upload(upload(data, file_ext.lower()), file_ext, columns=COLUMNS).collect()
+    assert df.select(COLUMNS).equals(pl.DataFrame({"description": ["CAFE", "RENT"], "amount": [4.5, 1200.0]}))
+
+def test_xlsx_loads_only_requested_columns(data):
+    df = app.readers.scan_upload(upload(data, ".xlsx"), ".xlsx", columns=COLUMNS).collect()
+    assert df.columns == COLUMNS
+
+    df = app.readers.scan_upload(upload(data, ".xlsx"), ".xlsx").collect()
+    assert df.columns == ["description", "amount", "memo"]
+
+def test_csv_from_path(data, tmp_path):
+    path = tmp_path / "upload.csv"
+    data.write_csv(path)
+    assert app.readers.scan_upload(str(path), ".csv").collect_schema().names() == ["description", "amount", "memo"]
+
+@pytest.mark.parametrize("file_ext", [".csv", ".xlsx"])
+def test_no_matching_columns(file_ext):
+    data = pl.DataFrame({"Payee": ["CAFE"], "Total": [4.5]})
+    lf = app.readers.scan_upload(upload(data, file_ext), file_ext, columns=COLUMNS)
+
+    # callers check for their required columns and reject the file
+    assert not set(COLUMNS) & set(lf.collect_schema().names())
+
+def test_unknown_extension():
+    with pytest.raises(ValueError, match=r"\.txt"):
+        app.readers.scan_upload(io.BytesIO(b""), ".txt")
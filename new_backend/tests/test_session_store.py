@@ -0,0 +1,124 @@
+import asyncio
+import pytest
+import fakeredis
+import polars as pl
+import app.session_store
+
+ACCESS_TOKEN = "test-token"
+
+@pytest.fixture
+def table():
+    return pl.DataFrame({
+        "description": ["TRADER JOES", "TRADER JOES", "CAFE"],
+        "account": ["Groceries", "Groceries", "Dining"],
+        "group": [0, 0, 1],
+    })
+
+def test_session_round_trip(table):
+    redis_client = fakeredis.FakeRedis()
+    app.session_store.create_session(redis_client, ACCESS_TOKEN, 7, table)
+
+    df, summary = app.session_store.load_session(redis_client, ACCESS_TOKEN)
+    assert df[app.session_store.ROW_ID].to_list() == [0, 1, 2]
+    assert df.drop(app.session_store.ROW_ID).equals(table)
+    assert summary.height == 2
+
+def test_save_restarts_ttl(table):
+    redis_client = fakeredis.FakeRedis()
+    app.session_store.create_session(redis_client, ACCESS_TOKEN, 7, table)
+    key = app.session_store.session_key(ACCESS_TOKEN)
+    redis_client.expire(key, 10)
+
+    session = app.session_store.load_editable_session(redis_client, ACCESS_TOKEN)
+    assert app.session_store.save_session_edit(redis_client, ACCESS_TOKEN, session, session.table["account"], session.summary)
+    assert redis_client.ttl(key) > app.session_store.SESSION_TTL_SECONDS - 10
+    assert int(redis_client.hget(key, "template_id")) == 7
+
+def test_save_after_expiry_writes_nothing(table):
+    redis_client = fakeredis.FakeRedis()
+    app.session_store.create_session(redis_client, ACCESS_TOKEN, 7, table)
+    session = app.session_store.load_editable_session(redis_client, ACCESS_TOKEN)
+    redis_client.delete(app.session_store.session_key(ACCESS_TOKEN))
+
+    assert not app.session_store.save_session_edit(redis_client, ACCESS_TOKEN, session, session.table["account"], session.summary)
+    assert not redis_client.exists(app.session_store.session_key(ACCESS_TOKEN))
+
+def test_save_async_after_expiry_writes_nothing(table):
+    server = fakeredis.FakeServer()
+    redis_client = fakeredis.FakeAsyncRedis(server=server)
+    sync_client = fakeredis.FakeRedis(server=server)
+    app.session_store.create_session(sync_client, ACCESS_TOKEN, 7, table)
+    session = app.session_store.load_editable_session(sync_client, ACCESS_TOKEN)
+    accounts = session.table["account"]
+
+    async def save():
+        saved = await app.session_store.save_session_edit_async(redis_client, ACCESS_TOKEN, session, accounts, session.summary)
+        await redis_client.delete(app.session_store.session_key(ACCESS_TOKEN))
+        expired = await app.session_store.save_session_edit_async(redis_client, ACCESS_TOKEN, session, accounts, session.summary)
+        return saved, expired
+
+    assert asyncio.run(save()) == (True, False)
+    assert not sync_client.exists(app.session_store.session_key(ACCESS_TOKEN))
+
+def test_partial_session_is_missing(table):
+    redis_client = fakeredis.FakeRedis()
+    app.session_store.create_session(redis_client, ACCESS_TOKEN, 7, table)
+    redis_client.hdel(app.session_store.session_key(ACCESS_TOKEN), "template_id")
+
+    assert app.session_store.load_session(redis_client, ACCESS_TOKEN) is None
+    assert app.session_store.load_session_table_digest(redis_client, ACCESS_TOKEN) is None
+
+def test_save_after_new_upload_writes_nothing(table):
+    redis_client = fakeredis.FakeRedis()
+    app.session_store.create_session(redis_client, ACCESS_TOKEN, 7, table)
+    session = app.session_store.load_editable_session(redis_client, ACCESS_TOKEN)
+    app.session_store.create_session(redis_client, ACCESS_TOKEN, 7, table.with_columns(pl.lit("Other").alias("account")))
+
+    accounts = pl.Series("account", ["Dining", "Dining", "Dining"])
+    assert not app.session_store.save_session_edit(redis_client, ACCESS_TOKEN, session, accounts, session.summary)
+    assert app.session_store.load_session_table(redis_client, ACCESS_TOKEN)["account"].to_list() == ["Other"] * 3
+
+def test_saved_edit_changes_digest(table):
+    redis_client = fakeredis.FakeRedis()
+    app.session_store.create_session(redis_client, ACCESS_TOKEN, 7, table)
+    _, digest = app.session_store.load_session_table_digest(redis_client, ACCESS_TOKEN)
+    session = app.session_store.load_editable_session(redis_client, ACCESS_TOKEN)
+
+    accounts = pl.Series("account", ["Groceries", "Groceries", "Coffee"])
+    assert app.session_store.save_session_edit(redis_client, ACCESS_TOKEN, session, accounts, session.summary)
+    df, edited_digest = app.session_store.load_session_table_digest(redis_client, ACCESS_TOKEN)
+    assert df.columns == session.table.columns
+    assert df["account"].to_list() == ["Groceries", "Groceries", "Coffee"]
+    assert edited_digest != digest
+
+def test_update_summary_keeps_order():
+    df = pl.DataFrame({
+        "description": ["A", "B", "B", "C", "A"],
+        "account": ["x", "y", "y", "z", "x"],
+        "group": [2, 0, 0, 1, 2],
+    }).with_row_index(app.session_store.ROW_ID)
+    summary = app.session_store.summarize_table(df)
+    group_index = app.session_store.build_group_index(df)
+    assert summary["group"].to_list() == [2, 0, 1]
+
+    # split group 0 over two accounts; it stays between groups 2 and 1
+    edited = df.with_columns(df["account"].clone().scatter(2, "w"))
+    updated = app.session_store.update_summary(summary, edited, group_index, [0])
+    assert updated.rows() == [(2, "x", "A", 2), (0, "y", "B", 1), (0, "w", "B", 1), (1, "z", "C", 1)]
+    assert updated.equals(app.session_store.summarize_table(edited))
+
+def test_update_summary_only_reaggregates_edited_groups():
+    df = pl.DataFrame({
+        "description": ["A", "B", "C"],
+        "account": ["x", "y", "z"],
+        "group": [0, 1, 2],
+    }).with_row_index(app.session_store.ROW_ID)
+    summary = app.session_store.summarize_table(df)
+    group_index = app.session_store.build_group_index(df)
+
+    # rows outside group 1 are changed behind the summary's back, so only
+    # group 1's summary row can pick up the new accounts
+    edited = df.with_columns(pl.Series("account", ["q", "w", "q"]))
+    updated = app.session_store.update_summary(summary, edited, group_index, [1])
+    assert updated["account"].to_list() == ["x", "w", "z"]
+    assert app.session_store.group_rows(group_index, [2, 0]).to_list() == [0, 2]
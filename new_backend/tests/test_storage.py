@@ -0,0 +1,80 @@
+import io
+import pytest
+import app.storage
+
+PART_BYTES = app.storage.S3_MIN_PART_BYTES
+
+@pytest.fixture(autouse=True)
+def small_parts(monkeypatch):
+    # the smallest parts S3 accepts, so a few MiB already take a multipart transfer
+    monkeypatch.setattr(app.storage, "S3_MULTIPART_THRESHOLD_BYTES", PART_BYTES)
+    monkeypatch.setattr(app.storage, "S3_MULTIPART_CHUNK_BYTES", PART_BYTES)
+    monkeypatch.setattr(app.storage, "S3_MAX_CONCURRENCY", 2)
+    app.storage.reset_stats()
+
+def payload(size: int) -> bytes:
+    return bytes(range(256)) * (size // 256) + bytes(size % 256)
+
+def read_object(s3_client, key: str) -> bytes:
+    return s3_client.get_object(Bucket=app.storage.bucket_name(), Key=key)["Body"].read()
+
+def test_multipart_file_round_trip(s3_client, tmp_path):
+    data = payload(2 * PART_BYTES + 1234)
+    source = tmp_path / "source.bin"
+    source.write_bytes(data)
+
+    app.storage.upload_file(str(source), "model.bin", s3_client)
+    head = s3_client.head_object(Bucket=app.storage.bucket_name(), Key="model.bin")
+    assert head["ETag"].strip('"').endswith("-3") # uploaded in three parts
+
+    target = tmp_path / "target.bin"
+    app.storage.download_file("model.bin", str(target), s3_client)
+    assert target.read_bytes() == data
+
+    stats = app.storage.stats()
+    assert stats["upload"].count == 1 and stats["upload"].bytes == len(data)
+    assert stats["download"].count == 1 and stats["download"].bytes == len(data)
+    assert stats["upload"].seconds > 0
+
+def test_fileobj_round_trip(s3_client):
+    data = payload(PART_BYTES + 10)
+    app.storage.upload_fileobj(io.BytesIO(data), "upload.csv", s3_client)
+
+    buffer = io.BytesIO()
+    app.storage.download_fileobj("upload.csv", buffer, s3_client)
+    assert buffer.getvalue() == data
+
+def test_streaming_upload_flushes_parts(s3_client):
+    data = payload(2 * PART_BYTES + 4321)
+    with app.storage.StreamingUpload("export.csv", s3_client, content_type="text/csv") as upload:
+        for start in range(0, len(data), 1024 ** 2):
+            upload.write(data[start:start + 1024 ** 2])
+        # full parts go out while writing, only the remainder is buffered
+        assert len(upload._parts) == 2
+        assert len(upload._buffer) == 4321
+
+    assert read_object(s3_client, "export.csv") == data
+    head = s3_client.head_object(Bucket=app.storage.bucket_name(), Key="export.csv")
+    assert head["ContentType"] == "text/csv"
+
+    stats = app.storage.stats()
+    assert stats["upload"].count == 1 and stats["upload"].bytes == len(data)
+
+def test_streaming_upload_small_object(s3_client):
+    with app.storage.StreamingUpload("small.csv", s3_client) as upload:
+        upload.write(b"a,b\n1,2\n")
+
+    assert upload._upload_id is None # sent with a single PutObject
+    assert read_object(s3_client, "small.csv") == b"a,b\n1,2\n"
+
+def test_streaming_upload_aborts_on_error(s3_client):
+    with pytest.raises(RuntimeError):
+        with app.storage.StreamingUpload("broken.csv", s3_client) as upload:
+            upload.write(payload(PART_BYTES + 1))
+            assert upload._upload_id is not None
+            raise RuntimeError("writer failed")
+
+    bucket = app.storage.bucket_name()
+    assert "Uploads" not in s3_client.list_multipart_uploads(Bucket=bucket)
+    assert "Contents" not in s3_client.list_objects_v2(Bucket=bucket)
+    assert "upload" not in app.storage.stats()
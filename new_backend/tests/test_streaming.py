@@ -0,0 +1,44 @@
+import fakeredis
+import polars as pl
+import app.helpers
+import app.readers
+import app.session_store
+import app.streaming
+from app.synthetic import generate_transactions
+
+ACCESS_TOKEN = "test-token"
+
+def same_partition(a: pl.Series, b: pl.Series) -> bool:
+    pairs = pl.DataFrame({"a": a, "b": b}).unique()
+    return pairs.height == a.n_unique() == b.n_unique()
+
+def test_matches_in_memory_classification(tmp_path, model):
+    path = tmp_path / "transactions.csv"
+    generate_transactions(5000, seed=3).drop("account").write_csv(path)
+    lf = app.readers.scan_upload(str(path), ".csv")
+
+    data = lf.collect()
+    expected = data.with_columns(app.helpers.classify(data["description"], model))
+    output_dir = tmp_path / "parts"
+    output_dir.mkdir()
+    actual = app.streaming.classify_in_batches(lf, model, str(output_dir), batch_rows=700).collect()
+
+    assert actual.columns == expected.columns
+    assert actual.drop("group").equals(expected.drop("group"))
+    # group ids depend on the order descriptions were seen in, the groups themselves don't
+    assert same_partition(actual["group"], expected["group"])
+
+def test_session_from_lazy_results(tmp_path, model):
+    path = tmp_path / "transactions.csv"
+    generate_transactions(2000, seed=4).drop("account").write_csv(path)
+    results = app.streaming.classify_in_batches(app.readers.scan_upload(str(path), ".csv"), model, str(tmp_path), batch_rows=300)
+
+    redis_client = fakeredis.FakeRedis()
+    app.session_store.create_session(redis_client, ACCESS_TOKEN, 7, results)
+    streamed = app.session_store.load_editable_session(redis_client, ACCESS_TOKEN)
+    app.session_store.create_session(redis_client, ACCESS_TOKEN, 7, results.collect())
+    collected = app.session_store.load_editable_session(redis_client, ACCESS_TOKEN)
+
+    assert streamed.table.equals(collected.table)
+    assert streamed.summary.equals(collected.summary)
+    assert streamed.group_index.equals(collected.group_index)
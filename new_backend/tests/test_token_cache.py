@@ -0,0 +1,100 @@
+import time
+import importlib
+import pytest
+import fakeredis
+from datetime import datetime, timedelta, timezone
+import app.token_cache
+
+@pytest.fixture
+def unavailable_redis():
+    # every command fails with a ConnectionError
+    server = fakeredis.FakeServer()
+    server.connected = False
+    return fakeredis.FakeRedis(server=server)
+
+def expiration(seconds: int = 3600) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+def test_tokens_are_shared_through_redis():
+    redis_client = fakeredis.FakeRedis()
+    app.token_cache.TokenCache(redis_client).set("token", {"id": 1}, expiration())
+
+    assert app.token_cache.TokenCache(redis_client).get("token") == {"id": 1}
+    assert redis_client.ttl(app.token_cache.token_key("token")) <= app.token_cache.TOKEN_CACHE_TTL_SECONDS
+
+def test_invalidate_removes_both_tiers():
+    redis_client = fakeredis.FakeRedis()
+    cache = app.token_cache.TokenCache(redis_client)
+    cache.set("token", {"id": 1}, expiration())
+
+    cache.invalidate("token")
+    assert cache.get("token") is None
+    assert not redis_client.exists(app.token_cache.token_key("token"))
+
+def test_expired_tokens_are_not_cached():
+    cache = app.token_cache.TokenCache(fakeredis.FakeRedis())
+    cache.set("token", {"id": 1}, expiration(-1))
+    assert cache.get("token") is None
+
+def test_redis_outage_falls_back_to_local_tier(unavailable_redis, caplog):
+    cache = app.token_cache.TokenCache(unavailable_redis)
+    cache.set("token", {"id": 1}, expiration())
+    assert cache.get("token") == {"id": 1}
+
+    cache.invalidate("token")
+    assert cache.get("token") is None
+    assert "Token cache unavailable" in caplog.text
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_sign_out_reaches_other_processes():
+    server = fakeredis.FakeServer()
+    signing_out = app.token_cache.TokenCache(fakeredis.FakeRedis(server=server))
+    other = app.token_cache.TokenCache(fakeredis.FakeRedis(server=server))
+    signing_out.set("token", {"id": 1}, expiration())
+    assert other.get("token") == {"id": 1} # now in the other process's local tier
+    assert other.subscribed.wait(5)
+    other.set("kept", {"id": 2}, expiration())
+
+    signing_out.invalidate("token")
+    assert wait_for(lambda: app.token_cache.token_key("token") not in other._entries)
+    assert other.get("token") is None
+    assert other.get("kept") == {"id": 2}
+
+def test_resubscribing_clears_local_tier(monkeypatch):
+    # revocations sent while the listener was away are lost, so nothing cached before it (re)subscribed is kept
+    redis_client = fakeredis.FakeRedis()
+    cache = app.token_cache.TokenCache(redis_client)
+    cache._insert(app.token_cache.token_key("token"), {"id": 1}, time.time() + 60)
+
+    pubsub = redis_client.pubsub
+    def checked_pubsub(**kwargs):
+        assert app.token_cache.token_key("token") in cache._entries
+        return pubsub(**kwargs)
+    monkeypatch.setattr(redis_client, "pubsub", checked_pubsub)
+
+    cache._ensure_listening()
+    assert cache.subscribed.wait(5)
+    assert app.token_cache.token_key("token") not in cache._entries
+
+def test_redis_tier_on_by_default_with_redis_url(monkeypatch):
+    monkeypatch.delenv("TOKEN_CACHE_USE_REDIS", raising=False)
+    try:
+        monkeypatch.setenv("REDIS_URL", "redis://cache:6379/0")
+        assert importlib.reload(app.token_cache).TOKEN_CACHE_USE_REDIS
+
+        monkeypatch.setenv("TOKEN_CACHE_USE_REDIS", "false")
+        assert not importlib.reload(app.token_cache).TOKEN_CACHE_USE_REDIS
+
+        monkeypatch.delenv("TOKEN_CACHE_USE_REDIS")
+        monkeypatch.delenv("REDIS_URL")
+        assert not importlib.reload(app.token_cache).TOKEN_CACHE_USE_REDIS
+    finally:
+        monkeypatch.undo()
+        importlib.reload(app.token_cache)
@@ -0,0 +1,13 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.dependencies import get_redis_connection
+from app.jobs import Worker
+from app.metrics import configure_logging
+
+# Runs queued jobs (classification, exports, COA uploads, template training)
+# in a pool of worker processes: python worker.py
+if __name__ == "__main__":
+    configure_logging()
+    Worker(get_redis_connection()).run()
@@ -1,6 +1,28 @@
 import { NextRequest } from "next/server";
 import { auth } from "../../../../../../auth";
 
+export async function GET(
+    req: NextRequest,
+    {params}: {params: Promise<{tableType: string}>}
+) {
+    const { tableType } = await params;
+
+    const session = await auth()
+    if (!session){
+        throw new Error("Not signed in")
+    }
+
+    // offset, limit, sort_by, descending and search are passed through
+    const res = await fetch(`${process.env.EXTERNAL_API}/api/users/tables/${tableType}?${req.nextUrl.searchParams}`, {
+        headers: {
+            "Accept": 'application/json',
+            "Authorization": `Bearer ${session.user.access_token}`
+        }
+    })
+
+    return res
+}
+
 export async function PUT(
     req: NextRequest,
     {params}: {params: Promise<{tableType: string}>}
@@ -75,10 +75,10 @@ export default function ResultsPanel() {
                 </Tabs>
             </Box>
             <CustomTabPanel value={value} index={0}>
-                <Table initialData={data['itemized']} accountOptions={data["options"]} tableType="itemized" updateRow={updateRow} />
+                <Table accountOptions={data["options"]} tableType="itemized" updateRow={updateRow} />
             </CustomTabPanel>
             <CustomTabPanel value={value} index={1}>
-                <Table initialData={data['summary']} accountOptions={data["options"]} tableType="summary" updateRow={updateRow} />
+                <Table accountOptions={data["options"]} tableType="summary" updateRow={updateRow} />
             </CustomTabPanel>
         </>
     )
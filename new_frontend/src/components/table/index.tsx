@@ -6,16 +6,15 @@ import {
     Column,
     RowData,
     PaginationState,
+    SortingState,
     flexRender,
     getCoreRowModel,
-    getPaginationRowModel,
-    getSortedRowModel,
     useReactTable,
     ColumnFiltersState,
-    getFilteredRowModel,
 } from "@tanstack/react-table";
 import { ItemizedRecord } from "@/lib/definitions";
 import { getColumns } from "@/lib/utils";
+import { useTablePage } from "@/lib/useRecords";
 
 declare module '@tanstack/react-table' {
     //allows us to define custom properties for our columns
@@ -31,40 +30,62 @@ declare module '@tanstack/react-table' {
 }
 
 export default function Table({
-    initialData,
     accountOptions,
     tableType,
     updateRow
 }: {
-    initialData: any[],
     accountOptions: any[],
     tableType: string,
     updateRow: any
 }) {
-    const [data, setData] = useState(initialData)
-    const [originalData, setOriginalData] = useState(initialData)
     const columns = useMemo(() => getColumns(tableType, accountOptions), [tableType, accountOptions])!
     const [editedRows, setEditedRows] = useState({});
     const [pagination, setPagination] = useState<PaginationState>({
         pageIndex: 0,
         pageSize: 10,
     })
-    // const [columnFilters, setColumnFilters] = useState<ColumnFiltersState>(
-    //     []
-    // );
+    const [sorting, setSorting] = useState<SortingState>([])
+    const [columnFilters, setColumnFilters] = useState<ColumnFiltersState>(
+        []
+    );
+    // the server sorts, searches (descriptions only) and pages the table
+    const search = columnFilters.find((filter) => filter.id === "description")?.value as string | undefined
+    const { rows, total } = useTablePage(tableType, {
+        ...pagination,
+        sortBy: sorting[0]?.id,
+        descending: sorting[0]?.desc,
+        search,
+    })
+    const [data, setData] = useState<any[]>(rows)
+    const [originalData, setOriginalData] = useState<any[]>(rows)
+
+    useEffect(() => {
+        setData(rows)
+        setOriginalData(rows)
+    }, [rows])
+
+    // a new sort order or search starts from the first page
+    useEffect(() => {
+        setPagination((old) => ({ ...old, pageIndex: 0 }))
+    }, [sorting, search])
 
     const table = useReactTable({
         data,
         columns,
         getCoreRowModel: getCoreRowModel(),
-        getSortedRowModel: getSortedRowModel(),
-        getFilteredRowModel: getFilteredRowModel(),
-        getPaginationRowModel: getPaginationRowModel(),
+        manualPagination: true,
+        manualSorting: true,
+        manualFiltering: true,
+        rowCount: total,
         onPaginationChange: setPagination,
+        onSortingChange: setSorting,
+        onColumnFiltersChange: setColumnFilters,
         autoResetPageIndex: false,
 
         state: {
             pagination,
+            sorting,
+            columnFilters,
         },
 
         meta: {
@@ -23,6 +23,7 @@ export type User = {
 }
 
 export type ItemizedRecord = {
+    row_id: number;
     date: string;
     number: string;
     payee: string;
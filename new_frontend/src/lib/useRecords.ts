@@ -1,8 +1,20 @@
 import useSWR, { mutate } from "swr";
 import { ItemizedRecord, SummaryRecord } from "./definitions";
 
-async function fetcher() {
-  const req = await fetch('/api/data/tables')
+// the rows are fetched a page at a time; /api/data/tables only has the
+// account options, the template and the row totals
+export type TableQuery = {
+  pageIndex: number;
+  pageSize: number;
+  sortBy?: string;
+  descending?: boolean;
+  search?: string;
+}
+
+const NO_ROWS: any[] = []
+
+async function fetcher(url: string) {
+  const req = await fetch(url)
 
   if (!req.ok) {
     throw new Error("Couldn't fetch data")
@@ -55,19 +67,46 @@ async function updateRequest(
   return res
 }
 
+export function tablePageKey(tableType: string, query: TableQuery) {
+  const params = new URLSearchParams({
+    offset: String(query.pageIndex * query.pageSize),
+    limit: String(query.pageSize),
+  })
+  if (query.sortBy) {
+    params.set("sort_by", query.sortBy)
+    params.set("descending", String(query.descending ?? false))
+  }
+  if (query.search) {
+    params.set("search", query.search)
+  }
+
+  return `/api/data/tables/${tableType}?${params}`
+}
+
+export function useTablePage(tableType: string, query: TableQuery) {
+  const { data, error, isLoading } = useSWR(tablePageKey(tableType, query), fetcher, { keepPreviousData: true });
+
+  return {
+    rows: data?.rows ?? NO_ROWS,
+    total: data?.total ?? 0,
+    isError: error,
+    isLoading: isLoading
+  };
+}
+
 export default function useRecords() {
   const { data, error, isLoading } = useSWR('/api/data/tables', fetcher);
 
   const updateRow = async (id: number, data: any, tableType: string) => {
-    console.log('DATAFF: ' + JSON.stringify(data))
-    updateRequest(id, data, tableType)
-    mutate('/api/data/tables')
+    await updateRequest(id, data, tableType)
+    // an edit can change any cached page of either table, and the summary total
+    mutate((key) => typeof key === "string" && key.startsWith('/api/data/tables'))
   }
 
   return {
-    data: data ?? [],
+    data: data ?? {},
     isError: error,
     isLoading: isLoading,
     updateRow
   };
-}
\ No newline at end of file
+}
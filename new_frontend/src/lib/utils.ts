@@ -10,27 +10,33 @@ export function cn(...inputs: ClassValue[]) {
   return twMerge(clsx(inputs))
 }
 
+// the server searches descriptions only, so only that column gets a filter
 export function getColumns(tableType: string, selectOptions: any[]) {
   let columns: any = []
   if (tableType == "itemized") {
     const columnHelper = createColumnHelper<ItemizedRecord>()
     columns = [
       columnHelper.accessor('date', {
+        enableColumnFilter: false,
         cell: TableCell,
       }),
       columnHelper.accessor('number', {
+        enableColumnFilter: false,
         cell: TableCell,
       }),
       columnHelper.accessor('payee', {
+        enableColumnFilter: false,
         cell: TableCell,
       }),
       columnHelper.accessor('description', {
         cell: TableCell,
       }),
       columnHelper.accessor('amount', {
+        enableColumnFilter: false,
        cell: TableCell,
       }),
       columnHelper.accessor('account', {
+        enableColumnFilter: false,
         cell: TableCell,
       }),
       columnHelper.display({
@@ -50,12 +56,14 @@ export function getColumns(tableType: string, selectOptions: any[]) {
         }
       }),
       columnHelper.accessor('instances', {
+        enableColumnFilter: false,
         cell: TableCell,
         meta: {
           type: "number",
         }
       }),
       columnHelper.accessor('account', {
+        enableColumnFilter: false,
         cell: TableCell,
         meta: {
           type: "select",